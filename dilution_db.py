@@ -14,6 +14,7 @@ import pandas as pd
 import logging
 from posixpath import join as urljoin
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from requests.exceptions import HTTPError
 from scipy.fftpack import idct
 from tqdm import tqdm
@@ -28,9 +29,15 @@ from main.data_aggregation.fact_extractor import get_cash_and_equivalents, get_o
 from main.parser.filings_base import Filing
 import main.parser.extractors as extractors
 import main.parser.parsers as parsers
+from main.parser.filing_cache import ParsedFilingCache
+from main.parser.filing_nlp import SpacyFilingTextSearch
+from main.parser.filing_nlp_cache import DocCache
+from main.parser.filing_nlp_doc import FilingDoc
+from main.parser.effect_reader import EffectRecord, iter_effect_records
+from main.parser.regex_guard import RegexBudgetExceeded, set_default_budget
 from main.configs import cnf, GlobalConfig
 from _constants import FORM_TYPES_INFO, EDGAR_BASE_ARCHIVE_URL
-from main.services.messagebus import MessageBus
+from main.services.messagebus import MessageBus, RecordingMessageBus
 from main.domain import commands
 
 # from main.adapters.repository import AbstractRepository
@@ -320,6 +327,53 @@ class DilutionDB:
             else:
                 co.commit()
 
+    def create_effect_registrations(self, connection: Connection, records: list[EffectRecord]) -> int:
+        '''
+        insert EFFECT records into effect_registrations in one batch and add them
+        to the filing_parse_history of their company.
+
+        records of companies not in the database or without a form are skipped,
+        missing form_types are created with category "unspecified".
+
+        Args:
+            connection: connection from the database connection pool
+            records: see main.parser.effect_reader
+
+        Returns:
+            number of records written
+        '''
+        records = [r for r in records if r.for_form is not None]
+        if records == []:
+            return 0
+        company_ids = {
+            row["cik"]: row["id"] for row in connection.execute(
+                "SELECT id, cik FROM companies WHERE cik = ANY(%s)",
+                [list(set(r.cik for r in records))]
+            )
+        }
+        for record in records:
+            if record.cik not in company_ids:
+                logger.debug(f"no company with cik({record.cik}) for EFFECT notice: {record.path}")
+        records = [r for r in records if r.cik in company_ids]
+        date_parsed = datetime.now().date()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO form_types(form_type, category) VALUES(%s, %s) ON CONFLICT DO NOTHING",
+                [[form_type, "unspecified"] for form_type in set(r.for_form for r in records)]
+            )
+            cursor.executemany(
+                "INSERT INTO effect_registrations(company_id, accn, form_type, file_number, effective_date) VALUES(%s, %s, %s, %s, %s) ON CONFLICT ON CONSTRAINT unique_accn DO NOTHING",
+                [
+                    [company_ids[r.cik], _ensure_no_dash_accn(r.accession_number), r.for_form, r.file_number, r.effective_date]
+                    for r in records
+                ]
+            )
+            cursor.executemany(
+                "INSERT INTO filing_parse_history(company_id, accession_number, date_parsed) VALUES(%s, %s, %s) ON CONFLICT ON CONSTRAINT unique_co_accn DO UPDATE SET date_parsed = EXCLUDED.date_parsed",
+                [[company_ids[r.cik], _ensure_no_dash_accn(r.accession_number), date_parsed] for r in records]
+            )
+        return len(records)
+
     def create_cash_operating(self, c: Connection, company_id, from_date, to_date, amount):
         try:
             c.execute(
@@ -1014,6 +1068,15 @@ class DilutionDBUtil:
         self.logger_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
         self.logger_handler.setLevel(logging.INFO)
         self.logger.addHandler(self.logger_handler)
+        parsers.parser_factory.set_backend(db.config.APP_CONFIG.HTML_PARSE_BACKEND)
+        set_default_budget(db.config.APP_CONFIG.REGEX_BUDGET_SECONDS)
+        parsers.filing_factory.set_max_filing_memory(_get_max_filing_memory(db.config.APP_CONFIG.MAX_FILING_MEMORY_MB))
+        # accession_number: reason of the filings that were skipped because a pattern exceeded its budget
+        self.quarantined_filings = {}
+        if db.config.PARSED_FILING_CACHE_PATH is not None:
+            parsers.filing_factory.set_cache(ParsedFilingCache(db.config.PARSED_FILING_CACHE_PATH))
+        if db.config.NLP_DOC_CACHE_PATH is not None:
+            SpacyFilingTextSearch.set_doc_cache(DocCache(db.config.NLP_DOC_CACHE_PATH))
     
     def _init_logging_file(self):
         if Path(self.logging_file).exists():
@@ -1035,7 +1098,7 @@ class DilutionDBUtil:
         self.db.create_sics()
         self.db.create_form_types()
 
-    def parse_filings(self, connection: Connection, ticker: str, forms: Optional[list[str]]=None):
+    def parse_filings(self, connection: Connection, ticker: str, forms: Optional[list[str]]=None, workers: Optional[int]=None):
         
         '''
         parses the unparsed local filings of a ticker.
@@ -1045,9 +1108,15 @@ class DilutionDBUtil:
             ticker: symbol associated with a company
             forms: what form types to parse, defaults to None (uses the tracked_forms variable of the supplied DilutionDB list)
                    Can be supplied with 'all' to try and parse all filings regardless of form_type
+            workers: amount of worker processes to parse and extract the filings with,
+                     defaults to None (uses APP_CONFIG.PARSE_FILINGS_WORKERS).
+                     see _parse_filings_in_workers for the differences to parsing
+                     in this process.
         '''
         if forms is None:
             forms = set(self.db.tracked_forms)
+        if workers is None:
+            workers = self.db.config.APP_CONFIG.PARSE_FILINGS_WORKERS
         company = self.db.read_company_by_symbol(ticker)
         if company != []:
             company = company[0]
@@ -1068,23 +1137,128 @@ class DilutionDBUtil:
         unparsed_filings = self.get_unparsed_filings(id, cik)
         logger.info(f"found {len(unparsed_filings)} unparsed filings.")
         logger.info(f"only allowing forms: {forms}")
-        for idx, unparsed in enumerate(unparsed_filings):
+        if workers > 1:
+            unparsed_filings = [
+                unparsed for unparsed in unparsed_filings
+                if (unparsed["form_type"] in forms) or (forms == "all")
+            ]
+            self._parse_filings_in_workers(ticker, cik, unparsed_filings, workers)
+            return
+        unparsed_filings = [
+            unparsed for unparsed in unparsed_filings
+            if (unparsed["form_type"] in forms) or (forms == "all")
+        ]
+        for idx, (unparsed, filings, filing_docs) in enumerate(self._iter_created_filings(cik, unparsed_filings)):
             logger.debug(f"currently on unparsed_filing number {idx}")
-            form_type, file_number, file_path, filing_date, accession_number = unparsed.values()
-            if (form_type in forms) or (forms == "all"):
+            self._parse_created_filings(ticker, unparsed, filings, filing_docs)
+
+    def _iter_created_filings(self, cik: str, unparsed_filings: list[dict]):
+        '''
+        create the filings of the unparsed files and the FilingDocs their extractors take.
+
+        the files are created APP_CONFIG.NLP_BATCH_FILINGS at a time and the texts of
+        their filings are processed together, see _get_filing_docs. Creating and
+        processing doesnt depend on the company, only the extraction does.
+
+        Yields:
+            (unparsed, filings, filing_docs) in order of unparsed_filings, filings is []
+            if the file couldnt be parsed, filing_docs maps id(filing) to its FilingDoc.
+        '''
+        batch_size = self.db.config.APP_CONFIG.NLP_BATCH_FILINGS
+        for start in range(0, len(unparsed_filings), batch_size):
+            created = []
+            for unparsed in unparsed_filings[start:start + batch_size]:
+                form_type, file_number, file_path, filing_date, accession_number = unparsed.values()
                 logger.debug(f"values passed to _create_filing: {form_type, accession_number, file_path, filing_date, cik, file_number}")
                 try:
                     filings = self._create_filing(form_type, accession_number, file_path, filing_date, cik, file_number)
+                except RegexBudgetExceeded as e:
+                    self._quarantine_filing(accession_number, file_path, e)
+                    filings = []
                 except ValueError as e:
                     logger.error(f"_create_filing ran into a ValueError: {e}", exc_info=True)
+                    filings = []
                 else:
                     logger.debug(f"_create_filing created: {len(filings)} filings out of one file.")
-                    for filing in filings:
-                        with self.db.uow as uow:
-                            company = uow.company.get(ticker)
-                            uow.session.expunge(company)
-                        company = self._parse_filing(filing, company)
+                created.append((unparsed, filings))
+            filing_docs = _get_filing_docs([filing for _, filings in created for filing in filings])
+            for unparsed, filings in created:
+                yield unparsed, filings, filing_docs
+
+    def _parse_created_filings(self, ticker: str, unparsed: dict, filings: list[Filing], filing_docs: dict):
+        '''extract the values of the filings of one file against the current state of the company.'''
+        if filings == []:
+            return
+        for filing in filings:
+            with self.db.uow as uow:
+                company = uow.company.get(ticker)
+                uow.session.expunge(company)
+            company = self._parse_filing(filing, company, filing_doc=filing_docs.get(id(filing)))
+        # cache the sections extracted by the extractors
+        parsers.filing_factory.update_cache(filings, unparsed["form_type"], Path(unparsed["file_path"]).suffix, unparsed["file_path"])
+
 
+    def _parse_filings_in_workers(self, ticker: str, cik: str, unparsed_filings: list[dict], workers: int):
+        '''
+        create the filings and extract their values in a pool of worker processes.
+
+        the workers extract against a snapshot of the company taken before this
+        call and record the commands instead of handling them, so they only get
+        the filings whose extractor doesnt read state of the company (see
+        AbstractFilingExtractor.reads_company). The filings are handled here in
+        order of the filing_date: the recorded commands of a worker filing are
+        handled when it is reached, the other filings (S-3, EFFECT) are created
+        (see _iter_created_filings) and extracted in this process against the
+        company reloaded after the commands of the filings filed before them
+        were handled.
+        '''
+        with self.db.uow as uow:
+            company = uow.company.get(ticker)
+            uow.session.expunge(company)
+        unparsed_filings = sorted(unparsed_filings, key=lambda x: x["filing_date"])
+        tasks = []
+        for unparsed in unparsed_filings:
+            form_type, file_number, file_path, filing_date, accession_number = unparsed.values()
+            tasks.append((form_type, accession_number, file_path, filing_date, cik, file_number, company))
+        in_worker = [
+            not extractors.extractor_factory.reads_company(task[0], Path(task[2]).suffix)
+            for task in tasks
+        ]
+        created_in_parent = self._iter_created_filings(
+            cik, [unparsed for unparsed, run_in_worker in zip(unparsed_filings, in_worker) if not run_in_worker]
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_parse_filings_worker,
+            initargs=(
+                parsers.parser_factory.backend,
+                self.db.config.PARSED_FILING_CACHE_PATH,
+                self.db.config.APP_CONFIG.REGEX_BUDGET_SECONDS,
+                parsers.filing_factory.max_filing_memory,
+                self.db.config.NLP_DOC_CACHE_PATH
+            )
+        ) as executor:
+            # map keeps the order of tasks, so commands are handled by filing_date
+            worker_results = executor.map(
+                _create_and_extract_filings,
+                [task for task, run_in_worker in zip(tasks, in_worker) if run_in_worker]
+            )
+            for task, run_in_worker in zip(tasks, in_worker):
+                form_type, accession_number, file_path, filing_date, cik, file_number, _ = task
+                if not run_in_worker:
+                    self._parse_created_filings(ticker, *next(created_in_parent))
+                    continue
+                for recorded_commands, error in next(worker_results):
+                    if isinstance(error, RegexBudgetExceeded):
+                        self._quarantine_filing(accession_number, file_path, error)
+                        continue
+                    if error is not None:
+                        logger.error(f"parsing filing with accession_number: {accession_number} failed in worker: {error}")
+                        continue
+                    for command in recorded_commands:
+                        self.db.bus.handle(command)
+                    with self.db.conn() as c:
+                        self.db._update_filing_parse_history(c, company.id, accession_number, datetime.now().date())
 
     def _create_filing(self,
         form_type: str,
@@ -1094,23 +1268,12 @@ class DilutionDBUtil:
         cik: str = None,
         file_number: str = None,
         ) -> list[Filing]:
-        extension = Path(path).suffix
-        filings = parsers.filing_factory.create_filing(
-            extension=extension,
-            path=path,
-            filing_date=filing_date,
-            accession_number=accession_number,
-            cik=cik,
-            file_number=file_number,
-            form_type=form_type)
-        if isinstance(filings, list):
-            return filings
-        else:
-            return [filings]
+        return _create_filings(form_type, accession_number, path, filing_date, cik, file_number)
 
     def _parse_filing(self, 
         filing: Filing,
-        company: model.Company
+        company: model.Company,
+        filing_doc: Optional[FilingDoc] = None
         ) -> list[list[commands.Command]]:
         try:
             extractor: extractors.AbstractFilingExtractor = extractors.extractor_factory.get_extractor(filing.form_type, filing.extension)
@@ -1118,7 +1281,9 @@ class DilutionDBUtil:
             logger.info(f"excepted ValueError in _parse_filing: {e}", exc_info=True)
             return []
         try:
-            extractor_return = extractor.extract_form_values(filing, company, self.db.bus)
+            extractor_return = _extract_form_values(extractor, filing, company, self.db.bus, filing_doc)
+        except RegexBudgetExceeded as e:
+            self._quarantine_filing(filing.accession_number, filing.path, e)
         except Exception as e:
             logger.error(f"encountered error during extraction: {e}", exc_info=True)
         else:
@@ -1126,6 +1291,37 @@ class DilutionDBUtil:
                 self.db._update_filing_parse_history(c, company.id, filing.accession_number, datetime.now().date())
             return extractor_return
 
+    def _quarantine_filing(self, accession_number: str, path: str, error: RegexBudgetExceeded):
+        '''
+        skip a filing a parser pattern exceeded its budget on.
+
+        the filing isnt added to the parse history, so it is tried again on the next run.
+        '''
+        self.quarantined_filings[accession_number] = str(error)
+        self.logger.error(f"quarantined filing with accession_number: {accession_number}, path: {path}. {error}")
+
+    def bulk_parse_effect_filings(self, paths: list[str], batch_size: int = 1000) -> int:
+        '''
+        read many EFFECT primary_doc.xml files and write them to effect_registrations
+        in batches of batch_size, without creating filings or going through the message bus.
+
+        Returns:
+            number of EFFECT notices written
+        '''
+        written = 0
+        batch = []
+        for record in iter_effect_records(paths):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                with self.db.conn() as c:
+                    written += self.db.create_effect_registrations(c, batch)
+                batch = []
+        if batch != []:
+            with self.db.conn() as c:
+                written += self.db.create_effect_registrations(c, batch)
+        self.logger.info(f"wrote {written} EFFECT notices to effect_registrations")
+        return written
+
     def reparse_local_filings(self, symbol: str, form: str):
         with self.db.uow as uow:
             company = uow.company.get(symbol=symbol, lazy=False)
@@ -1137,6 +1333,8 @@ class DilutionDBUtil:
             if form == form_type:
                 try:
                     filings = self._create_filing(form_type, accession_number, file_path, filing_date, cik, file_number)
+                except RegexBudgetExceeded as e:
+                    self._quarantine_filing(accession_number, file_path, e)
                 except ValueError as e:
                     logger.error(f"_create_filing ran into a ValueError: {e}", exc_info=True)
                 else:
@@ -1444,6 +1642,115 @@ def _ensure_no_dash_accn(accn: str):
     else:
         return accn.replace("-", "")
 
+def _create_filings(
+    form_type: str,
+    accession_number: str,
+    path: str,
+    filing_date: str = None,
+    cik: str = None,
+    file_number: str = None,
+    ) -> list[Filing]:
+    extension = Path(path).suffix
+    filings = parsers.filing_factory.create_filing(
+        extension=extension,
+        path=path,
+        filing_date=filing_date,
+        accession_number=accession_number,
+        cik=cik,
+        file_number=file_number,
+        form_type=form_type)
+    if isinstance(filings, list):
+        return filings
+    else:
+        return [filings]
+
+def _get_filing_docs(filings: list[Filing]) -> dict:
+    '''
+    get the FilingDocs of the filings whose extractor takes one (see AbstractFilingExtractor.filing_doc_profile),
+    the texts of the filings of an extractor are processed in one NLPBatch.
+
+    Returns:
+        id(filing): FilingDoc, filings without a FilingDoc are extracted as before.
+    '''
+    # (form_type, extension): (extractor, filings)
+    grouped = {}
+    for filing in filings:
+        key = (filing.form_type, filing.extension)
+        try:
+            if key not in grouped:
+                grouped[key] = (extractors.extractor_factory.get_extractor(*key), [])
+            extractor, group = grouped[key]
+            if extractor.needs_filing_doc(filing):
+                group.append(filing)
+        except Exception as e:
+            # the extraction runs into the same error and reports it
+            logger.debug(f"not batching the text of filing {filing.path}: {e}")
+    filing_docs = {}
+    for extractor, group in grouped.values():
+        if group == []:
+            continue
+        try:
+            docs = extractor.get_filing_docs(group, profile=extractor.filing_doc_profile)
+        except Exception as e:
+            logger.error(f"couldnt process the texts of {len(group)} filings in one batch, processing them one at a time: {e}", exc_info=True)
+            continue
+        filing_docs.update((id(filing), doc) for filing, doc in zip(group, docs))
+    return filing_docs
+
+def _extract_form_values(extractor: extractors.AbstractFilingExtractor, filing: Filing, company: model.Company, bus: MessageBus, filing_doc: Optional[FilingDoc] = None):
+    if filing_doc is None:
+        return extractor.extract_form_values(filing, company, bus)
+    return extractor.extract_form_values(filing, company, bus, filing_doc=filing_doc)
+
+def _get_max_filing_memory(max_filing_memory_mb: Optional[int]) -> Optional[int]:
+    return None if max_filing_memory_mb is None else max_filing_memory_mb * 1024 * 1024
+
+def _init_parse_filings_worker(backend: str, parsed_filing_cache_path: Optional[str], regex_budget: Optional[float], max_filing_memory: Optional[int], nlp_doc_cache_path: Optional[str] = None):
+    '''set up the parser factories of a worker process of DilutionDBUtil.parse_filings'''
+    parsers.parser_factory.set_backend(backend)
+    set_default_budget(regex_budget)
+    parsers.filing_factory.set_max_filing_memory(max_filing_memory)
+    if parsed_filing_cache_path is not None:
+        parsers.filing_factory.set_cache(ParsedFilingCache(parsed_filing_cache_path))
+    if nlp_doc_cache_path is not None:
+        SpacyFilingTextSearch.set_doc_cache(DocCache(nlp_doc_cache_path))
+
+def _create_and_extract_filings(task: tuple) -> list[tuple[list[commands.Command], Optional[str | RegexBudgetExceeded]]]:
+    '''
+    create the filings of one file and extract their values in a worker process.
+
+    Returns:
+        a list with a (recorded_commands, error) tuple per created filing,
+        error is None if the extraction succeeded, the RegexBudgetExceeded if
+        a pattern exceeded its budget (the filing is quarantined) and the repr
+        of the exception otherwise.
+    '''
+    form_type, accession_number, path, filing_date, cik, file_number, company = task
+    try:
+        filings = _create_filings(form_type, accession_number, path, filing_date, cik, file_number)
+        extractor: extractors.AbstractFilingExtractor = extractors.extractor_factory.get_extractor(form_type, Path(path).suffix)
+    except RegexBudgetExceeded as e:
+        return [([], e)]
+    except Exception as e:
+        logger.error(f"couldnt create filing or get extractor for {path} in worker: {e}", exc_info=True)
+        return [([], repr(e))]
+    results = []
+    filing_docs = _get_filing_docs(filings)
+    for filing in filings:
+        bus = RecordingMessageBus()
+        try:
+            _extract_form_values(extractor, filing, company, bus, filing_docs.get(id(filing)))
+        except RegexBudgetExceeded as e:
+            results.append(([], e))
+        except Exception as e:
+            logger.error(f"encountered error during extraction: {e}", exc_info=True)
+            results.append(([], repr(e)))
+        else:
+            results.append((bus.collect_command_history(), None))
+    # cache the sections extracted by the extractor
+    parsers.filing_factory.update_cache(filings, form_type, Path(path).suffix, path)
+    return results
+
     # def create_tracked_companies(self):
     #     base_path = config["polygon"]["overview_files_path"]
     #     for ticker in self.tracked_tickers:
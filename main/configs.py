@@ -24,6 +24,25 @@ class AppConfig(BaseModel):
         "IMPP",
     ]
 
+    # parser used to build the soup of .htm filings, see parsers.HTML_PARSE_BACKENDS
+    HTML_PARSE_BACKEND: str = "html5lib"
+
+    # worker processes used by DilutionDBUtil.parse_filings, 1 parses in the calling process
+    PARSE_FILINGS_WORKERS: int = 1
+
+    # files DilutionDBUtil.parse_filings creates at a time, the texts of their filings
+    # are processed by the nlp pipeline in one batch (see parser.filing_nlp_batch)
+    NLP_BATCH_FILINGS: int = 8
+
+    # seconds a parser pattern may run on one filing before the filing is quarantined,
+    # None disables the budget, see parser.regex_guard
+    REGEX_BUDGET_SECONDS: Optional[float] = 10.0
+
+    # memory in MB parsing a single .htm filing may take, larger filings split by their
+    # table of contents alone (not S-3, 8-K, SC 13D/G) are streamed section by section
+    # (see parser.htm_stream), None parses every filing as a whole
+    MAX_FILING_MEMORY_MB: Optional[int] = None
+
 class GlobalConfig(BaseSettings):
     """Global configurations."""
 
@@ -57,6 +76,10 @@ class GlobalConfig(BaseSettings):
 
     DEFAULT_LOGGING_FILE: str or PathLike = None
     DOWNLOADER_ROOT_PATH: Optional[str] = None
+    # directory of the ParsedFilingCache, None disables caching of parsed filings
+    PARSED_FILING_CACHE_PATH: Optional[str] = None
+    # directory of the DocCache of the nlp pipeline, None disables caching of processed texts
+    NLP_DOC_CACHE_PATH: Optional[str] = None
     POLYGON_ROOT_PATH: Optional[str] = None
     POLYGON_OVERVIEW_FILES_PATH: Optional[str] = None
     POLYGON_API_KEY: Optional[str] = None
@@ -0,0 +1,96 @@
+import logging
+import re
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+'''
+Two stage matching of large patterns.
+
+Patterns like the 8-K date of report or item patterns are tried at every
+position of a filing by re.search/re.finditer, although they can only match
+close to a short literal like "date" or "item". AnchoredPattern first finds
+the positions of such an anchor with a cheap search and then only tries the
+pattern in the bounded window around each anchor, which gives the same
+matches as the pattern on its own.
+'''
+
+try:
+    from re import _parser as _re_parser
+except ImportError:  # python < 3.11
+    import sre_parse as _re_parser
+
+
+class AnchoredPattern:
+    """
+    Compiled pattern with an anchor every match of it contains.
+
+    Usage::
+
+            date_pattern = AnchoredPattern(COMPILED_DATE_OF_REPORT_PATTERN, "date")
+            match = date_pattern.search(filing)  # same as COMPILED_DATE_OF_REPORT_PATTERN.search(filing)
+
+    Args:
+        pattern: the compiled pattern. it shouldnt use anchors (^, $, \\b ..) or
+                 lookarounds, as the pattern is only matched within a window.
+        anchor: regex (eg a literal) matching inside every match of pattern. it is
+                compiled with the IGNORECASE flag of pattern.
+        anchor_at_start: True if every match of pattern starts with the anchor,
+                         only the positions of the anchors are tried then.
+    """
+
+    def __init__(self, pattern: re.Pattern, anchor: str, anchor_at_start: bool = False):
+        self.pattern = pattern
+        # lookahead, so overlapping anchors are all found
+        self.re_anchor = re.compile(f"(?=(?:{anchor}))", pattern.flags & re.I)
+        self.anchor_at_start = anchor_at_start
+        self.max_width = _get_max_width(pattern)
+
+    def search(self, string: str, pos: int = 0) -> re.Match | None:
+        """same as pattern.search(string, pos)"""
+        if self.max_width is None:
+            return self.pattern.search(string, pos)
+        # positions before next_pos were already tried
+        next_pos = pos
+        for anchor_match in self.re_anchor.finditer(string, pos):
+            anchor_pos = anchor_match.start()
+            if self.anchor_at_start:
+                first_pos = anchor_pos
+            else:
+                first_pos = max(anchor_pos - self.max_width, next_pos)
+            for match_pos in range(first_pos, anchor_pos + 1):
+                match = self.pattern.match(
+                    string, match_pos, min(match_pos + self.max_width, len(string))
+                )
+                if match is not None:
+                    return match
+            next_pos = anchor_pos + 1
+        return None
+
+    def finditer(self, string: str) -> Iterator[re.Match]:
+        """same as pattern.finditer(string)"""
+        if self.max_width is None:
+            yield from self.pattern.finditer(string)
+            return
+        pos = 0
+        while pos <= len(string):
+            match = self.search(string, pos)
+            if match is None:
+                return
+            yield match
+            pos = match.end()
+
+
+def _get_max_width(pattern: re.Pattern) -> int | None:
+    """
+    get the maximum length of a match of pattern, None if it is unbounded, it
+    can match the empty string or it couldnt be determined.
+    """
+    try:
+        min_width, max_width = _re_parser.parse(pattern.pattern, pattern.flags).getwidth()
+    except Exception as e:
+        logger.debug(f"couldnt determine the width of pattern: {e}")
+        return None
+    if (min_width == 0) or (max_width >= _re_parser.MAXREPEAT - 1):
+        return None
+    return max_width
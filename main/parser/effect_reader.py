@@ -0,0 +1,107 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+'''
+Batch reading of EFFECT notices.
+
+Creating a BaseFiling of an EFFECT primary_doc.xml parses the whole tree and
+searches it once per value. read_effect_record streams the file with
+iterparse instead and takes the values ParserEFFECT extracts (the form, the
+effective date, the file number and the cik) in one pass, stopping as soon
+as all of them were found. iter_effect_records does this for many files,
+eg. to write them to effect_registrations with
+DilutionDB.create_effect_registrations.
+'''
+
+EFFECT_VALUE_TAGS = {
+    "finalEffectivenessDispDate": "effective_date",
+    "fileNumber": "file_number",
+    "cik": "cik",
+}
+# children of effectiveData the form is taken from, in order of preference
+EFFECT_FORM_TAGS = ("form", "submissionType")
+
+
+@dataclass(slots=True)
+class EffectRecord:
+    """values of an EFFECT notice, named like the content_dict of ParserEFFECT."""
+    accession_number: str
+    for_form: str | None
+    effective_date: str | None
+    file_number: str | None
+    cik: str | None
+    path: str
+
+
+def read_effect_record(path: str, accession_number: str = None) -> EffectRecord | None:
+    """
+    read the values of the EFFECT notice at path in one streaming pass.
+
+    Args:
+        path: path of the primary_doc.xml.
+        accession_number: no dash accession number of the notice, defaults to
+                          the name of the folder of the file (the download layout).
+
+    Returns:
+        EffectRecord or None if the file couldnt be parsed or one of the values
+        is missing (the same files ParserEFFECT.split_into_sections returns [] for).
+    """
+    if accession_number is None:
+        accession_number = Path(path).parent.name
+    values = {}
+    form_values = {}
+    tags = []
+    effective_data_seen = False
+    in_effective_data = False
+    try:
+        for event, element in ElementTree.iterparse(path, events=("start", "end")):
+            if event == "start":
+                tags.append(element.tag)
+                if (element.tag == "effectiveData") and not effective_data_seen:
+                    effective_data_seen = True
+                    in_effective_data = True
+                continue
+            tags.pop()
+            if element.tag in EFFECT_VALUE_TAGS:
+                values.setdefault(EFFECT_VALUE_TAGS[element.tag], element.text)
+            elif (
+                in_effective_data
+                and (element.tag in EFFECT_FORM_TAGS)
+                and (tags[-1] == "effectiveData")
+            ):
+                form_values.setdefault(element.tag, element.text)
+            elif in_effective_data and (element.tag == "effectiveData"):
+                in_effective_data = False
+            element.clear()
+            if effective_data_seen and not in_effective_data and len(values) == len(EFFECT_VALUE_TAGS):
+                break
+    except ElementTree.ParseError as e:
+        logger.warning(f"couldnt parse EFFECT notice: {path}. {e}")
+        return None
+    if not effective_data_seen or (len(values) != len(EFFECT_VALUE_TAGS)):
+        logger.warning(f"EFFECT notice is missing values, found: {values} in {path}")
+        return None
+    for_form = None
+    for tag in EFFECT_FORM_TAGS:
+        if tag in form_values:
+            for_form = form_values[tag]
+            break
+    return EffectRecord(
+        accession_number=accession_number,
+        for_form=for_form,
+        path=str(path),
+        **values,
+    )
+
+
+def iter_effect_records(paths: Iterable[str]) -> Iterator[EffectRecord]:
+    """read the EFFECT notices at paths one after another, skipping those without a record."""
+    for path in paths:
+        record = read_effect_record(path)
+        if record is not None:
+            yield record
@@ -16,6 +16,8 @@ from main.domain import model, commands
 from main.domain.model import CommonShare, DebtSecurity, PreferredShare, Security, SecurityType, SecurityTypeFactory, Warrant, Option
 from main.services.messagebus import Message, MessageBus
 from .filing_nlp import SpacyFilingTextSearch, MatchFormater, get_secu_key, UnclearInformationExtraction
+from .filing_nlp_doc import FilingDoc
+from .filing_nlp_batch import NLPBatch, DEFAULT_BATCH_SIZE
 
 logger = logging.getLogger(__name__)
 security_type_factory = SecurityTypeFactory()
@@ -25,26 +27,65 @@ class UnhandledClassificationError(Exception):
 
 
 class AbstractFilingExtractor(ABC):
+    # True if extract_form_values reads state of the company (shelfs, offerings, securities ..)
+    # the commands of earlier filings add, beyond its cik and symbol
+    reads_company = False
+    # pipeline profile (see filing_nlp.PIPELINE_PROFILES) of the FilingDoc extract_form_values
+    # takes as filing_doc, None if it doesnt take one
+    filing_doc_profile = None
+
     def extract_form_values(self, filing: Filing, company: model.Company, bus: MessageBus):
         """extracts values and issues Command to MessageBus"""
         pass
 
+    def needs_filing_doc(self, filing: Filing) -> bool:
+        """check if extract_form_values processes the text of filing, so its FilingDoc can be batched with others."""
+        return self.filing_doc_profile is not None
+
 
 
 class BaseHTMExtractor:
-    # maybe add get_doc(text_search) to FilingSection with a doc instance variable, so i dont make a doc more than once during extraction? 
     def __init__(self):
         self.spacy_text_search = SpacyFilingTextSearch()
         self.formater = MatchFormater()
     
-    def get_secu_key(self, security: Span|str) -> str:
+    def get_secu_key(self, security: Span|Doc|str) -> str:
         if isinstance(security, str):
-            doc = self.spacy_text_search.nlp(security)
-            security = doc[0:]
+            security = self.spacy_text_search.nlp(security)
+        if isinstance(security, Doc):
+            security = security[0:]
         if isinstance(security, Span):
             return get_secu_key(security)
         else:
             raise TypeError(f"BaseHTMExtractor.get_secu_key is expecting type:Span got:{type(security)}")
+
+    def get_secu_keys(self, securities: list[str], batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1) -> list[str]:
+        '''get the secu keys of many security names, processing the names in one NLPBatch.'''
+        batch = NLPBatch(self.spacy_text_search.nlp, batch_size=batch_size, n_process=n_process)
+        for security in securities:
+            batch.add(security, self.get_secu_key)
+        return batch.run()
+
+    def get_filing_docs(self, filings: list[Filing], profile: str="full", batch_size: int=DEFAULT_BATCH_SIZE, n_process: int=1) -> list[FilingDoc]:
+        '''
+        get the FilingDocs of filings processed with profile, processing their texts in one NLPBatch.
+
+        pass them to extract_form_values as filing_doc to extract many filings
+        without processing them one at a time.
+        '''
+        with self.spacy_text_search.select_profile(profile) as nlp:
+            batch = NLPBatch(nlp, batch_size=batch_size, n_process=n_process, doc_cache=self.spacy_text_search.doc_cache)
+            for filing in filings:
+                batch.add(filing.get_text_only(), lambda doc, filing: FilingDoc(nlp, filing, doc=doc), filing)
+            return batch.run()
+
+    def get_filing_doc(self, filing: Filing, profile: str = "full") -> FilingDoc:
+        '''get the FilingDoc of filing processed with profile, from the doc cache of spacy_text_search if it is set.'''
+        return FilingDoc(
+            self.spacy_text_search.nlp,
+            filing,
+            doc=self.spacy_text_search.get_doc(filing.get_text_only(), profile=profile),
+        )
     
     def get_mentioned_secus(self, doc: Doc, secus: Optional[Dict]=None) -> Dict:
         if secus is None:
@@ -310,34 +351,59 @@ class BaseHTMExtractor:
         logger.debug("get_secu_conversion not implemented")
         pass
     
-    def doc_from_section(self, section: FilingSection) -> Doc:
+    def doc_from_section(self, section: FilingSection, filing_doc: FilingDoc = None, profile: str = "full") -> Doc:
+        '''
+        get the doc of section, sliced from filing_doc if given instead of processing
+        the section again with the components of profile.
+        '''
         # TODO: implement to use SECU objects
-        return self.spacy_text_search.nlp(section.text_only)
+        if filing_doc is not None:
+            return filing_doc.get_section_doc(section)
+        return self.spacy_text_search.get_doc(section.text_only, profile=profile)
 
-    def extract_outstanding_shares(self, filing: Filing) -> list[model.SecurityOutstanding]|NoneType:
+    def extract_outstanding_shares(self, filing: Filing, doc: Doc=None) -> list[model.SecurityOutstanding]|NoneType:
         # TODO: adjust to use SECU objects
+        if doc is not None:
+            return self.extract_outstanding_shares_from_doc(doc)
         text = filing.get_text_only()
         if text is None:
             logger.debug(filing)
             return None
-        values = self.spacy_text_search.match_outstanding_shares(text)
+        return self.extract_outstanding_shares_from_doc(text)
+
+    def extract_outstanding_shares_from_doc(self, doc: Doc|str) -> list[model.SecurityOutstanding]:
+        values = self.spacy_text_search.match_outstanding_shares(doc)
         return [model.SecurityOutstanding(v["amount"], v["date"]) for v in values]
 
 class HTMS1Extractor(BaseHTMExtractor, AbstractFilingExtractor):
     # TODO: rework with SECU objects in mind
-    def extract_form_values(self, filing: Filing):
-        return [self.extract_outstanding_shares(filing)]
+    def extract_form_values(self, filing: Filing, filing_doc: FilingDoc=None):
+        return [self.extract_outstanding_shares(filing, doc=filing_doc.doc if filing_doc is not None else None)]
 
 class HTMS3Extractor(BaseHTMExtractor, AbstractFilingExtractor):
+    # handle_ATM needs the shelf of the filing and the securities added before
+    reads_company = True
+    # pipeline profile (see filing_nlp.PIPELINE_PROFILES) of the docs each step processes
+    step_profiles = {
+        "classify_s3": "classify",
+        "extract_securities": "full",
+        "extract_securities_conversion_attributes": "full",
+    }
+    filing_doc_profile = step_profiles["extract_securities"]
+
     # TODO: rework to with SECU objects in mind
-    def extract_form_values(self, filing: Filing, company: model.Company, bus: MessageBus):
-        complete_doc = self.spacy_text_search.nlp(filing.get_text_only())
+    def extract_form_values(self, filing: Filing, company: model.Company, bus: MessageBus, filing_doc: FilingDoc=None):
+        # without a processed filing classify first, so unclassifiable filings never run the full pipeline
         try:
-            form_case = self.classify_s3(filing)
+            form_case = self.classify_s3(filing, filing_doc=filing_doc)
         except AttributeError as e:
             logger.error(f"excepted AttributeError in classify_s3 for filing({filing.path}) e: {e}", exc_info=True)
             return company
-        cover_page_doc = self.doc_from_section(filing.get_section(re.compile("cover page")))
+        # process the filing once, the docs of the sections are slices of it
+        if filing_doc is None:
+            filing_doc = self.get_filing_doc(filing, profile=self.step_profiles["extract_securities"])
+        complete_doc = filing_doc.doc
+        cover_page_doc = self.doc_from_section(filing.get_section_by_role("cover_page"), filing_doc=filing_doc)
         # self.extract_securities(filing, company, bus, cover_page_doc)
         securities = self.extract_securities(filing, company, bus, complete_doc)
         logger.info(f"found {len(securities)} securities.")
@@ -357,6 +423,10 @@ class HTMS3Extractor(BaseHTMExtractor, AbstractFilingExtractor):
             self.handle_ATM(filing, company, bus, cover_page_doc, is_preliminary=form_case["is_preliminary"])
         return company
 
+    def needs_filing_doc(self, filing: Filing) -> bool:
+        # the structural check of classify_s3, filings without a cover page never run the full pipeline
+        return filing.has_section("cover_page")
+
     def handle_ATM(self, filing: Filing, company: model.Company, bus: MessageBus, cover_page_doc: Doc, is_preliminary: bool=False):
         shelf: model.ShelfRegistration = company.get_shelf(file_number=filing.file_number)
         print(f"found base registration 'shelf': {shelf}")
@@ -468,7 +538,8 @@ class HTMS3Extractor(BaseHTMExtractor, AbstractFilingExtractor):
  
     def extract_securities_conversion_attributes(self, filing: Filing, company: model.Company, bus: MessageBus) -> List[model.SecurityConversion]:
         description_sections = filing.get_sections(re.compile(r"description\s*of", re.I))
-        description_docs = [self.doc_from_section(x) for x in description_sections]
+        profile = self.step_profiles["extract_securities_conversion_attributes"]
+        description_docs = [self.doc_from_section(x, profile=profile) for x in description_sections]
         conversions = []
         for security in company.securities:
             for doc in description_docs:
@@ -488,21 +559,26 @@ class HTMS3Extractor(BaseHTMExtractor, AbstractFilingExtractor):
         # 
         #WIP
 
-    def classify_s3(self, filing: Filing):
-        front_page = filing.get_section(re.compile("front page"))
-        cover_page = filing.get_section(re.compile("cover page"))
-        distribution = filing.get_section(re.compile("distribution", re.I))
-        summary = filing.get_section(re.compile("summary", re.I))
-        about = filing.get_section(re.compile(r"about\s*this", re.I))
-        if cover_page == []:
+    def classify_s3(self, filing: Filing, filing_doc: FilingDoc = None):
+        '''
+        classify the prospectus by phrases in its sections, the sections are sliced
+        from filing_doc if given and processed with the "classify" profile otherwise.
+        '''
+        profile = self.step_profiles["classify_s3"]
+        if not filing.has_section("cover_page"):
             raise AttributeError(f"couldnt get the cover page section; sections present: {[s.title for s in filing.sections]}")
-        cover_page_doc = self.doc_from_section(cover_page)
-        distribution_doc = self.doc_from_section(distribution) if distribution != [] else []
-        summary_doc = self.doc_from_section(summary) if summary != [] else []
-        about_doc = self.doc_from_section(about) if about != [] else []
+        front_page = filing.get_section_by_role("front_page")
+        cover_page = filing.get_section_by_role("cover_page")
+        distribution = filing.get_section_by_role("distribution")
+        summary = filing.get_section_by_role("summary")
+        about = filing.get_section_by_role("about")
+        cover_page_doc = self.doc_from_section(cover_page, filing_doc=filing_doc, profile=profile)
+        distribution_doc = self.doc_from_section(distribution, filing_doc=filing_doc, profile=profile) if distribution != [] else []
+        summary_doc = self.doc_from_section(summary, filing_doc=filing_doc, profile=profile) if summary != [] else []
+        about_doc = self.doc_from_section(about, filing_doc=filing_doc, profile=profile) if about != [] else []
         form_case = {"is_preliminary": False, "is_combination_form_case": False, "classifications": set()}
         if front_page:
-            front_page_doc = self.doc_from_section(front_page)
+            front_page_doc = self.doc_from_section(front_page, filing_doc=filing_doc, profile=profile)
             if self._is_preliminary_prospectus(front_page_doc):
                 form_case["is_preliminary"] = True
         if self._is_resale_prospectus(cover_page_doc):
@@ -754,8 +830,8 @@ class HTMS3Extractor(BaseHTMExtractor, AbstractFilingExtractor):
     
 
 class HTMDEF14AExtractor(BaseHTMExtractor, AbstractFilingExtractor):
-    def extract_form_values(self, filing: Filing):
-        return [self.extract_outstanding_shares(filing)]
+    def extract_form_values(self, filing: Filing, filing_doc: FilingDoc=None):
+        return [self.extract_outstanding_shares(filing, doc=filing_doc.doc if filing_doc is not None else None)]
 
 
 class HTMSC13GExtractor(BaseHTMExtractor, AbstractFilingExtractor):
@@ -768,6 +844,9 @@ class HTMSC13DExtractor(BaseHTMExtractor, AbstractFilingExtractor):
 # add commands for said model
 
 class XMLEFFECTExtractor(AbstractFilingExtractor):
+    # cheap to extract, kept in order with the registration it declares effective
+    reads_company = True
+
     def extract_form_values(self, filing: Filing, company: model.Company, bus: MessageBus):
         if filing.sections == []:
             return
@@ -812,6 +891,11 @@ class ExtractorFactory:
                 f"no extractor for that form_type and extension combination({form_type}, {extension}) registered"
             )
 
+    def reads_company(self, form_type: str, extension: str) -> bool:
+        """check if the extractor for (form_type, extension) reads state of the company, False if none is registered."""
+        extractor = self.extractors.get((form_type, extension))
+        return extractor.reads_company if extractor else False
+
 extractor_factory_default = [
     ("S-1", ".htm", HTMS1Extractor),
     ("DEF 14A", ".htm", HTMDEF14AExtractor),
@@ -0,0 +1,239 @@
+import hashlib
+import logging
+import os
+import pickle
+import zlib
+from pathlib import Path
+
+from main.parser.filings_base import Filing, FilingSection
+from main.parser.parsers import (
+    PARSER_VERSION,
+    parser_factory,
+    HTMFilingSection,
+    StreamedHTMFilingSection,
+    XMLFilingSection,
+    _detach_tables,
+)
+
+logger = logging.getLogger(__name__)
+
+'''
+On disk cache of parsed filings.
+
+Parsing a filing (building the tree, splitting it into sections, extracting
+the tables and text) costs far more than the extraction that runs on the
+result. The cache stores the parse result of a file once, re-extraction
+runs get the Filings back without touching the html.
+
+Entries are zlib compressed pickles of plain records (no soup or tree
+elements), one per source file and (form_type, extension). An entry is only
+used if the content hash of the file, the PARSER_VERSION and the parse
+backend are the same as when it was written.
+
+Streamed sections (see StreamedHTMFilingSection) are stored as their byte
+offsets in the file instead of their content and restored as streamed
+sections, so a cache hit doesnt hold the whole filing in memory either.
+
+Only the tables and text of sections already extracted are stored, the other
+sections are stored with their content and extracted on first access after
+they were restored. Storing the filings again after the extraction (see
+FilingFactory.update_cache) adds the extracted values.
+'''
+
+CACHE_ENTRY_SUFFIX = ".filing"
+
+
+class ParsedFilingCache:
+    """
+    Cache of the Filings created from the local files.
+
+    Usage::
+
+            cache = ParsedFilingCache(root_path)
+            filing_factory.set_cache(cache)
+            # filings are now read from the cache if the file didnt change
+            filings = filing_factory.create_filing(form_type, extension, path=path, ...)
+
+    Restored filings dont hold the parsed file, their doc and soup are
+    created from the file on first access. The tables of restored sections
+    keep their parsed_table, table and classification but not the elements
+    of the original document (table_elements is empty and reintegrated_as
+    is None).
+
+    Args:
+        root_path: directory of the cache entries, created if it doesnt exist.
+        parser_version: stamp of the entries, entries written with another
+                        stamp are ignored and overwritten.
+        compression_level: zlib compression level of the entries.
+    """
+
+    def __init__(
+        self,
+        root_path: str | Path,
+        parser_version: int = PARSER_VERSION,
+        compression_level: int = 6,
+    ):
+        self.root_path = Path(root_path)
+        self.root_path.mkdir(parents=True, exist_ok=True)
+        self.parser_version = parser_version
+        self.compression_level = compression_level
+
+    def get(
+        self, form_type: str, extension: str, path: str, stamp: tuple = None, **kwargs
+    ) -> Filing | list[Filing] | None:
+        """
+        get the cached filings of the file at path.
+
+        Args:
+            stamp: the get_stamp of path if it was already taken, saves hashing the file again.
+            kwargs: the other arguments of FilingFactory.create_filing, passed
+                    on to the restored filings.
+
+        Returns:
+            the Filing or list of Filings or None if there is no valid entry.
+        """
+        entry_path = self.get_entry_path(form_type, extension, path)
+        if not entry_path.is_file():
+            return None
+        try:
+            with open(entry_path, "rb") as f:
+                entry = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning(f"couldnt read cache entry {entry_path}, ignoring it. Exception caught: {e}")
+            return None
+        if entry["stamp"] != (stamp if stamp is not None else self.get_stamp(path)):
+            logger.debug(f"cache entry {entry_path} is outdated, ignoring it.")
+            return None
+        filings = [
+            self._restore_filing(record, form_type, extension, path, kwargs)
+            for record in entry["filings"]
+        ]
+        return filings if entry["is_list"] else filings[0]
+
+    def put(
+        self, filings: Filing | list[Filing], form_type: str, extension: str, path: str, stamp: tuple = None, **kwargs
+    ):
+        """
+        store the filings created from the file at path.
+
+        sections whose tables and text_only werent extracted yet are stored without them.
+
+        Args:
+            stamp: the get_stamp of path if it was already taken, saves hashing the file again.
+        """
+        is_list = isinstance(filings, list)
+        entry = {
+            "stamp": stamp if stamp is not None else self.get_stamp(path),
+            "is_list": is_list,
+            "filings": [self._dump_filing(f) for f in (filings if is_list else [filings])],
+        }
+        try:
+            data = zlib.compress(
+                pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL),
+                self.compression_level,
+            )
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            logger.warning(f"couldnt cache the filings of {path}. Exception caught: {e}")
+            return
+        entry_path = self.get_entry_path(form_type, extension, path)
+        # write to a temporary file first so readers never see a partial entry
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+
+    def get_entry_path(self, form_type: str, extension: str, path: str) -> Path:
+        """get the path of the cache entry for the file at path."""
+        key = f"{Path(path).resolve()}|{form_type}|{extension}"
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.root_path / (name + CACHE_ENTRY_SUFFIX)
+
+    def get_stamp(self, path: str) -> tuple:
+        """get the stamp an entry of the file at path is valid for, reads and hashes the file."""
+        with open(path, "rb") as f:
+            content_hash = hashlib.sha256(f.read()).hexdigest()
+        return (self.parser_version, parser_factory.backend, content_hash)
+
+    def _dump_filing(self, filing: Filing) -> dict:
+        return {
+            "filing_class": type(filing),
+            "meta": filing.meta,
+            "sections": [_dump_section(s) for s in filing.sections],
+        }
+
+    def _restore_filing(self, record: dict, form_type: str, extension: str, path: str, kwargs: dict) -> Filing:
+        sections = [
+            _restore_section(r, form_type, extension, path) for r in record["sections"]
+        ]
+        filing = record["filing_class"](
+            form_type=form_type,
+            extension=extension,
+            path=path,
+            sections=sections,
+            **kwargs,
+        )
+        filing.meta = record["meta"]
+        return filing
+
+
+def _dump_section(section: FilingSection) -> dict:
+    if isinstance(section, StreamedHTMFilingSection):
+        # the content is read from the file, dont keep it in the entry
+        record = {
+            "title": section.title,
+            "type": "streamed",
+            "start": section.start,
+            "end": section.end,
+            "max_memory": section.max_memory,
+        }
+        record.update(_dump_extracted(section))
+    elif isinstance(section, HTMFilingSection):
+        record = {"title": section.title, "content": section.content, "type": "htm"}
+        record.update(_dump_extracted(section))
+    elif isinstance(section, XMLFilingSection):
+        record = {"title": section.title, "content": section.content, "type": "xml"}
+        record["content_dict"] = section.content_dict
+    else:
+        record = {"title": section.title, "content": section.content, "type": "base"}
+    return record
+
+
+def _dump_extracted(section: HTMFilingSection) -> dict:
+    # text_only is extracted from the soup the table extraction changed, so keep both or neither
+    if (section._tables is not None) and (section._text_only is not None):
+        return {"tables": _detach_tables(section._tables), "text_only": section._text_only}
+    return {"tables": None, "text_only": None}
+
+
+def _restore_section(record: dict, form_type: str, extension: str, path: str) -> FilingSection:
+    if record["type"] == "streamed":
+        return StreamedHTMFilingSection(
+            title=record["title"],
+            path=path,
+            start=record["start"],
+            end=record["end"],
+            extension=extension,
+            form_type=form_type,
+            backend=parser_factory.backend,
+            max_memory=record["max_memory"],
+            tables=record["tables"],
+            text_only=record["text_only"],
+        )
+    if record["type"] == "htm":
+        return HTMFilingSection(
+            title=record["title"],
+            content=record["content"],
+            extension=extension,
+            form_type=form_type,
+            backend=parser_factory.backend,
+            tables=record["tables"],
+            text_only=record["text_only"],
+        )
+    if record["type"] == "xml":
+        return XMLFilingSection(
+            content_dict=record["content_dict"],
+            title=record["title"],
+            content=record["content"],
+        )
+    return FilingSection(title=record["title"], content=record["content"])
+
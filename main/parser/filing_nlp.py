@@ -1,4 +1,5 @@
 from collections import defaultdict
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Any, Callable, Dict, Optional, Set
 import spacy
@@ -46,10 +47,58 @@ from main.parser.filing_nlp_constants import (
     SECUQUANTITY_UNITS,
 )
 from main.parser.filing_nlp_SECU import SECU, SECUQuantity, SecurityAmount, QuantityRelation, SourceQuantityRelation
+from main.parser.filing_nlp_prefilter import SentencePrefilter, PrefilteredText
 
 logger = logging.getLogger(__name__)
 formater = MatchFormater()
 
+# bump when a change to the custom components or their patterns changes the docs they create,
+# entries of the DocCache written by another version are ignored.
+NLP_PIPELINE_VERSION = 1
+
+# components run by the pipeline profiles of SpacyFilingTextSearch, None runs the
+# enabled components. "classify" only tokenizes, lemmatizes and sets the sentences
+# (with the senter instead of the parser) for the phrase matching of the classification.
+PIPELINE_PROFILES = {
+    "full": None,
+    "classify": (
+        "secu_act_matcher",
+        "security_law_retokenizer",
+        "common_financial_retokenizer",
+        "tok2vec",
+        "tagger",
+        "senter",
+        "attribute_ruler",
+        "lemmatizer",
+    ),
+}
+
+
+@contextmanager
+def select_pipeline_profile(nlp: Language, profile: str):
+    """
+    run only the components of profile in nlp within the context.
+
+    components of the profile which are disabled in nlp (eg the senter) are enabled
+    for the context, components of the profile which arent in nlp are ignored.
+    """
+    if profile not in PIPELINE_PROFILES:
+        raise ValueError(f"unknown pipeline profile: {profile}. choose one of: {list(PIPELINE_PROFILES.keys())}")
+    components = PIPELINE_PROFILES[profile]
+    if components is None:
+        yield nlp
+        return
+    enabled = [name for name in components if name in nlp.disabled]
+    for name in enabled:
+        nlp.enable_pipe(name)
+    disabled = nlp.select_pipes(disable=[name for name in nlp.pipe_names if name not in components])
+    try:
+        yield nlp
+    finally:
+        disabled.restore()
+        for name in enabled:
+            nlp.disable_pipe(name)
+
 
 class UnclearInformationExtraction(Exception):
     pass
@@ -1179,6 +1228,8 @@ def create_agreement_matcher(nlp, name):
 
 class SpacyFilingTextSearch:
     _instance = None
+    # DocCache get_doc reads processed texts from, None processes every text
+    doc_cache = None
     # make this a singleton/get it from factory through cls._instance so we can avoid
     # the slow process of adding patterns (if we end up with a few 100)
     def __init__(self):
@@ -1542,7 +1593,43 @@ class SpacyFilingTextSearch:
 
             return [_get_CD_object_from_match(match[1]) for match in matches]
 
-    def match_prospectus_relates_to(self, text):
+    @classmethod
+    def set_doc_cache(cls, doc_cache):
+        """set the DocCache of get_doc, None disables it."""
+        cls.doc_cache = doc_cache
+
+    def select_profile(self, profile: str):
+        """context in which nlp only runs the components of profile, see PIPELINE_PROFILES."""
+        return select_pipeline_profile(self.nlp, profile)
+
+    def get_doc(self, text: str | Doc, profile: str = "full") -> Doc:
+        """
+        process text with the components of profile or get it from the doc_cache,
+        a Doc (eg from a NLPBatch) is returned as is.
+        """
+        if isinstance(text, Doc):
+            return text
+        with self.select_profile(profile) as nlp:
+            if self.doc_cache is not None:
+                return self.doc_cache.get_or_process(text, nlp)
+            return nlp(text)
+
+    def get_prefiltered_doc(
+        self, text: str, prefilter: SentencePrefilter = None, profile: str = "full"
+    ) -> tuple[Doc, PrefilteredText]:
+        """
+        process only the sentences of text prefilter keeps (see filing_nlp_prefilter).
+
+        Returns:
+            the Doc of the kept text and the PrefilteredText, which maps the character
+            offsets of the Doc back to text (eg prefiltered.to_original_span(ent.start_char, ent.end_char)).
+        """
+        if prefilter is None:
+            prefilter = SentencePrefilter()
+        prefiltered = prefilter.filter(text)
+        return self.get_doc(prefiltered.text, profile=profile), prefiltered
+
+    def match_prospectus_relates_to(self, text: str | Doc):
         # INVESTIGATIVE
         pattern = [
             # This prospectus relates to
@@ -1553,7 +1640,7 @@ class SpacyFilingTextSearch:
         ]
         matcher = Matcher(self.nlp.vocab)
         matcher.add("relates_to", [pattern])
-        doc = self.nlp(text)
+        doc = self.get_doc(text)
         matches = _convert_matches_to_spans(
             doc, filter_matches(matcher(doc, as_spans=False))
         )
@@ -1579,7 +1666,7 @@ class SpacyFilingTextSearch:
         )
         return matches if matches is not None else []
 
-    def match_outstanding_shares(self, text):
+    def match_outstanding_shares(self, text: str | Doc):
         # WILL BE REPLACED
         pattern1 = [
             {"LEMMA": "base"},
@@ -1623,7 +1710,7 @@ class SpacyFilingTextSearch:
         ]
         matcher = Matcher(self.nlp.vocab)
         matcher.add("outstanding", [pattern1, pattern2, pattern3])
-        doc = self.nlp(text)
+        doc = self.get_doc(text)
         possible_matches = matcher(doc, as_spans=False)
         if possible_matches == []:
             logger.debug("no matches for outstanding shares found")
@@ -0,0 +1,123 @@
+import logging
+from typing import Any, Callable, Iterable
+from spacy import Language
+from spacy.tokens import Doc
+
+logger = logging.getLogger(__name__)
+
+'''
+Batched processing of the texts of an extraction run.
+
+The extractors call nlp(text) on one text at a time. NLPBatch collects the
+texts of many filings and sections together with the callback each Doc is
+meant for, processes the unique texts with nlp.pipe and calls the callbacks
+with their Doc in the order they were added.
+
+With n_process > 1 the Docs are sent back from the worker processes as
+bytes, which fails for the extensions holding Tokens, Spans or SECU objects.
+Those are set by the components from MAIN_PROCESS_FROM on, so the workers
+run the pipeline up to it (the tagger, parser and ner, where most of the time
+is spent) and the remaining components run on the Docs in this process.
+'''
+
+DEFAULT_BATCH_SIZE = 32
+# first component of the SpacyFilingTextSearch pipeline whose extensions cant be serialized
+MAIN_PROCESS_FROM = "secu_matcher"
+
+
+class NLPBatch:
+    """
+    Texts and the callbacks their Docs are handed to.
+
+    Usage::
+
+            batch = NLPBatch(SpacyFilingTextSearch().nlp, n_process=4)
+            for filing in filings:
+                batch.add(filing.get_text_only(), extractor.extract_outstanding_shares_from_doc)
+            results = batch.run()  # return values of the callbacks, in order of add
+
+    Args:
+        nlp: the pipeline to process the texts with.
+        batch_size: number of texts nlp.pipe buffers per batch.
+        n_process: number of processes to run the pipeline in.
+        main_process_from: name of the first component run in this process when
+                           n_process > 1, if it is in the pipeline.
+        doc_cache: DocCache the Docs are read from and the processed Docs are written to.
+    """
+
+    def __init__(
+        self,
+        nlp: Language,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        n_process: int = 1,
+        main_process_from: str = MAIN_PROCESS_FROM,
+        doc_cache=None,
+    ):
+        if n_process < 1:
+            raise ValueError(f"n_process must be at least 1, got: {n_process}")
+        self.nlp = nlp
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.main_process_from = main_process_from
+        self.doc_cache = doc_cache
+        # text: index of the text
+        self._texts = {}
+        # (index of the text, callback, args)
+        self._requests = []
+
+    def __len__(self):
+        return len(self._requests)
+
+    def add(self, text: str, callback: Callable[[Doc], Any], *args) -> int:
+        """
+        add text to the batch, callback is called with its Doc and args on run.
+
+        the same text is only processed once, however often it is added.
+
+        Returns:
+            index of the return value of callback in the results of run.
+        """
+        if not isinstance(text, str):
+            raise TypeError(f"NLPBatch.add expects text of type str, got: {type(text)}")
+        text_idx = self._texts.setdefault(text, len(self._texts))
+        self._requests.append((text_idx, callback, args))
+        return len(self._requests) - 1
+
+    def run(self) -> list:
+        """process the texts and call the callbacks, then empty the batch."""
+        texts = list(self._texts.keys())
+        docs = [None] * len(texts)
+        if self.doc_cache is not None:
+            docs = [self.doc_cache.get(text, self.nlp) for text in texts]
+        missing = [idx for idx, doc in enumerate(docs) if doc is None]
+        for idx, doc in zip(missing, self.pipe(texts[idx] for idx in missing)):
+            docs[idx] = doc
+            if self.doc_cache is not None:
+                self.doc_cache.put(texts[idx], doc, self.nlp)
+        results = [callback(docs[text_idx], *args) for text_idx, callback, args in self._requests]
+        self._texts = {}
+        self._requests = []
+        return results
+
+    def pipe(self, texts: Iterable[str]) -> Iterable[Doc]:
+        """process texts with nlp in the processes, yields the Docs in order of texts."""
+        main_process_pipes = self._get_main_process_pipes()
+        if main_process_pipes == []:
+            yield from self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+            return
+        docs = self.nlp.pipe(
+            texts,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+            disable=[name for name, _ in main_process_pipes],
+        )
+        for doc in docs:
+            for _, proc in main_process_pipes:
+                doc = proc(doc)
+            yield doc
+
+    def _get_main_process_pipes(self) -> list[tuple[str, Callable]]:
+        if (self.n_process == 1) or (self.main_process_from not in self.nlp.pipe_names):
+            return []
+        start = self.nlp.pipe_names.index(self.main_process_from)
+        return [(name, self.nlp.get_pipe(name)) for name in self.nlp.pipe_names[start:]]
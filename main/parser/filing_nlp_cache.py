@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+import spacy
+import srsly
+from spacy import Language
+from spacy.tokens import Doc, DocBin, Span, Token
+
+from main.parser.filing_nlp import NLP_PIPELINE_VERSION
+from main.parser.filing_nlp_doc import SECU_OBJECT_MAPPER_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+'''
+On disk cache of processed Docs.
+
+Running the pipeline of SpacyFilingTextSearch over a text costs far more
+than the matching done on the Doc, and reparsing a filing runs it over the
+same section texts again. The cache stores the Doc of a text once, keyed by
+the hash of the text and the stamp of the pipeline (NLP_PIPELINE_VERSION,
+the spacy version, the model and the names of the components).
+
+The tokens, entities and span groups (SECU, alias ..) are stored as a
+DocBin. The values of the extensions (doc.user_data) are stored next to
+it with the Tokens and Spans they hold replaced by their indices. Tokens
+and Spans of other Docs (the source_span_unmerged of retokenize_SECU holds
+the tokens of an ent.as_doc slice) are stored with their Doc, which is
+restored once and shared by all values referring to it. The
+components in REBUILT_PIPES set extensions to objects which cant be stored
+(SECU objects, CertaintyInfo), their extensions are left out and the
+components are run again on the restored Doc, which is cheap compared to
+the rest of the pipeline.
+'''
+
+CACHE_ENTRY_SUFFIX = ".doc"
+# part of the stamp, bump when the layout of the entries changes
+CACHE_ENTRY_FORMAT = 2
+# components rerun on restored docs: (doc extensions, token extensions) they set
+REBUILT_PIPES = {
+    "certainty_setter": (("certainty_marker_map", "token_to_certainty_marker_map"), ("certainty_info",)),
+    "secu_object_mapper": (SECU_OBJECT_MAPPER_EXTENSIONS, ()),
+}
+# doc extensions of REBUILT_PIPES whose default is a defaultdict(list)
+DEFAULTDICT_EXTENSIONS = frozenset(["secu_objects", "token_to_certainty_marker_map"])
+
+
+class DocCache:
+    """
+    Cache of the Docs of processed texts.
+
+    Usage::
+
+            cache = DocCache(root_path)
+            doc = cache.get_or_process(text, nlp)
+            # or for all texts processed through SpacyFilingTextSearch.get_doc
+            SpacyFilingTextSearch.set_doc_cache(cache)
+
+    Args:
+        root_path: directory of the cache entries, created if it doesnt exist.
+        pipeline_version: part of the stamp of the entries, entries written
+                          with another stamp are never read.
+    """
+
+    def __init__(self, root_path: str | Path, pipeline_version: int = NLP_PIPELINE_VERSION):
+        self.root_path = Path(root_path)
+        self.root_path.mkdir(parents=True, exist_ok=True)
+        self.pipeline_version = pipeline_version
+
+    def get(self, text: str, nlp: Language) -> Doc | None:
+        """get the cached Doc of text processed by nlp, None if there is no entry."""
+        entry_path = self.get_entry_path(text, nlp)
+        if not entry_path.is_file():
+            return None
+        try:
+            with open(entry_path, "rb") as f:
+                entry = srsly.msgpack_loads(f.read())
+            doc = list(DocBin().from_bytes(entry["doc_bin"]).get_docs(nlp.vocab))[0]
+            if doc.text != text:
+                raise ValueError("text of the cached doc doesnt match")
+            other_docs = [Doc(nlp.vocab).from_bytes(data) for data in entry["other_docs"]]
+            for key, value in entry["user_data"]:
+                doc.user_data[tuple(key)] = _decode(value, doc, other_docs)
+        except (OSError, ValueError, TypeError, KeyError, IndexError) as e:
+            logger.warning(f"couldnt read cache entry {entry_path}, ignoring it. Exception caught: {e}")
+            return None
+        return self._rebuild(doc, nlp)
+
+    def put(self, text: str, doc: Doc, nlp: Language) -> bool:
+        """
+        store the Doc of text processed by nlp.
+
+        Returns:
+            False if a value of an extension couldnt be stored, the doc isnt cached then.
+        """
+        skipped = self._get_rebuilt_extensions(nlp)
+        # id of a Doc other than doc: (index, Doc)
+        other_docs = {}
+        try:
+            user_data = [
+                [list(key), _encode(value, doc, other_docs)]
+                for key, value in doc.user_data.items()
+                if not (isinstance(key, tuple) and (len(key) == 4) and (key[1] in skipped))
+            ]
+        except TypeError as e:
+            logger.warning(f"couldnt cache doc of text starting with: {text[:50]!r}. Exception caught: {e}")
+            return False
+        doc_bin = DocBin(store_user_data=False)
+        doc_bin.add(doc)
+        data = srsly.msgpack_dumps(
+            {
+                "doc_bin": doc_bin.to_bytes(),
+                "user_data": user_data,
+                # the user_data of the other docs isnt read by the extensions holding them
+                "other_docs": [
+                    other_doc.to_bytes(exclude=["user_data"])
+                    for _, other_doc in sorted(other_docs.values(), key=lambda x: x[0])
+                ],
+            }
+        )
+        entry_path = self.get_entry_path(text, nlp)
+        # write to a temporary file first so readers never see a partial entry
+        tmp_path = entry_path.with_name(f"{entry_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+        return True
+
+    def get_or_process(self, text: str, nlp: Language) -> Doc:
+        """get the cached Doc of text, process it with nlp and cache it if there is none."""
+        doc = self.get(text, nlp)
+        if doc is None:
+            doc = nlp(text)
+            self.put(text, doc, nlp)
+        return doc
+
+    def get_entry_path(self, text: str, nlp: Language) -> Path:
+        """get the path of the cache entry for text processed by nlp."""
+        key = hashlib.sha256()
+        key.update(repr(self.get_stamp(nlp)).encode("utf-8"))
+        key.update(b"\0")
+        key.update(text.encode("utf-8"))
+        return self.root_path / (key.hexdigest() + CACHE_ENTRY_SUFFIX)
+
+    def get_stamp(self, nlp: Language) -> tuple:
+        return (
+            CACHE_ENTRY_FORMAT,
+            self.pipeline_version,
+            spacy.__version__,
+            nlp.meta.get("name"),
+            nlp.meta.get("version"),
+            tuple(nlp.pipe_names),
+        )
+
+    def _get_rebuilt_extensions(self, nlp: Language) -> set[str]:
+        names = set()
+        for pipe_name, (doc_extensions, token_extensions) in REBUILT_PIPES.items():
+            if nlp.has_pipe(pipe_name):
+                names.update(doc_extensions)
+                names.update(token_extensions)
+        return names
+
+    def _rebuild(self, doc: Doc, nlp: Language) -> Doc:
+        for pipe_name, (doc_extensions, _) in REBUILT_PIPES.items():
+            if not nlp.has_pipe(pipe_name):
+                continue
+            # fresh containers, the defaults of the extensions are shared between docs
+            for name in doc_extensions:
+                if Doc.has_extension(name):
+                    doc._.set(name, defaultdict(list) if name in DEFAULTDICT_EXTENSIONS else dict())
+        for pipe_name in nlp.pipe_names:
+            if pipe_name in REBUILT_PIPES:
+                doc = nlp.get_pipe(pipe_name)(doc)
+        return doc
+
+
+def _encode(value, doc: Doc, other_docs: dict):
+    if (value is None) or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (Token, Span)):
+        if value.doc is doc:
+            doc_idx = None
+        else:
+            doc_idx = other_docs.setdefault(id(value.doc), (len(other_docs), value.doc))[0]
+        if isinstance(value, Token):
+            return {"__token__": [doc_idx, value.i]}
+        return {"__span__": [doc_idx, value.start, value.end, value.label_]}
+    if isinstance(value, tuple):
+        return {"__tuple__": [_encode(v, doc, other_docs) for v in value]}
+    if isinstance(value, list):
+        return [_encode(v, doc, other_docs) for v in value]
+    if isinstance(value, dict):
+        if isinstance(value, defaultdict) and (value.default_factory is not list):
+            raise TypeError(f"cant encode defaultdict with default_factory: {value.default_factory}")
+        items = [[_encode(k, doc, other_docs), _encode(v, doc, other_docs)] for k, v in value.items()]
+        return {"__defaultdict__": items} if isinstance(value, defaultdict) else {"__dict__": items}
+    raise TypeError(f"cant encode value of type: {type(value)}")
+
+
+def _decode(value, doc: Doc, other_docs: list[Doc]):
+    if isinstance(value, list):
+        return [_decode(v, doc, other_docs) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "__token__" in value:
+        doc_idx, i = value["__token__"]
+        return (doc if doc_idx is None else other_docs[doc_idx])[i]
+    if "__span__" in value:
+        doc_idx, start, end, label = value["__span__"]
+        return Span(doc if doc_idx is None else other_docs[doc_idx], start, end, label=label)
+    if "__tuple__" in value:
+        return tuple(_decode(v, doc, other_docs) for v in value["__tuple__"])
+    if "__defaultdict__" in value:
+        decoded = defaultdict(list)
+        decoded.update((_decode(k, doc, other_docs), _decode(v, doc, other_docs)) for k, v in value["__defaultdict__"])
+        return decoded
+    if "__dict__" in value:
+        return {_decode(k, doc, other_docs): _decode(v, doc, other_docs) for k, v in value["__dict__"]}
+    raise TypeError(f"cant decode value: {value}")
@@ -0,0 +1,122 @@
+import logging
+from collections import defaultdict
+from spacy import Language
+from spacy.tokens import Doc
+
+from main.parser.filings_base import Filing, FilingSection
+from main.parser.filing_nlp import (
+    _set_single_secu_alias_map,
+    _set_single_secu_alias_map_as_tuples,
+)
+
+logger = logging.getLogger(__name__)
+
+'''
+One processed Doc per filing, sliced into the Docs of its sections.
+
+The extractors processed the text of a whole filing and then again the text
+of single sections (cover page, front page, summary ..) with the full
+pipeline. FilingDoc processes the text of the filing once and keeps the
+character offsets of its sections, the Doc of a section is a slice of it.
+'''
+
+# span groups set by the SECUMatcher
+SECU_SPAN_GROUPS = ("SECU", "alias")
+# doc extensions of the SECUObjectMapper, they hold objects of the sliced doc
+SECU_OBJECT_MAPPER_EXTENSIONS = (
+    "secu_objects",
+    "secu_objects_map",
+    "quantity_relation_map",
+    "source_quantity_relation_map",
+)
+
+
+def get_doc_slice(doc: Doc, start_char: int, end_char: int, nlp: Language = None) -> Doc:
+    """
+    get the part of doc from start_char to end_char as a Doc.
+
+    the text of the slice keeps the trailing whitespace of its last token.
+    token and span extensions are copied, the SECU and alias span groups are
+    restricted to the slice and the doc extensions derived from them
+    (alias_list, tokens_to_alias_map, single_secu_alias, single_secu_alias_tuples)
+    are set from the slice. the maps of the SECUObjectMapper are recreated if
+    nlp has a secu_object_mapper, otherwise they are empty.
+
+    Args:
+        nlp: the pipeline doc was processed with.
+    """
+    span = doc.char_span(start_char, end_char, alignment_mode="expand") if start_char < end_char else None
+    if span is None:
+        return Doc(doc.vocab)
+    sliced = span.as_doc(copy_user_data=True)
+    for label in SECU_SPAN_GROUPS:
+        if label not in doc.spans:
+            continue
+        sliced.spans[label] = [
+            sliced[s.start - span.start : s.end - span.start]
+            for s in doc.spans[label]
+            if (s.start >= span.start) and (s.end <= span.end)
+        ]
+    if Doc.has_extension("alias_list") and ("alias" in sliced.spans):
+        sliced._.alias_list = [s.text for s in sliced.spans["alias"]]
+        sliced._.tokens_to_alias_map = {
+            token.i: s for s in sliced.spans["alias"] for token in s
+        }
+    if Doc.has_extension("single_secu_alias") and all(label in sliced.spans for label in SECU_SPAN_GROUPS):
+        _set_single_secu_alias_map(sliced)
+        _set_single_secu_alias_map_as_tuples(sliced)
+    for name in SECU_OBJECT_MAPPER_EXTENSIONS:
+        if Doc.has_extension(name):
+            sliced._.set(name, defaultdict(list) if name == "secu_objects" else dict())
+    if (nlp is not None) and nlp.has_pipe("secu_object_mapper"):
+        sliced = nlp.get_pipe("secu_object_mapper")(sliced)
+    return sliced
+
+
+class FilingDoc:
+    """
+    Doc of the text of a filing with the character offsets of its sections.
+
+    Usage::
+
+            filing_doc = FilingDoc(nlp, filing)
+            filing_doc.doc  # nlp(filing.get_text_only())
+            filing_doc.get_section_doc(filing.get_section_by_role("cover_page"))
+
+    Args:
+        nlp: the pipeline to process the text with.
+        filing: the text of the filing is the text_only of its sections joined
+                by a space, like get_text_only of the html filings.
+        doc: the processed text of the filing if it was already processed
+             (eg in a NLPBatch), otherwise it is processed with nlp.
+    """
+
+    def __init__(self, nlp: Language, filing: Filing, doc: Doc = None):
+        self.nlp = nlp
+        self.filing = filing
+        # id of the section: (section, start_char, end_char)
+        self._offsets = {}
+        pieces = []
+        position = 0
+        for section in filing.sections:
+            text = section.text_only
+            self._offsets[id(section)] = (section, position, position + len(text))
+            pieces.append(text)
+            position += len(text) + 1
+        self.text = " ".join(pieces)
+        if (doc is not None) and (doc.text != self.text):
+            raise ValueError(f"doc isnt the processed text of filing: {filing.path}")
+        self.doc = doc if doc is not None else nlp(self.text)
+        self._section_docs = {}
+
+    def get_section_doc(self, section: FilingSection) -> Doc:
+        """get the Doc of section, sliced from the doc of the filing on first access."""
+        entry = self._offsets.get(id(section))
+        if (entry is None) or (entry[0] is not section):
+            raise ValueError(f"section {section.title} isnt a section of filing: {self.filing.path}")
+        section_doc = self._section_docs.get(id(section))
+        if section_doc is None:
+            _, start, end = entry
+            section_doc = get_doc_slice(self.doc, start, end, nlp=self.nlp)
+            self._section_docs[id(section)] = section_doc
+        return section_doc
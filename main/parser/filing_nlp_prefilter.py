@@ -0,0 +1,254 @@
+import bisect
+import logging
+import re
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from xml.etree import ElementTree
+
+from main.parser.filing_nlp_constants import SECUQUANTITY_UNITS
+from main.parser.filing_nlp_patterns import (
+    SECU_DEBT_SECURITY_L1_MODIFIERS,
+    SECU_ENT_DEPOSITARY_PATTERNS,
+    SECU_ENT_REGULAR_PATTERNS,
+    SECU_ENT_SPECIAL_PATTERNS,
+    SECU_GENERAL_AFFIXES,
+    SECU_GENERAL_PRE_COMPOUND_MODIFIERS,
+    SECU_GENERAL_PRE_MODIFIERS,
+    SECUQUANTITY_ENT_PATTERNS,
+)
+
+logger = logging.getLogger(__name__)
+
+'''
+Keyword gated prefilter of the sentences of a text.
+
+Most sentences of a prospectus (risk factors, boilerplate ..) dont mention a
+security, yet the parser and the dependency based components run over all
+of them. SentencePrefilter splits a text into sentences with a regex and
+keeps the sentences containing a word of the trigger vocabulary (the words
+of the SECU and SECUQUANTITY patterns) together with context sentences
+around them. Only the kept text is processed, PrefilteredText maps the
+character offsets of its Doc back to the original text.
+
+get_prefilter_recall measures how many of the annotated securities of the
+8-K item 8.01 training set are kept.
+'''
+
+TRAINING_SET_PATH = (
+    Path(__file__).parent.parent
+    / "resources"
+    / "training_sets"
+    / "training_set_8k_item801_securities_detection_annotated_138Filings.zip"
+)
+# debt securities arent matched by the SECU patterns yet but are annotated in the training set
+DEBT_SECURITY_TRIGGERS = frozenset(["note", "notes", "bond", "bonds", "debenture", "debentures"])
+# words of the patterns which only modify a security
+NON_TRIGGER_WORDS = frozenset(
+    [w.lower() for w in SECU_GENERAL_AFFIXES + SECU_GENERAL_PRE_MODIFIERS + SECU_DEBT_SECURITY_L1_MODIFIERS]
+    + [t["LOWER"] for pattern in SECU_GENERAL_PRE_COMPOUND_MODIFIERS for t in pattern]
+    + ["of", "our", "authorized", "outstanding", "beneficial", "interest"]
+)
+# boundary after sentence end punctuation followed by the start of a sentence, or a line break
+RE_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])[\"”’)]*\s+(?=[\"“(]?[A-Z0-9])|\n\s*")
+
+
+def get_pattern_vocabulary(patterns: list[list[dict]]) -> set[str]:
+    """get the lowercased words the LOWER and TEXT attributes of the token patterns match."""
+    words = set()
+    for pattern in patterns:
+        for token in pattern:
+            for key in ("LOWER", "TEXT"):
+                value = token.get(key)
+                if isinstance(value, str):
+                    words.update(value.lower().split())
+                elif isinstance(value, dict) and ("IN" in value):
+                    for each in value["IN"]:
+                        words.update(each.lower().split())
+    return words
+
+
+SECU_TRIGGER_VOCABULARY = frozenset(
+    (
+        get_pattern_vocabulary(
+            SECU_ENT_REGULAR_PATTERNS
+            + SECU_ENT_DEPOSITARY_PATTERNS
+            + SECU_ENT_SPECIAL_PATTERNS
+            + SECUQUANTITY_ENT_PATTERNS
+        )
+        | set(SECUQUANTITY_UNITS)
+        | DEBT_SECURITY_TRIGGERS
+    )
+    - NON_TRIGGER_WORDS
+)
+
+
+def split_sentences(text: str) -> list[tuple[int, int]]:
+    """split text into (start, end) character offsets of its sentences, without the whitespace between them."""
+    sentences = []
+    start = 0
+    for boundary in RE_SENTENCE_BOUNDARY.finditer(text):
+        if boundary.start() > start:
+            sentences.append((start, boundary.start()))
+        start = boundary.end()
+    if start < len(text):
+        sentences.append((start, len(text)))
+    return sentences
+
+
+@dataclass(slots=True)
+class PrefilteredText:
+    """
+    the kept segments of a text joined by a separator.
+
+    Args:
+        text: the joined segments.
+        segments: (start in text, start in the original text, length) of each segment.
+    """
+    text: str
+    segments: list[tuple[int, int, int]] = field(default_factory=list)
+
+    def to_original(self, char_idx: int) -> int:
+        """map a character offset of text to the original text, offsets in a separator map to the end of the segment before."""
+        if self.segments == []:
+            return 0
+        idx = max(bisect.bisect_right(self.segments, (char_idx, float("inf"))) - 1, 0)
+        start, original_start, length = self.segments[idx]
+        return original_start + min(max(char_idx - start, 0), length)
+
+    def to_original_span(self, start_char: int, end_char: int) -> tuple[int, int]:
+        return self.to_original(start_char), self.to_original(end_char)
+
+
+class SentencePrefilter:
+    """
+    Keeps the sentences of a text which contain a trigger word and their context.
+
+    Usage::
+
+            prefilter = SentencePrefilter()
+            prefiltered = prefilter.filter(text)
+            doc = nlp(prefiltered.text)
+            start, end = prefiltered.to_original_span(ent.start_char, ent.end_char)
+
+    Args:
+        triggers: lowercase words a kept sentence contains.
+        context: number of sentences before and after a sentence with a trigger which are kept.
+        separator: joins the kept segments, it should end a sentence for the parser.
+    """
+
+    def __init__(
+        self,
+        triggers: frozenset[str] = SECU_TRIGGER_VOCABULARY,
+        context: int = 1,
+        separator: str = "\n\n",
+    ):
+        if context < 0:
+            raise ValueError(f"context cant be negative, got: {context}")
+        self.triggers = triggers
+        self.context = context
+        self.separator = separator
+        self.re_trigger = re.compile(
+            r"\b(?:%s)\b" % "|".join(re.escape(t) for t in sorted(triggers, key=len, reverse=True)),
+            re.I,
+        )
+
+    def get_segments(self, text: str) -> list[tuple[int, int]]:
+        """get the (start, end) character offsets of the kept parts of text, consecutive kept sentences are merged."""
+        sentences = split_sentences(text)
+        hits = [self.re_trigger.search(text, start, end) is not None for start, end in sentences]
+        keep = [False] * len(sentences)
+        for idx, hit in enumerate(hits):
+            if hit:
+                for context_idx in range(max(idx - self.context, 0), min(idx + self.context + 1, len(sentences))):
+                    keep[context_idx] = True
+        segments = []
+        for idx, (start, end) in enumerate(sentences):
+            if not keep[idx]:
+                continue
+            if (idx > 0) and keep[idx - 1]:
+                # keep the text between consecutive kept sentences
+                segments[-1] = (segments[-1][0], end)
+            else:
+                segments.append((start, end))
+        return segments
+
+    def filter(self, text: str) -> PrefilteredText:
+        """get the kept parts of text joined by the separator."""
+        pieces = []
+        segments = []
+        position = 0
+        for start, end in self.get_segments(text):
+            if pieces:
+                pieces.append(self.separator)
+                position += len(self.separator)
+            pieces.append(text[start:end])
+            segments.append((position, start, end - start))
+            position += end - start
+        return PrefilteredText(text="".join(pieces), segments=segments)
+
+
+def read_annotated_training_set(
+    path: str | Path = TRAINING_SET_PATH,
+) -> tuple[str, list[tuple[int, int]], list[tuple[int, int, str]]]:
+    """
+    read the text, the (start, end) of its filings and the (start, end, label) of the
+    annotated spans of an INCEpTION UIMA CAS XMI export, zipped or not.
+    """
+    path = Path(path)
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path) as archive:
+            names = [name for name in archive.namelist() if name.endswith(".xmi")]
+            if len(names) != 1:
+                raise ValueError(f"expected one .xmi file in {path}, found: {names}")
+            root = ElementTree.fromstring(archive.read(names[0]))
+    else:
+        root = ElementTree.parse(path).getroot()
+    text = None
+    filings = []
+    spans = []
+    for element in root:
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "Sofa":
+            text = element.get("sofaString")
+        elif tag == "Sentence":
+            filings.append((int(element.get("begin")), int(element.get("end"))))
+        elif tag == "Span":
+            spans.append((int(element.get("begin")), int(element.get("end")), element.get("Labels")))
+    if text is None:
+        raise ValueError(f"no text (Sofa) found in {path}")
+    return text, filings, spans
+
+
+def get_prefilter_recall(
+    prefilter: SentencePrefilter,
+    labels: tuple[str] = ("Security", "securityAmount"),
+    path: str | Path = TRAINING_SET_PATH,
+) -> dict:
+    """
+    measure the prefilter on the annotated training set, filing by filing.
+
+    Returns:
+        {"recall": {label: share of the annotated spans inside a kept segment},
+         "kept": share of the characters kept}
+    """
+    text, filings, spans = read_annotated_training_set(path)
+    found = {label: 0 for label in labels}
+    total = {label: 0 for label in labels}
+    kept_chars = 0
+    for filing_start, filing_end in filings:
+        segments = [
+            (filing_start + start, filing_start + end)
+            for start, end in prefilter.get_segments(text[filing_start:filing_end])
+        ]
+        kept_chars += sum(end - start for start, end in segments)
+        for start, end, label in spans:
+            if (label not in total) or not (filing_start <= start < filing_end):
+                continue
+            total[label] += 1
+            if any((s <= start) and (end <= e) for s, e in segments):
+                found[label] += 1
+    return {
+        "recall": {label: found[label] / total[label] if total[label] else None for label in labels},
+        "kept": kept_chars / sum(end - start for start, end in filings),
+    }
@@ -0,0 +1,416 @@
+import logging
+import weakref
+from bisect import bisect_right
+from pathlib import Path
+from typing import Callable
+from bs4 import BeautifulSoup, NavigableString, CData, element
+
+logger = logging.getLogger(__name__)
+
+'''
+Parse-once representation of a html filing.
+
+The filing is tokenized a single time into a HTMDocument. Sections (and the
+tables in them) of the filing, or of every prospectus in a multi-prospectus
+filing, are HTMDocumentRanges over that one tree instead of reparsed copies of
+their html.
+'''
+
+# bs4 features (or our own name for parsers not registered with bs4)
+# that can be used to build the soup of a filing.
+HTML_PARSE_BACKENDS = {
+    "html5lib": "html5lib",
+    "lxml": "lxml",
+    "html5-parser": None,
+}
+DEFAULT_HTML_PARSE_BACKEND = "html5lib"
+# backends which record sourceline/sourcepos on the elements themselves
+HTML_PARSE_BACKENDS_WITH_SOURCE_POSITIONS = set(["html5lib"])
+
+# string types that count as text content, same as bs4 get_text
+TEXT_STRING_TYPES = (NavigableString, CData)
+
+# attributes links inside the document point to, indexed by HTMDocumentIndex
+ANCHOR_ATTRIBUTES = ("id", "name")
+
+# HTMDocuments by the id of their soup, see HTMDocument.of
+_documents_by_soup_id = weakref.WeakValueDictionary()
+
+
+def make_soup_with_backend(doc: str, backend: str = DEFAULT_HTML_PARSE_BACKEND) -> BeautifulSoup:
+    """
+    parse html doc into a BeautifulSoup with the given parse backend.
+
+    Backends that dont record element positions get document ordered
+    sourceline/sourcepos values assigned, see _annotate_source_positions.
+
+    Raises:
+        ValueError: if the backend is unknown or not installed
+    """
+    if backend not in HTML_PARSE_BACKENDS.keys():
+        raise ValueError(
+            f"unknown parse backend: {backend}. choose one of: {list(HTML_PARSE_BACKENDS.keys())}"
+        )
+    if backend == "html5-parser":
+        try:
+            import html5_parser
+        except (ImportError, RuntimeError) as e:
+            # html5_parser raises RuntimeError on a libxml2 version mismatch with lxml
+            raise ValueError(f"parse backend html5-parser isnt usable: {e}")
+        soup = html5_parser.parse(doc, treebuilder="soup", return_root=False)
+    else:
+        soup = BeautifulSoup(doc, features=HTML_PARSE_BACKENDS[backend])
+    if (soup.next_element is None) and (soup.contents != []):
+        # not every treebuilder links the soup to its first element
+        # (eg: lxml or a leading doctype), which breaks soup.find_all_next
+        soup.next_element = soup.contents[0]
+    if backend not in HTML_PARSE_BACKENDS_WITH_SOURCE_POSITIONS:
+        _annotate_source_positions(soup)
+    return soup
+
+
+def _annotate_source_positions(soup: BeautifulSoup):
+    """
+    set sourceline and sourcepos on every tag of a soup whose parse backend
+    didnt record them.
+
+    sourceline is the line of the tag, counted by the newlines in the strings
+    preceding it. sourcepos is the ordinal of the tag within that line, so
+    sorting by (sourceline, sourcepos) gives the document order.
+    """
+    line = 1
+    pos = 0
+    for ele in soup.descendants:
+        if isinstance(ele, NavigableString):
+            newlines = ele.count("\n")
+            if newlines > 0:
+                line += newlines
+                pos = 0
+        else:
+            ele.sourceline = line
+            ele.sourcepos = pos
+            pos += 1
+
+
+class HTMDocument:
+    """
+    A html filing parsed once.
+
+    Usage::
+
+            document = HTMDocument.from_file(path_to/filing.htm, backend="lxml")
+            section = document.get_range(start_ele, stop_ele)
+            tables = section.find_all("table")
+
+    Args:
+        soup: the parsed filing
+        backend: parse backend the soup was created with
+    """
+
+    def __init__(self, soup: BeautifulSoup, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        self.soup = soup
+        self.backend = backend
+        self._html = None
+        self._index = None
+        _documents_by_soup_id[id(soup)] = self
+
+    @classmethod
+    def from_html(cls, html: str, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        """parse html into a HTMDocument."""
+        return cls(make_soup_with_backend(html, backend), backend=backend)
+
+    @classmethod
+    def from_file(cls, path: str, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        """read and parse the file at path into a HTMDocument."""
+        with open(Path(path), "r", encoding="utf-8") as f:
+            return cls.from_html(f.read(), backend=backend)
+
+    @classmethod
+    def of(cls, doc, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        """
+        get the HTMDocument of doc.
+
+        Args:
+            doc: a HTMDocument, or a soup. If the soup isnt part of a HTMDocument yet
+                 a new HTMDocument wrapping it is created.
+        """
+        if isinstance(doc, HTMDocument):
+            return doc
+        if not isinstance(doc, BeautifulSoup):
+            raise TypeError(f"expecting HTMDocument or BeautifulSoup, got: {type(doc)}")
+        document = _documents_by_soup_id.get(id(doc))
+        if (document is None) or (document.soup is not doc):
+            document = cls(doc, backend=backend)
+        return document
+
+    @property
+    def html(self) -> str:
+        """the serialized html of the tree, created on first access."""
+        if self._html is None:
+            if self._index is not None:
+                self._html = self._index.html
+            else:
+                self._html = str(self.soup)
+        return self._html
+
+    @property
+    def index(self):
+        """the HTMDocumentIndex of the tree, created on first access.
+
+        the tree shouldnt be modified after the index was created."""
+        if self._index is None:
+            self._index = HTMDocumentIndex(self.soup)
+        return self._index
+
+    def __str__(self):
+        return self.html
+
+    def get_range(self, start: element.PageElement, stop: element.PageElement = None):
+        """get the HTMDocumentRange from start up to (excluding) stop."""
+        return HTMDocumentRange(self, start, stop)
+
+
+class HTMDocumentIndex:
+    """
+    Character offsets of every tag and string of a soup in its serialized
+    html (str(soup)), built in one traversal of the tree.
+
+    Usage::
+
+            index = HTMDocumentIndex(soup)
+            start, end = index.get_span(ele)
+            ele_after = index.find_next_after(end)
+            target = index.get_anchor(href[1:])
+
+    Args:
+        soup: the tree to index
+        formatter: bs4 formatter used for the serialization, same as str(soup)
+    """
+
+    def __init__(self, soup: BeautifulSoup, formatter: str = "minimal"):
+        # nodes in document order, with their start and end offset at the same position
+        self.nodes = []
+        self.starts = []
+        self.ends = []
+        self._ordinals = {}
+        # ordinal of the first tag with a given value of the attribute, per attribute
+        self._anchors = {attr: {} for attr in ANCHOR_ATTRIBUTES}
+        self.html = self._build(soup, formatter)
+
+    def _build(self, soup: BeautifulSoup, formatter: str) -> str:
+        """serialize soup like bs4 Tag.decode does, recording the offsets of each node."""
+        formatter = soup.formatter_for_name(formatter)
+        encoding = element.DEFAULT_OUTPUT_ENCODING
+        nodes, starts, ends, ordinals = self.nodes, self.starts, self.ends, self._ordinals
+        anchors = self._anchors
+        pieces = []
+        pos = 0
+        open_tags = []
+        for ele in soup.descendants:
+            parent = ele.parent
+            while open_tags and (open_tags[-1][0] is not parent):
+                tag, ordinal = open_tags.pop()
+                piece = tag._format_tag(encoding, formatter, opening=False)
+                pieces.append(piece)
+                pos += len(piece)
+                ends[ordinal] = pos
+            ordinal = len(nodes)
+            nodes.append(ele)
+            starts.append(pos)
+            ends.append(None)
+            ordinals[id(ele)] = ordinal
+            if isinstance(ele, element.Tag):
+                if ele.attrs:
+                    for attr, targets in anchors.items():
+                        value = ele.attrs.get(attr)
+                        if value is not None:
+                            if not isinstance(value, str):
+                                value = " ".join(value)
+                            targets.setdefault(value, ordinal)
+                piece = ele._format_tag(encoding, formatter, opening=True)
+                pieces.append(piece)
+                pos += len(piece)
+                if ele.is_empty_element:
+                    ends[ordinal] = pos
+                else:
+                    open_tags.append((ele, ordinal))
+            else:
+                piece = ele.output_ready(formatter)
+                pieces.append(piece)
+                pos += len(piece)
+                ends[ordinal] = pos
+        while open_tags:
+            tag, ordinal = open_tags.pop()
+            piece = tag._format_tag(encoding, formatter, opening=False)
+            pieces.append(piece)
+            pos += len(piece)
+            ends[ordinal] = pos
+        return "".join(pieces)
+
+    def __contains__(self, ele: element.PageElement):
+        ordinal = self._ordinals.get(id(ele))
+        return (ordinal is not None) and (self.nodes[ordinal] is ele)
+
+    def get_ordinal(self, ele: element.PageElement) -> int:
+        """
+        get the position of ele in document order.
+        
+        Raises:
+            ValueError: if ele isnt part of the indexed tree
+        """
+        ordinal = self._ordinals.get(id(ele))
+        if (ordinal is None) or (self.nodes[ordinal] is not ele):
+            raise ValueError("element isnt part of the indexed document")
+        return ordinal
+
+    def get_span(self, ele: element.PageElement) -> tuple[int, int]:
+        """
+        get the span (start, end) of ele in the serialized html.
+        
+        Raises:
+            ValueError: if ele isnt part of the indexed tree
+        """
+        ordinal = self.get_ordinal(ele)
+        return (self.starts[ordinal], self.ends[ordinal])
+
+    def find_next_after(self, pos: int, filter: Callable = None) -> element.PageElement | None:
+        """
+        get the first node starting after the offset pos, for which filter
+        returns True if filter is given.
+        """
+        for ordinal in range(bisect_right(self.starts, pos), len(self.nodes)):
+            ele = self.nodes[ordinal]
+            if (filter is None) or (filter(ele) is True):
+                return ele
+        return None
+
+    def get_anchor(self, name_or_id: str, attrs: tuple[str] = ("id", "name")) -> element.Tag | None:
+        """
+        get the first tag in document order whose attribute equals name_or_id,
+        same as soup.find(attrs={attr: name_or_id}). the attributes are checked
+        in the order of attrs, each has to be one of ANCHOR_ATTRIBUTES.
+        """
+        for attr in attrs:
+            ordinal = self._anchors[attr].get(name_or_id)
+            if ordinal is not None:
+                return self.nodes[ordinal]
+        return None
+
+    def get_anchors(self, names_or_ids: list[str], attrs: tuple[str] = ("id", "name")) -> list[tuple[str, element.Tag]]:
+        """
+        resolve names_or_ids at once with get_anchor.
+
+        Returns:
+            (name_or_id, tag) of the resolved anchors sorted by their position in
+            the document, unresolved anchors are left out.
+        """
+        resolved = []
+        for name_or_id in names_or_ids:
+            tag = self.get_anchor(name_or_id, attrs)
+            if tag is not None:
+                resolved.append((name_or_id, tag))
+        return sorted(resolved, key=lambda x: self._ordinals[id(x[1])])
+
+    def is_between(self, ele: element.PageElement, x1: int, x2: int) -> bool:
+        """check if the span of ele lies within the offsets x1 and x2."""
+        start, end = self.get_span(ele)
+        return (x1 <= start) and (end <= x2)
+
+
+class HTMDocumentRange:
+    """
+    The nodes of a HTMDocument from start (inclusive) up to stop (exclusive)
+    in document order. Ancestors of start arent part of the range.
+
+    Stands in for the soup of a section: elements can be replaced in the
+    view of the range without modifying the shared tree (see replace_element).
+
+    Args:
+        document: the HTMDocument the nodes belong to
+        start: first node of the range
+        stop: first node after the range, None if the range extends to the end
+              of the document
+    """
+
+    def __init__(
+        self,
+        document: HTMDocument,
+        start: element.PageElement,
+        stop: element.PageElement = None,
+    ):
+        self.document = document
+        self.start = start
+        self.stop = stop
+        self.replaced = {}
+
+    @classmethod
+    def of_element(cls, ele: element.Tag, document: HTMDocument = None):
+        """get the range over ele and its descendants."""
+        return cls(document, ele, ele._last_descendant().next_element)
+
+    def __iter__(self):
+        """iterate over all nodes of the range in document order."""
+        ele = self.start
+        stop = self.stop
+        while (ele is not None) and (ele is not stop):
+            yield ele
+            ele = ele.next_element
+
+    def find_all(self, name: str | list[str]) -> list[element.Tag]:
+        """get all tags of name (or any of the names) in the range."""
+        names = set([name]) if isinstance(name, str) else set(name)
+        return [
+            ele
+            for ele in self
+            if isinstance(ele, element.Tag) and (ele.name in names)
+        ]
+
+    def replace_element(self, ele: element.Tag, replacement: element.Tag):
+        """
+        replace ele with replacement in the view of this range.
+        
+        The shared tree isnt modified, text of the range is taken from
+        replacement instead of ele.
+        """
+        self.replaced[id(ele)] = (ele, replacement)
+
+    def _skip_subtree(self, tag: element.Tag) -> element.PageElement:
+        """get the node after the subtree of tag, or stop if stop is inside it."""
+        stop = self.stop
+        if stop is not None:
+            for parent in stop.parents:
+                if parent is tag:
+                    return stop
+        return tag._last_descendant().next_element
+
+    def iter_strings(self, exclude: list[str] = []):
+        """
+        iterate over the text strings in the range in document order.
+
+        Args:
+            exclude: names of tags whose subtree is skipped
+        """
+        exclude = set(exclude) if exclude is not None else set()
+        replaced = self.replaced
+        stop = self.stop
+        ele = self.start
+        while (ele is not None) and (ele is not stop):
+            if isinstance(ele, element.Tag):
+                if id(ele) in replaced:
+                    for string in replaced[id(ele)][1].strings:
+                        yield string
+                    ele = self._skip_subtree(ele)
+                    continue
+                if ele.name in exclude:
+                    ele = self._skip_subtree(ele)
+                    continue
+            elif type(ele) in TEXT_STRING_TYPES:
+                yield ele
+            ele = ele.next_element
+
+    def get_text(self, separator: str = "", strip: bool = False, exclude: list[str] = []) -> str:
+        """get the text of the range, same as bs4 get_text but skipping the excluded tags."""
+        if strip is True:
+            strings = (s.strip() for s in self.iter_strings(exclude))
+            return separator.join(s for s in strings if s)
+        return separator.join(self.iter_strings(exclude))
@@ -0,0 +1,186 @@
+import html
+import logging
+import mmap
+import os
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+'''
+Bounded memory access to very large html filings.
+
+Building the tree of a filing takes about SOUP_MEMORY_FACTOR times the size
+of the file, which runs out of memory for filings of a few ten MB when
+parsing in several workers. HTMFileStream memory-maps the file instead and
+finds the sections linked from the table of contents with regexes over the
+raw bytes. Only the html of a single section is decoded and parsed when it
+is accessed.
+'''
+
+# peak memory of parsing and indexing a filing relative to its file size,
+# measured on the S-3 test filings (lxml ~25, html5lib ~30)
+SOUP_MEMORY_FACTOR = 30
+
+RE_TOC_HEADER = re.compile(rb"table\W{0,3}of\W{0,3}contents", re.I)
+RE_LINK = re.compile(
+    rb"<a\b[^>]*?\bhref\s*=\s*[\"']#([^\"']+)[\"'][^>]*>(.{0,10000}?)</a\s*>", re.I | re.DOTALL
+)
+RE_ANCHOR_ATTRIBUTE = re.compile(rb"<[a-z][^>]*?\b(?:id|name)\s*=\s*[\"']([^\"']+)[\"']", re.I)
+RE_LINK_START = re.compile(rb"<a\b[^>]*?\bhref\s*=\s*[\"']#([^\"']+)[\"']", re.I)
+RE_TAG = re.compile(rb"<[^>]*>")
+
+
+def estimate_parse_memory(path: str) -> int:
+    """estimated peak memory in bytes of parsing the html file at path into a HTMDocument."""
+    return os.path.getsize(path) * SOUP_MEMORY_FACTOR
+
+
+class HTMFileStream:
+    """
+    Memory-mapped html file.
+
+    Usage::
+
+            with HTMFileStream(path) as stream:
+                for title, start, end in stream.find_toc_sections():
+                    html = stream.read(start, end)
+
+    Args:
+        path: path of the html file.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        # an empty file cant be mapped
+        self.buffer = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.size > 0
+            else b""
+        )
+        # start offsets of the anchors found so far, by name
+        self._anchors = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self._file.close()
+
+    def read(self, start: int = 0, end: int = None) -> str:
+        """decode the bytes from start to end, with newlines translated like open(path, "r")."""
+        text = self.buffer[start:end].decode("utf-8")
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
+    def find_anchors(self, names: set[str]) -> dict[str, int]:
+        """
+        find the tags with an id or name attribute in names in one scan.
+
+        names found by an earlier call arent scanned for again.
+
+        Returns:
+            dict of name to the start offset of the first tag with that id or name.
+        """
+        positions = {name: self._anchors[name] for name in names if name in self._anchors}
+        if len(positions) == len(names):
+            return positions
+        for match in RE_ANCHOR_ATTRIBUTE.finditer(self.buffer):
+            name = html.unescape(match.group(1).decode("utf-8", errors="replace"))
+            if (name in names) and (name not in positions):
+                positions[name] = match.start()
+                if len(positions) == len(names):
+                    break
+        self._anchors.update(positions)
+        return positions
+
+    def find_toc_start(self) -> int | None:
+        """
+        get the offset of the table of contents.
+
+        if the first mention of the table of contents is a link (eg in a page
+        header) the offset of its target is returned instead.
+        """
+        match = RE_TOC_HEADER.search(self.buffer)
+        if match is None:
+            return None
+        link_start = self.buffer.rfind(b"<a", 0, match.start())
+        if (link_start != -1) and (self.buffer.find(b"</a", link_start, match.start()) == -1):
+            link = RE_LINK_START.match(self.buffer, link_start)
+            if link is not None:
+                name = html.unescape(link.group(1).decode("utf-8", errors="replace"))
+                target = self.find_anchors(set([name])).get(name)
+                if target is not None:
+                    return target
+        return match.start()
+
+    def find_toc_sections(self) -> list[tuple[str, int, int]]:
+        """
+        find the sections linked from the table of contents.
+
+        the links from the first table after the start of the table of contents
+        up to the first linked section are the toc entries. each section spans from the tag its
+        entry links to up to the next section, the last up to the end of the file.
+
+        Returns:
+            list of (lowercased toc title, start offset, end offset) in document
+            order or [] if there is no table of contents with links.
+        """
+        toc_start = self.find_toc_start()
+        if toc_start is None:
+            return []
+        # like the tree based split the toc entries start in the first table after the toc
+        toc_table_end = self.buffer.find(b"</table", self.buffer.find(b"<table", toc_start))
+        if toc_table_end == -1:
+            return []
+        # resolve the links of the toc table in one scan, the first section starts at the
+        # closest target after the toc, links back to the toc (eg in page headers) dont start one
+        entries = self._get_toc_entries(toc_start, toc_table_end)
+        positions = {
+            name: start for name, start in self.find_anchors(set(entries.keys())).items()
+            if start > toc_start
+        }
+        if positions == {}:
+            return []
+        first_target = min(positions.values())
+        # the toc can continue after the first table (eg over a page break) up to the first section
+        extra_entries = {
+            name: title
+            for name, title in self._get_toc_entries(toc_table_end, first_target).items()
+            if name not in entries
+        }
+        if extra_entries != {}:
+            entries.update(extra_entries)
+            positions.update(self.find_anchors(set(extra_entries.keys())))
+        for name in entries.keys() - positions.keys():
+            logger.debug(f"no anchor after the toc found for toc entry: #{name}")
+        starts = sorted(
+            (start, entries[name]) for name, start in positions.items() if start > toc_start
+        )
+        sections = []
+        for idx, (start, title) in enumerate(starts):
+            end = starts[idx + 1][0] if idx + 1 < len(starts) else self.size
+            sections.append((title, start, end))
+        return sections
+
+    def _get_toc_entries(self, start: int, end: int) -> dict[str, str]:
+        """get the names the links starting between start and end point to and the text of their first link."""
+        entries = {}
+        for link in RE_LINK.finditer(self.buffer, start):
+            if link.start() >= end:
+                break
+            name = html.unescape(link.group(1).decode("utf-8", errors="replace"))
+            if name not in entries:
+                entries[name] = _get_link_text(link.group(2))
+        return entries
+
+
+def _get_link_text(content: bytes) -> str:
+    text = html.unescape(RE_TAG.sub(b" ", content).decode("utf-8", errors="replace"))
+    return " ".join(text.split()).lower()
@@ -0,0 +1,213 @@
+import logging
+import re
+from collections import defaultdict
+from bs4 import element
+
+logger = logging.getLogger(__name__)
+
+'''
+Selection of elements by their inline styling in one walk over the tree.
+
+Finding headers by style runs a couple dozen css selectors over the whole
+document, selecting each of them on its own walks the tree once per selector.
+HTMStyleScanner compiles the selectors once, reads the attributes of an element
+into a StyleRecord the first time they are needed and matches all selectors
+in a single walk.
+
+Only the subset of css the header selectors use is supported: tag names,
+[attr='value'] and [attr*='value'] with an optional i flag, the descendant
+and the child combinator.
+'''
+
+RE_SELECTOR_ATTRIBUTE = re.compile(
+    r"\[\s*(?P<attr>[\w-]+)\s*(?P<op>\*=|=)\s*'(?P<value>[^']*)'\s*(?P<case>i)?\s*\]"
+)
+RE_SELECTOR_TAG_NAME = re.compile(r"[a-zA-Z][\w-]*")
+
+
+class StyleSelector:
+    """
+    compiled css selector, see the module docstring for the supported subset.
+
+    Args:
+        css: the selector string, eg: "[style*='text-align: center' i] > strong"
+    """
+
+    def __init__(self, css: str):
+        self.css = css
+        self.steps, self.combinators = _parse_selector(css)
+        self.attributes = set(
+            attr for _, conditions in self.steps for attr, _, _, _ in conditions
+        )
+
+    @property
+    def tag_name(self) -> str | None:
+        """tag name of the selected elements or None if it selects any tag."""
+        return self.steps[-1][0]
+
+    def __repr__(self):
+        return f"StyleSelector({self.css!r})"
+
+
+class StyleRecord:
+    """attribute values of an element needed by the selectors, as is and lowercased."""
+
+    __slots__ = ("name", "values", "lower_values")
+
+    def __init__(self, tag: element.Tag, attributes: set[str]):
+        self.name = tag.name.lower() if tag.name else tag.name
+        self.values = {}
+        self.lower_values = {}
+        for attr in attributes:
+            value = tag.attrs.get(attr)
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                value = " ".join(value)
+            self.values[attr] = value
+            self.lower_values[attr] = value.lower()
+
+
+class HTMStyleScanner:
+    """
+    Selects the elements matching any of the selectors in one walk.
+
+    Usage::
+
+            scanner = HTMStyleScanner(["b > u", "[align='center' i] b"])
+            selected = scanner.select(soup)
+            selected["b > u"]  # elements in document order
+
+    Args:
+        selectors: css selectors of the supported subset.
+    """
+
+    def __init__(self, selectors: list[str]):
+        self.selectors = [StyleSelector(s) for s in dict.fromkeys(selectors)]
+        self.attributes = set()
+        for selector in self.selectors:
+            self.attributes |= selector.attributes
+        self._by_tag_name = defaultdict(list)
+        self._any_tag_name = []
+        for selector in self.selectors:
+            if selector.tag_name is None:
+                self._any_tag_name.append(selector)
+            else:
+                self._by_tag_name[selector.tag_name].append(selector)
+        self._records = {}
+
+    def select(self, start_ele: element.Tag) -> dict[str, list[element.Tag]]:
+        """
+        get the descendants of start_ele matching each selector.
+
+        Returns:
+            dict of the css of the selector to the matching elements in document order.
+        """
+        selected = {selector.css: [] for selector in self.selectors}
+        for tag in start_ele.descendants:
+            if not isinstance(tag, element.Tag):
+                continue
+            record = self._get_record(tag)
+            for selector in self._by_tag_name.get(record.name, []):
+                if self._matches(tag, record, selector, len(selector.steps) - 1):
+                    selected[selector.css].append(tag)
+            for selector in self._any_tag_name:
+                if self._matches(tag, record, selector, len(selector.steps) - 1):
+                    selected[selector.css].append(tag)
+        return selected
+
+    def _get_record(self, tag: element.Tag) -> StyleRecord:
+        key = id(tag)
+        record = self._records.get(key)
+        if record is None:
+            record = StyleRecord(tag, self.attributes)
+            # keep a reference to the tag so its id cant be reused while cached
+            self._records[key] = (record, tag)
+            return record
+        return record[0]
+
+    def _matches(
+        self, tag: element.Tag, record: StyleRecord, selector: StyleSelector, step_idx: int
+    ) -> bool:
+        if not _matches_step(record, selector.steps[step_idx]):
+            return False
+        if step_idx == 0:
+            return True
+        parent = tag.parent
+        if selector.combinators[step_idx - 1] == ">":
+            return (parent is not None) and self._matches(
+                parent, self._get_record(parent), selector, step_idx - 1
+            )
+        while parent is not None:
+            if self._matches(parent, self._get_record(parent), selector, step_idx - 1):
+                return True
+            parent = parent.parent
+        return False
+
+
+def _matches_step(record: StyleRecord, step: tuple) -> bool:
+    name, conditions = step
+    if (name is not None) and (name != record.name):
+        return False
+    for attr, op, value, case_insensitive in conditions:
+        values = record.lower_values if case_insensitive else record.values
+        attr_value = values.get(attr)
+        if attr_value is None:
+            return False
+        if op == "*=":
+            if value not in attr_value:
+                return False
+        # like css matching of '=', a trailing newline of the attribute is ignored
+        elif (attr_value != value) and (attr_value != value + "\n"):
+            return False
+    return True
+
+
+def _parse_selector(css: str) -> tuple[list[tuple], list[str]]:
+    """
+    parse css into its steps from the outermost to the selected element and
+    the combinators between them.
+    """
+    steps = []
+    combinators = []
+    pos = 0
+    pending_combinator = None
+    while pos < len(css):
+        if css[pos].isspace():
+            pos += 1
+            continue
+        if css[pos] == ">":
+            pending_combinator = ">"
+            pos += 1
+            continue
+        name = None
+        match = RE_SELECTOR_TAG_NAME.match(css, pos)
+        if match:
+            name = match.group().lower()
+            pos = match.end()
+        conditions = []
+        match = RE_SELECTOR_ATTRIBUTE.match(css, pos)
+        while match:
+            case_insensitive = match.group("case") is not None
+            value = match.group("value")
+            conditions.append(
+                (
+                    match.group("attr").lower(),
+                    match.group("op"),
+                    value.lower() if case_insensitive else value,
+                    case_insensitive,
+                )
+            )
+            pos = match.end()
+            match = RE_SELECTOR_ATTRIBUTE.match(css, pos)
+        if (name is None) and (conditions == []):
+            raise ValueError(f"unsupported selector: {css}, stopped at position {pos}")
+        if steps != []:
+            combinators.append(pending_combinator or " ")
+        elif pending_combinator is not None:
+            raise ValueError(f"selector cant start with a combinator: {css}")
+        pending_combinator = None
+        steps.append((name, conditions))
+    if steps == [] or pending_combinator is not None:
+        raise ValueError(f"unsupported selector: {css}")
+    return steps, combinators
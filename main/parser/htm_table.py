@@ -0,0 +1,175 @@
+import logging
+from typing import Callable
+import numpy as np
+from bs4 import element
+
+logger = logging.getLogger(__name__)
+
+'''
+Grid representation of html tables.
+
+A <table> is read into a HTMTable in one pass over its rows and cells. The
+cleanup steps run on the whole grid at once instead of field by field,
+the nested lists the rest of the parser works with are a view created with
+tolist().
+'''
+
+# fields which count as empty when cleaning a table
+EMPTY_FIELDS = ["", "None", None, " ", "\u200b"]
+
+
+class HTMTable:
+    """
+    Dense grid of the field contents of a html table.
+
+    Usage::
+
+            table = HTMTable.from_element(table_element, get_text=parser.get_element_text_content)
+            cleaned = table.apply_to_strings(parser.preprocess_text).drop_empty_columns()
+            rows = cleaned.tolist()
+
+    Args:
+        cells: 2d array or nested lists of shape (rows, columns). fields are
+               strings or None.
+    """
+
+    def __init__(self, cells: np.ndarray | list[list]):
+        if not isinstance(cells, np.ndarray):
+            cells = _to_object_array(cells)
+        self.cells = cells
+
+    @classmethod
+    def from_element(
+        cls,
+        htmltable: element.Tag,
+        get_text: Callable,
+        header: bool = None,
+        colspan_mode: str = "separate",
+        merge_delimiter: str = " ",
+    ):
+        """
+        read the fields of htmltable into a HTMTable.
+
+        with a header the columns are given by the colspans of the <th> fields
+        (or the first row if there arent any <th>) and the header texts are
+        repeated over their colspan. without a header every <td> of a row is
+        its own column.
+
+        Args:
+            get_text: function returning the text content of a field element
+            header: parse with or without header, if None use a header if the
+                    table has <th> fields or a first row with text content.
+            colspan_mode: "separate" keeps each <td> of a colspan header in its
+                          own column, "merge" joins them with merge_delimiter
+                          into the one column of the header.
+        """
+        rows = htmltable.find_all("tr")
+        fields = [[get_text(td) for td in row.find_all("td")] for row in rows]
+        th_fields = htmltable.find_all("th")
+        if header is None:
+            if th_fields != []:
+                header = True
+            else:
+                header = (fields != []) and any(f != "" for f in fields[0])
+        if header is False:
+            amount_columns = max([len(row) for row in fields], default=0)
+            cells = np.full((len(rows), amount_columns), None, dtype=object)
+            for row_idx, row in enumerate(fields):
+                cells[row_idx, : len(row)] = row
+            return cls(cells)
+
+        if th_fields != []:
+            header_elements = th_fields
+        else:
+            header_elements = rows[0].find_all("td")
+        header_texts = [get_text(h) for h in header_elements]
+        colspans = [_get_colspan(h) for h in header_elements]
+        body = fields[1:]
+        if colspan_mode == "merge":
+            merged_body = []
+            for row in body:
+                merged_row = []
+                colspan_offset = 0
+                for idx, colspan in enumerate(colspans):
+                    unmerged_idx = idx + colspan_offset
+                    merged_row.append(
+                        merge_delimiter.join(row[unmerged_idx : (unmerged_idx + colspan)])
+                    )
+                    colspan_offset += colspan - 1
+                merged_body.append(merged_row)
+            body = merged_body
+            colspans = [1] * len(colspans)
+        elif colspan_mode != "separate":
+            raise ValueError(f"unknown colspan_mode: {colspan_mode}")
+        # the header of a colspan > 1 column is written to the first colspan - 1
+        # of its fields, the last one stays empty
+        header_row = []
+        for h, colspan in zip(header_texts, colspans):
+            if colspan > 1:
+                header_row += [h] * (colspan - 1) + [None]
+            else:
+                header_row.append(h)
+        amount_columns = max(
+            [sum(colspans), len(header_row)] + [len(row) for row in body]
+        )
+        cells = np.full((len(rows), amount_columns), None, dtype=object)
+        if len(rows) == 0:
+            return cls(cells)
+        cells[0, : len(header_row)] = header_row
+        for row_idx, row in enumerate(body):
+            cells[row_idx + 1, : len(row)] = row
+        return cls(cells)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.cells.shape
+
+    def __len__(self):
+        return self.cells.shape[0]
+
+    def __repr__(self):
+        return f"HTMTable({self.tolist()})"
+
+    def tolist(self) -> list[list]:
+        """the fields as nested lists, one list per row."""
+        return self.cells.tolist()
+
+    def apply_to_strings(self, func: Callable):
+        """get a new HTMTable with func applied to every string field."""
+        if self.cells.size == 0:
+            return HTMTable(self.cells.copy())
+        apply = np.frompyfunc(lambda f: func(f) if isinstance(f, str) else f, 1, 1)
+        return HTMTable(apply(self.cells).astype(object))
+
+    def get_empty_mask(self, empty_fields: list = EMPTY_FIELDS) -> np.ndarray:
+        """get a boolean array which is True where the field is one of empty_fields."""
+        empty_fields = set(empty_fields)
+        if self.cells.size == 0:
+            return np.zeros(self.cells.shape, dtype=bool)
+        is_empty = np.frompyfunc(lambda f: f in empty_fields, 1, 1)
+        return is_empty(self.cells).astype(bool)
+
+    def drop_empty_columns(self, empty_fields: list = EMPTY_FIELDS):
+        """get a new HTMTable without the columns consisting only of empty_fields."""
+        keep = ~self.get_empty_mask(empty_fields).all(axis=0)
+        return HTMTable(self.cells[:, keep])
+
+    def drop_empty_rows(self, empty_fields: list = ["", None]):
+        """get a new HTMTable without the rows consisting only of empty_fields."""
+        keep = ~self.get_empty_mask(empty_fields).all(axis=1)
+        return HTMTable(self.cells[keep, :])
+
+
+def _to_object_array(rows: list[list]) -> np.ndarray:
+    """create a 2d object array from nested lists, padding short rows with None."""
+    amount_columns = max([len(row) for row in rows], default=0)
+    cells = np.full((len(rows), amount_columns), None, dtype=object)
+    for row_idx, row in enumerate(rows):
+        cells[row_idx, : len(row)] = row
+    return cells
+
+
+def _get_colspan(field: element.Tag) -> int:
+    if "colspan" in field.attrs:
+        return int(field["colspan"])
+    return 1
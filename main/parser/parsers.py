@@ -10,12 +10,35 @@ import pandas as pd
 from bs4 import BeautifulSoup, NavigableString, element
 import re
 from abc import ABC, abstractmethod
-import copy
-import uuid
+from functools import partial
 from xml.etree import ElementTree
 
 from main.parser.filings_base import FilingSection, Filing, FilingSection
 from main.parser.extractors import extractor_factory
+from main.parser.htm_document import (
+    HTML_PARSE_BACKENDS,
+    DEFAULT_HTML_PARSE_BACKEND,
+    HTML_PARSE_BACKENDS_WITH_SOURCE_POSITIONS,
+    make_soup_with_backend,
+    HTMDocument,
+    HTMDocumentRange,
+    HTMDocumentIndex,
+)
+from main.parser.htm_table import HTMTable
+from main.parser.toc_matcher import TOCTitleMatcher
+from main.parser.htm_style import HTMStyleScanner
+from main.parser.anchored_regex import AnchoredPattern
+from main.parser.regex_guard import GuardedPattern, RegexBudgetExceeded, budget_handler, regex_budget
+from main.parser.htm_stream import HTMFileStream, SOUP_MEMORY_FACTOR, estimate_parse_memory
+from main.parser.section_index import SectionIndex, get_section_roles
+from main.parser.table_classifier import (
+    BASE_TABLE_RULES,
+    TableClassifier,
+    TableFeatureExtractor,
+    TableRule,
+    is_registration_table,
+    is_toc_table,
+)
 from bs4 import BeautifulSoup
 import logging
 import re
@@ -29,10 +52,18 @@ Notes:
       causes a problem with splitting into sections.
 '''
 
+# bump when a change to the parsers changes the sections or tables they create,
+# entries of the ParsedFilingCache written by another version are ignored.
+PARSER_VERSION = 2
+
 DATE_OF_REPORT_PATTERN = r"(?:(?:(?:Date(?:.?|\n?)of(?:.?|\n?)report(?:[^\d]){0,40})((?:(?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d))|(?:(?:(?:\d\d)|(?:[^\d]\d))(?:.){0,2}(?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d))))|(?:((?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d(?:\n{0,3}))(?:.){0,10}(?:date(?:.){0,3}of(?:.){0,3}report)))|(?:(?:(?:Date(?:[^\d]){0,5}of(?:[^\d]){0,20}report(?:[^\d]){0,40})(?:((?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d))|((?:(?:\d\d)|(?:[^\d]\d))(?:.){0,2}(?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d)))|(?:(?:(?:(?:(?:January)|(?:February)|(?:March)|(?:April)|(?:May)|(?:June)|(?:July)|(?:August)|(?:September)|(?:October)|(?:November)|(?:December))|(?:(?:Jan(?:(?:\D){0,4}))|(?:Feb(?:(?:\D){0,5}))|(?:Mar(?:(?:\D){0,2}))|(?:Apr(?:(?:\D){0,2}))|(?:May)|(?:Jun(?:(?:\D){0,1}))|(?:Jul(?:(?:\D){0,1}))|(?:Aug(?:(?:\D){0,4}))|(?:Sep(?:(?:\D){0,6}))|(?:Oct(?:(?:\D){0,4}))|(?:Nov(?:(?:\D){0,5}))|(?:Dec(?:(?:\D){0,6}))))(?:[^\d]){0,5}\d.(?:[^\d]){0,6}\d\d\d\d(?:\n{0,3}))(?:.){0,5}(?:Date(?:[^\d]){0,5}of(?:[^\d]){0,20}report))))"
 COMPILED_DATE_OF_REPORT_PATTERN = re.compile(
     DATE_OF_REPORT_PATTERN, re.I | re.MULTILINE | re.X | re.DOTALL
 )
+# every date of report match contains "date", only try the pattern around those
+ANCHORED_DATE_OF_REPORT_PATTERN = GuardedPattern(
+    AnchoredPattern(COMPILED_DATE_OF_REPORT_PATTERN, "date"), "DATE_OF_REPORT_PATTERN"
+)
 ITEMS_8K = {
     "Item1.01": r"Item(?:.){0,2}1\.01(?:.){0,2}Entry(?:.){0,2}into(?:.){0,2}a(?:.){0,2}Material(?:.){0,2}Definitive(?:.){0,2}Agreement",
     "Item1.02": r"Item(?:.){0,2}1\.02(?:.){0,2}Termination(?:.){0,2}of(?:.){0,2}a(?:.){0,2}Material(?:.){0,2}Definitive(?:.){0,2}Agreement",
@@ -135,6 +166,17 @@ REQUIRED_TOC_ITEMS_S3 = [
     re.compile(r"USE(\s*)OF(\s*)PROCEEDS", re.I),
 ]
 
+# rules of ParserS3.classify_table, applied to the features of a TableFeatureExtractor
+# with REGISTRATION_TABLE_HEADERS_S3 as header and REQUIRED_TOC_ITEMS_S3 as keyword patterns
+S3_TABLE_RULES = [
+    TableRule(
+        "registration_table",
+        partial(is_registration_table, n_header_patterns=len(REGISTRATION_TABLE_HEADERS_S3)),
+    ),
+    *BASE_TABLE_RULES,
+    TableRule("toc", partial(is_toc_table, n_keyword_patterns=len(REQUIRED_TOC_ITEMS_S3))),
+]
+
 TOC_ALTERNATIVES = {
     "principal stockholders": [
         "SECURITY OWNERSHIP OF CERTAIN BENEFICIAL OWNERS AND MANAGEMENT"
@@ -145,6 +187,9 @@ TOC_ALTERNATIVES = {
 IGNORE_HEADERS_BASED_ON_STYLE = set("TABLE OF CONTENTS")
 HEADERS_TO_DISCARD = ["(unaudited)"]
 
+# characters which arent whitespace for str.split but should be treated as such in text_only
+TEXT_ONLY_SPACE_TRANSLATION = str.maketrans({"\u200b": " "})
+
 RE_COMPILED = {
     "two_newlines_or_more": re.compile(r"(\n){2,}", re.MULTILINE),
     "one_newline": re.compile(r"(\n)", re.MULTILINE),
@@ -152,15 +197,27 @@ RE_COMPILED = {
 }
 
 
-def _add_unique_id_to_dict(target: dict, key: str = "UUID"):
-    """Add a UUID to the target.
+class ParseContext:
+    """
+    State of parsing a single document.
 
-    Returns:
-        a modified copy of target with a key that contains a string of a uuid4
+    parsers are shared by all filings (see ParserFactory.get_parser), so
+    anything created while parsing one document is kept here instead of on
+    the parser.
+
+    Args:
+        backend: parse backend of the document, one of HTML_PARSE_BACKENDS.
     """
-    target_copy = target.copy()
-    target_copy[key] = str(uuid.uuid4())
-    return target_copy
+
+    def __init__(self, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        self.backend = backend
+        self._empty_soup = None
+
+    def new_tag(self, name: str) -> element.Tag:
+        """create a new element, the soup to create them with is parsed on first use."""
+        if self._empty_soup is None:
+            self._empty_soup = make_soup_with_backend("", self.backend)
+        return self._empty_soup.new_tag(name)
 
 
 class AbstractFilingParser(ABC):
@@ -174,6 +231,14 @@ class AbstractFilingParser(ABC):
     def extension(cls):
         raise NotImplementedError
     
+    @classmethod
+    def compile_patterns(cls):
+        """
+        build the compiled patterns shared by all instances of the class,
+        called once when the parser is registered with a ParserFactory.
+        """
+        pass
+
     def parse(self, path: str):
         '''
         Convenince Method.
@@ -202,10 +267,22 @@ class AbstractFilingParser(ABC):
 
 
 class ParserFactory:
-    """helper factory to get the correct parser for form_type and extension, when creating Filings"""
+    """
+    helper factory to get the correct parser for form_type and extension, when creating Filings.
+
+    parsers keep no state of the documents they parse (see ParseContext), so
+    get_parser returns one shared instance per parser class and arguments.
+    """
 
-    def __init__(self, defaults: list[tuple] = [], default_fallbacks: bool = True):
+    def __init__(
+        self,
+        defaults: list[tuple] = [],
+        default_fallbacks: bool = True,
+        backend: str = DEFAULT_HTML_PARSE_BACKEND,
+    ):
         self.parsers = {}
+        self._instances = {}
+        self.set_backend(backend)
         if default_fallbacks is True:
             fallbacks = [(".htm", None, HTMFilingParser)]
             for each in fallbacks:
@@ -217,25 +294,42 @@ class ParserFactory:
     def register_parser(
         self, extension: str, form_type: str, parser: AbstractFilingParser
     ):
+        parser.compile_patterns()
         self.parsers[(extension, form_type)] = parser
 
+    def set_backend(self, backend: str):
+        """set the parse backend used by the html parsers this factory returns."""
+        if backend not in HTML_PARSE_BACKENDS.keys():
+            raise ValueError(
+                f"unknown parse backend: {backend}. choose one of: {list(HTML_PARSE_BACKENDS.keys())}"
+            )
+        self.backend = backend
+
     def get_parser(self, extension: str, form_type: str = None, **kwargs):
         parser = self.parsers.get((extension, form_type))
+        if not parser:
+            parser = self.parsers.get((extension, None))
         if parser:
-            return parser(**kwargs)
+            if issubclass(parser, HTMFilingParser) and (kwargs.get("backend") is None):
+                kwargs["backend"] = self.backend
+            key = (parser, tuple(sorted(kwargs.items())))
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = self._instances.setdefault(key, parser(**kwargs))
+            return instance
         else:
-            parser = self.parsers.get((extension, None))
-            if parser:
-                return parser()
-            else:
-                raise ValueError(
-                    f"no parser for combination of extension, form_type ({extension, form_type}) registered."
-                )
+            raise ValueError(
+                f"no parser for combination of extension, form_type ({extension, form_type}) registered."
+            )
 
 
 class FilingFactory:
     def __init__(self, default_fallbacks=False, defaults: list[tuple] = []):
         self.builders = {}
+        self.cache = None
+        # path: (stamp of the cache entry, create_filing returned a list) of the filings created from it, until update_cache
+        self._cache_entries = {}
+        self.max_filing_memory = None
         if default_fallbacks is True:
             self.init_fallbacks()
         if len(defaults) > 0:
@@ -256,31 +350,102 @@ class FilingFactory:
         """register a new builder for a combination of (form_type, extension)"""
         self.builders[(form_type, extension)] = builder
 
+    def set_cache(self, cache):
+        """
+        set a ParsedFilingCache to get already parsed filings from and to
+        store newly created filings in. None disables the cache.
+        """
+        self.cache = cache
+
+    def set_max_filing_memory(self, max_filing_memory: int | None):
+        """
+        set the memory ceiling in bytes for parsing a .htm filing. filings
+        estimated to need more are streamed instead if their builder and parser
+        only split them by the table of contents, see create_streamed_htm_filing.
+        None parses every filing as a whole.
+        """
+        self.max_filing_memory = max_filing_memory
+
     def create_filing(self, form_type: str, extension: str, **kwargs):
         """try and get a builder for given args and create the Filing"""
         logger.debug(
             f"args passed to create_filing: {form_type, extension}, kwargs: {kwargs}"
         )
+        if self.cache is None:
+            return self._build_filing(form_type, extension, **kwargs)
+        # hash the file once for the lookup and the new entry
+        stamp = self.cache.get_stamp(kwargs["path"])
+        filings = self.cache.get(form_type=form_type, extension=extension, stamp=stamp, **kwargs)
+        if filings is None:
+            filings = self._build_filing(form_type, extension, **kwargs)
+            self.cache.put(filings, form_type=form_type, extension=extension, stamp=stamp, **kwargs)
+        self._cache_entries[kwargs["path"]] = (stamp, isinstance(filings, list))
+        return filings
+
+    def update_cache(self, filings, form_type: str, extension: str, path: str):
+        """
+        store filings created by create_filing in the cache again, so the tables
+        and text_only of the sections extracted since are cached too.
+
+        Args:
+            filings: as returned by create_filing or wrapped in a list.
+        """
+        stamp, is_list = self._cache_entries.pop(path, (None, isinstance(filings, list)))
+        if self.cache is None:
+            return
+        if (not is_list) and isinstance(filings, list):
+            filings = filings[0]
+        self.cache.put(filings, form_type=form_type, extension=extension, path=path, stamp=stamp)
+
+    def _build_filing(self, form_type: str, extension: str, **kwargs):
         builder = self.builders.get((form_type, extension))
         if builder:
             logger.debug(f"using builder: {builder} with kwargs: {kwargs}")
-            return builder(form_type=form_type, extension=extension, **kwargs)
         else:
             builder = self.builders.get((None, extension))
             if builder:
                 logger.info(
                     f"Using a fallback value for the builder as no builder was registered for the given combination ({form_type},{extension}). fallback builder used: {builder}"
                 )
-                return builder(form_type=form_type, extension=extension, **kwargs)
             else:
                 raise ValueError(
                     f"no parser for that form_type and extension combination({form_type}, {extension}) registered"
                 )
+        if self._should_stream(form_type, extension, builder, kwargs["path"]):
+            logger.info(
+                f"parsing {kwargs['path']} would exceed the memory ceiling of {self.max_filing_memory} bytes, streaming its sections instead."
+            )
+            filing = create_streamed_htm_filing(
+                form_type=form_type,
+                extension=extension,
+                max_memory=self.max_filing_memory,
+                **kwargs,
+            )
+            if filing is not None:
+                return filing
+            logger.info(
+                f"couldnt stream {kwargs['path']}, it has no table of contents with links to split it by. parsing it as a whole."
+            )
+        return builder(form_type=form_type, extension=extension, **kwargs)
+
+    def _should_stream(self, form_type: str, extension: str, builder, path: str) -> bool:
+        """
+        only filings split by the table of contents alone can be streamed, the
+        other builders and parsers (multiprospectus S-3, items of 8-K, SC 13D ..)
+        need the whole document.
+        """
+        if (extension != ".htm") or (self.max_filing_memory is None) or (builder is not BaseHTMFiling):
+            return False
+        parser = parser_factory.get_parser(extension=extension, form_type=form_type)
+        if type(parser).split_into_sections is not HTMFilingParser.split_into_sections:
+            return False
+        return estimate_parse_memory(path) > self.max_filing_memory
 
 
 class HTMFilingParser(AbstractFilingParser):
     form_type = None
     extension = ".htm"
+    table_classifier = TableClassifier(TableFeatureExtractor(), BASE_TABLE_RULES)
     """
     Baseclass for parsing HtmlFilings.
 
@@ -290,20 +455,35 @@ class HTMFilingParser(AbstractFilingParser):
             parser = HtmlFilingParser()
             doc = parser.get_doc(path_to/filing.htm)
             sections = parser.split_into_sections(doc)
+
+        the HTMDocument returned by get_doc is the only parse of the file,
+        the sections are ranges over its tree.
+
+    Args:
+        backend: what parser to build the soup with, one of HTML_PARSE_BACKENDS.
+                 "html5lib" is the most lenient but slowest, "lxml" and
+                 "html5-parser" are C implementations.
         
     """
 
-    def __init__(self):
-        pass
+    def __init__(self, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        if backend not in HTML_PARSE_BACKENDS.keys():
+            raise ValueError(
+                f"unknown parse backend: {backend}. choose one of: {list(HTML_PARSE_BACKENDS.keys())}"
+            )
+        self.backend = backend
 
-    def get_doc(self, path: str):
-        """opens the file the correct way and returns the filing as string."""
-        with open(Path(path), "r", encoding="utf-8") as f:
-            doc = f.read()
-            return self.preprocess_doc(doc)
+    def get_doc(self, path: str) -> HTMDocument:
+        """opens the file the correct way and returns the parsed filing.
+        
+        str() of the returned HTMDocument gives the preprocessed html string."""
+        return HTMDocument.from_file(path, backend=self.backend)
 
     def extract_tables(
-        self, soup: BeautifulSoup, reintegrate=["ul_bullet_points", "one_row_table"]
+        self,
+        soup: BeautifulSoup,
+        reintegrate=["ul_bullet_points", "one_row_table"],
+        context: ParseContext = None,
     ):
         """
         extract the tables, parse them and return them as a dict of nested lists.
@@ -315,6 +495,8 @@ class HTMFilingParser(AbstractFilingParser):
             reintegrate: which tables to reintegrate as text. if this is an empty list
                          all tables will be returned in the "extracted" section of the dict
                          and the "reintegrated" section will be an empty list
+            context: ParseContext the reintegrated elements are created with, one
+                     is created for the call if None.
         Returns:
             a dict of form: {
                 "reintegrated": [
@@ -325,6 +507,7 @@ class HTMFilingParser(AbstractFilingParser):
                                       a key of 'table_elements' which contains the original <table>
                                       elements as a list.
                         "parsed_table": parsed representation of the table before reintegration
+                        "table": the parsed table as HTMTable, parsed_table is its tolist() view
                         }
                     ],
                 "extracted": [
@@ -334,33 +517,31 @@ class HTMFilingParser(AbstractFilingParser):
                                       a key of 'table_elements' which contains the original <table>
                                       elements as a list.
                         "parsed_table": parsed representation of table,
+                        "table": the parsed table as HTMTable, parsed_table is its tolist() view
                         }
                     ]
                 }
         """
+        if context is None:
+            context = ParseContext(self.backend)
         unparsed_tables = self.get_unparsed_tables(soup)
         tables = {"reintegrated": [], "extracted": []}
         for t in unparsed_tables:
-            parsed_table = None
-            if self.table_has_header(t):
-                parsed_table = self.parse_htmltable_with_header(t)
-            else:
-                parsed_table = self.primitive_htmltable_parse(t)
-            cleaned_table = self._clean_parsed_table_columnwise(
-                self._preprocess_table(parsed_table)
-            )
+            table = self._clean_table(self.parse_htmltable(t))
+            cleaned_table = table.tolist()
             classification = self.classify_table(cleaned_table)
             if classification in reintegrate:
                 reintegrate_html = self._make_reintegrate_html_of_table(
-                    classification, cleaned_table
+                    classification, cleaned_table, context
                 )
-                t.replace_with(reintegrate_html)
+                _replace_table(soup, t, reintegrate_html)
                 tables["reintegrated"].append(
                     {
                         "classification": classification,
                         "reintegrated_as": reintegrate_html,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
             else:
@@ -370,22 +551,49 @@ class HTMFilingParser(AbstractFilingParser):
                         "classification": classification,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
         return tables
 
-    def get_text_content(self, doc: BeautifulSoup = None, exclude=["table", "script"], strip=True):
-        """extract the unstructured language"""
-        doc_copy = copy.copy(doc)
-        if exclude != [] or exclude is not None:
-            [s.extract() for s in doc_copy(exclude)]
-        return doc_copy.get_text(separator=" ", strip=strip)
+    def get_text_content(self, doc: BeautifulSoup | HTMDocumentRange = None, exclude=["table", "script"], strip=True):
+        """extract the unstructured language, skipping the excluded tags without modifying doc"""
+        return self._get_range(doc).get_text(separator=" ", strip=strip, exclude=exclude)
+
+    def get_text_only(self, doc: BeautifulSoup | HTMDocumentRange, exclude=["table", "script", "title", "head"]):
+        """
+        extract the unstructured language in one walk over doc.
 
-    def get_span_of_element(self, doc: str, ele: element.Tag, pos: int = None):
+        excluded tags are skipped without modifying doc, whitespace (including
+        \xa0 and \u200b) is folded into single spaces on the way.
+        """
+        pieces = []
+        for string in self._get_range(doc).iter_strings(exclude):
+            words = string.translate(TEXT_ONLY_SPACE_TRANSLATION).split()
+            if words:
+                pieces.append(" ".join(words))
+        return " ".join(pieces)
+
+    def _get_range(self, doc: BeautifulSoup | element.Tag | HTMDocumentRange) -> HTMDocumentRange:
+        if isinstance(doc, HTMDocumentRange):
+            return doc
+        return HTMDocumentRange.of_element(doc)
+
+    def get_document_index(self, doc: BeautifulSoup | HTMDocument) -> HTMDocumentIndex:
+        """get the position index of the document doc, created on first access."""
+        return HTMDocument.of(doc, backend=self.backend).index
+
+    def get_span_of_element(self, doc: str | BeautifulSoup | HTMDocument, ele: element.Tag, pos: int = None):
         """gets the span (start, end) of the element ele in doc
 
         Args:
-            doc: html string"""
+            doc: parsed document or html string. for a parsed document the span
+                 is looked up in its position index, for a html string by regex
+                 starting at pos.
+        Raises:
+            ValueError: if ele isnt part of the parsed document"""
+        if not isinstance(doc, str):
+            return self.get_document_index(doc).get_span(ele)
         exp = re.compile(re.escape(str(ele)))
         span = exp.search(doc, pos=0 if pos is None else pos).span()
         if not span:
@@ -393,12 +601,17 @@ class HTMFilingParser(AbstractFilingParser):
         else:
             return span
 
-    def find_next_by_position(self, doc: str, start_ele: element.Tag, filter):
+    def find_next_by_position(self, doc: str | BeautifulSoup | HTMDocument, start_ele: element.Tag, filter):
+        """find the first element starting after the end of start_ele in doc, which passes filter."""
         if not isinstance(filter, (bool, NoneType)) and not callable(filter):
             raise ValueError(
                 "please pass a function, bool, or None for the filter arg to find_next_by_position"
             )
         after_pos = self.get_span_of_element(doc, start_ele)[1]
+        if not isinstance(doc, str):
+            return self.get_document_index(doc).find_next_after(
+                after_pos, filter=filter if callable(filter) else None
+            )
         for ele in start_ele.next_elements:
             ele_pos = self.get_span_of_element(doc, ele)[0]
             if after_pos < ele_pos:
@@ -406,14 +619,14 @@ class HTMFilingParser(AbstractFilingParser):
                     return ele
                 if filter is None:
                     return ele
-                if isinstance(filter, function):
+                if callable(filter):
                     if filter(ele) is True:
                         return ele
         return None
 
-    def split_into_sections(self, doc: BeautifulSoup | str):
-        if isinstance(doc, str):
-            doc_ = BeautifulSoup(doc, features="html5lib")
+    def split_into_sections(self, doc: HTMDocument | BeautifulSoup | str):
+        if isinstance(doc, (str, HTMDocument)):
+            doc_ = self.make_soup(doc)
         else:
             doc_ = doc
         try:
@@ -492,6 +705,8 @@ class HTMFilingParser(AbstractFilingParser):
                 exc_info=True,
             )
             return None
+        except RegexBudgetExceeded:
+            raise
         except Exception as e:
             logger.debug(e, exc_info=True)
             return None
@@ -510,7 +725,7 @@ class HTMFilingParser(AbstractFilingParser):
     def preprocess_doc(self, doc: str):
         """preprocess the html string, by converting it to Beautifulsoup and back,
         thereby converting common html entities."""
-        return str(BeautifulSoup(doc, features="html5lib"))
+        return str(self.make_soup(doc))
 
     def clean_text_only_filing(self, filing: str):
         """cleanes html filing and returns only text"""
@@ -521,9 +736,13 @@ class HTMFilingParser(AbstractFilingParser):
         filing = self.get_text_content(soup, exclude=["title"])
         return self.preprocess_text(filing)
 
-    def make_soup(self, doc: str):
-        """creates a BeautifulSoup from string html"""
-        soup = BeautifulSoup(doc, features="html5lib")
+    def make_soup(self, doc: str | HTMDocument):
+        """creates a BeautifulSoup from string html with the backend of the parser.
+        
+        for a HTMDocument its soup is returned instead of parsing again."""
+        if isinstance(doc, HTMDocument):
+            return doc.soup
+        soup = make_soup_with_backend(doc, self.backend)
         return soup
 
     def get_unparsed_tables(self, soup: BeautifulSoup):
@@ -538,48 +757,26 @@ class HTMFilingParser(AbstractFilingParser):
         Args:
             table: should be a list of lists cleaned with clean_parsed_table.
         """
-        # assume header
-        try:
-            table_shape = (len(table), len(table[0]))
-        except IndexError:
-            return "empty"
-        # logger.debug(f"table shape is: {table_shape}")
-        # could be a bullet point table
-        if table_shape[0] == 1:
-            return "one_row_table"
-        if table_shape[1] == 2:
-            if self._is_bullet_point_table(table) is True:
-                return "ul_bullet_points"
-            else:
-                return "unclassified"
-        return "unclassified"
+        return self.table_classifier.classify(table)
 
     # def _create_section_start_element(self, section_title: str, ele: element.Tag, meta: dict)
 
+    def _clean_table(self, table: HTMTable) -> HTMTable:
+        """preprocess the strings of the table and remove the empty columns"""
+        return table.apply_to_strings(self.preprocess_text).drop_empty_columns()
+
     def _preprocess_table(self, table: list[list]):
         """preprocess the strings in the table, removing multiple whitespaces and newlines
         Returns:
             a new (preprocessed) table with the same dimensions as the original
         """
-        t = table.copy()
-        for ridx, _ in enumerate(t):
-            for cidx, _ in enumerate(t[ridx]):
-                field_content = t[ridx][cidx]
-                if isinstance(field_content, str):
-                    t[ridx][cidx] = self.preprocess_text(field_content)
-        return t
+        return HTMTable(table).apply_to_strings(self.preprocess_text).tolist()
 
     def _clean_parsed_table_drop_empty_rows(
         self, table: list[list], remove_: list = ["", None]
     ):
         """clean a parsed table, removing all rows consisting only of fields in remove_"""
-        drop_rows = []
-        for idx, row in enumerate(table):
-            if _row_is_ignore(row) is True:
-                drop_rows.insert(0, idx)
-        for d in drop_rows:
-            table.pop(d)
-        return table
+        return HTMTable(table).drop_empty_rows(remove_).tolist()
 
     def _clean_parsed_table_fieldwise(
         self, table: list[list], remove_: list = ["", None, "None", " ", "\u200b"]
@@ -604,54 +801,21 @@ class HTMFilingParser(AbstractFilingParser):
         self, table: list[list], remove_identifier: list = ["", "None", None, " ", "\u200b"]
     ):
         """clean a parsed table of shape m,n by removing all columns whose row values are a combination of remove_identifier"""
-        tablec = table.copy()
-        nr_rows = len(tablec)
-        nr_cols = len(tablec[0])
-        boolean_matrix = [[True] * nr_cols for n in range(nr_rows)]
-        for row in range(nr_rows):
-            for col in range(nr_cols):
-                if tablec[row][col] in remove_identifier:
-                    boolean_matrix[row][col] = False
-        cols_to_remove = []
-        for col in range(nr_cols):
-            all_empty = True
-            for row in range(nr_rows):
-                if boolean_matrix[row][col] is True:
-                    all_empty = False
-            if all_empty is True:
-                cols_to_remove.insert(0, col)
-        for rmv in cols_to_remove:
-            for row in range(nr_rows):
-                tablec[row].pop(rmv)
-        return tablec
-
-    def _is_bullet_point_table(self, table: list[list]):
-        table_shape = (len(table), len(table[0]))
-        if table_shape[1] != 2:
-            return False
-        bullet = "\u25cf"
-        cols_unicode = [True] * table_shape[1]
-        for col in range(table_shape[1]):
-            for row in range(table_shape[0]):
-                if table[row][col] not in ["\u25cf", "\u25cf \u25cf", "\u25cf\u25cf", "", ""]:
-                    # print(table[row][col], row, col)
-                    cols_unicode[col] = False
-        if cols_unicode[0] is True:
-            return True
-        else:
-            return False
+        return HTMTable(table).drop_empty_columns(remove_identifier).tolist()
 
-    def _make_reintegrate_html_of_table(self, classification, table: list[list]):
-        empty_soup = BeautifulSoup("", features="html5lib")
-        base_element = empty_soup.new_tag("p")
+    def _make_reintegrate_html_of_table(
+        self, classification, table: list[list], context: ParseContext
+    ):
+        """create the elements replacing a table of classification, with the empty soup of context."""
+        base_element = context.new_tag("p")
         if classification == "ul_bullet_points":
             for idx, row in enumerate(table):
-                ele = empty_soup.new_tag("span")
+                ele = context.new_tag("span")
                 ele.string = " ".join(row) + "\n"
                 base_element.insert(idx + 2, ele)
             return base_element
         elif classification == "one_row_table":
-            ele = empty_soup.new_tag("span")
+            ele = context.new_tag("span")
             _string = ""
             for field in table[0]:
                 _string += str(field) + "\t"
@@ -672,35 +836,25 @@ class HTMFilingParser(AbstractFilingParser):
         shape_constraint: tuple[int, int] = (-1, -1),
         field_length_constraint: tuple[int] = (-1, 12)) -> bool:
         '''
-        helper function to determine if the parsed table has the correct shape and field lengths.
+        helper function to determine if the parsed table has the correct shape and field lengths,
+        read from its TableFeatures.
         
         Args:
             table: list[list]
         '''
         if (len(field_length_constraint) > shape_constraint[1]) and (shape_constraint[1] != -1):
             raise ValueError(f"field_length_constraint elements can't exceed shape_constraint[1]")
-        is_correct_shape = True
-        if shape_constraint[0] != -1:
-            if len(table) > shape_constraint[0]:
-                is_correct_shape = False
-        if shape_constraint[1] != -1:
-            if len(table[0]) > shape_constraint[1]:
-                is_correct_shape = False
-        if is_correct_shape is False:
-            return False
-        has_correct_lengths = True
-        for row in  table:
-            for idx, col in enumerate(row):
-                try:
-                    if field_length_constraint[idx] == -1:
-                        continue
-                    else:
-                        if len(col) > field_length_constraint[idx]:
-                            has_correct_lengths = False
-                except IndexError:
-                    logger.debug("tried to access shape_constraint item which doesnt exist. excepted IndexError.")
-        if (has_correct_lengths is True) and (is_correct_shape is True):
+        features = TableFeatureExtractor().extract(table)
+        if features is None:
             return True
+        if (shape_constraint[0] != -1) and (features.n_rows > shape_constraint[0]):
+            return False
+        if (shape_constraint[1] != -1) and (features.n_cols > shape_constraint[1]):
+            return False
+        return all(
+            (constraint == -1) or (max_length <= constraint)
+            for constraint, max_length in zip(field_length_constraint, features.column_max_lengths)
+        )
 
 
     def _parse_toc_table_element(self, table_element: element.Tag):
@@ -796,94 +950,26 @@ class HTMFilingParser(AbstractFilingParser):
         else:
             return []
 
+    def parse_htmltable(self, htmltable: element.Tag) -> HTMTable:
+        """parse a html table into a HTMTable, with a header if table_has_header"""
+        return HTMTable.from_element(htmltable, get_text=self.get_element_text_content)
+
     def primitive_htmltable_parse(self, htmltable):
         """parse simple html tables without col or rowspan"""
-        rows = htmltable.find_all("tr")
-        amount_rows = len(rows)
-        amount_columns = 0
-        table = None
-        for row in rows:
-            nr_columns = len(row.find_all("td"))
-            if nr_columns > amount_columns:
-                amount_columns = nr_columns
-        # create empty table
-        table = [[None] * amount_columns for each in range(amount_rows)]
-        # write each row
-        for row_idx, row in enumerate(rows):
-            for field_idx, field in enumerate(row.find_all("td")):
-                content = self.get_element_text_content(field)
-                # adjust row_idx for header
-                table[row_idx][field_idx] = content
-        return table
+        return HTMTable.from_element(
+            htmltable, get_text=self.get_element_text_content, header=False
+        ).tolist()
 
     def parse_htmltable_with_header(
         self, htmltable, colspan_mode="separate", merge_delimiter=" "
     ):
-        # parse the header
-        header, colspans, body = self.parse_htmltable_header(htmltable)
-        # get number of rows (assuming rowspan=1 for each row)
-        rows = htmltable.find_all("tr")
-        amount_rows = len(rows)
-        amount_columns = None
-        table = None
-
-        # mode to write duplicate column names for colspan > 1
-        if colspan_mode == "separate":
-            # get total number columns including colspan
-            amount_columns = sum([col for col in colspans])
-            # create empty table
-            table = [[None] * amount_columns for each in range(amount_rows)]
-            # parse, write each row (ommiting the header)
-            for row_idx, row in enumerate(rows[1:]):
-                for field_idx, field in enumerate(row.find_all("td")):
-                    content = self.get_element_text_content(field)
-                    # adjust row_idx for header
-                    table[row_idx + 1][field_idx] = content
-
-        # mode to merge content of a colspan column under one unique column
-        # splitting field content by the merge_delimiter
-        elif colspan_mode == "merge":
-            # get number of columns ignoring colspan
-            amount_columns = sum([1 for col in colspans])
-            # create empty table
-            table = [[None] * amount_columns for each in range(amount_rows)]
-
-            # parse, merge and write each row excluding header
-            for row_idx, row in enumerate(rows[1:]):
-                # get list of content in row
-                unmerged_row_content = [
-                    self.get_element_text_content(td) for td in row.find_all("td")
-                ]
-                merged_row_content = [None] * amount_columns
-                # what we need to shift by to adjust for total of colspan > 1
-                colspan_offset = 0
-                for idx, colspan in enumerate(colspans):
-                    unmerged_idx = idx + colspan_offset
-                    merged_row_content[idx] = merge_delimiter.join(
-                        unmerged_row_content[unmerged_idx : (unmerged_idx + colspan)]
-                    )
-                    colspan_offset += colspan - 1
-                # write merged rows to table
-                for r in range(amount_columns):
-                    # adjust row_idx for header
-                    table[row_idx + 1][r] = merged_row_content[r]
-
-            # change colspans to reflect the merge and write header correctly
-            colspans = [1] * len(colspans)
-
-        # write header
-        cspan_offset = 0
-        for idx, h in enumerate(header):
-            colspan = colspans[idx]
-            if colspan > 1:
-                for r in range(colspan - 1):
-                    table[0][idx + cspan_offset] = h
-                    cspan_offset = cspan_offset + 1
-
-            else:
-                table[0][idx + cspan_offset] = h
-
-        return table
+        return HTMTable.from_element(
+            htmltable,
+            get_text=self.get_element_text_content,
+            header=True,
+            colspan_mode=colspan_mode,
+            merge_delimiter=merge_delimiter,
+        ).tolist()
 
     def parse_htmltable_header(self, htmltable):
         parsed_header = []
@@ -1002,7 +1088,8 @@ class HTMFilingParser(AbstractFilingParser):
         Raises:
             ValueError: if the position of an element couldnt be determined
         """
-        str_doc = str(doc)
+        # positions of the elements are taken from the index of the document
+        document = HTMDocument.of(doc, backend=self.backend)
         # weird start end of conesecutive elements (50k vs 800k ect)? why?
         toc_start_end = None
         if start_ele is None:
@@ -1018,30 +1105,30 @@ class HTMFilingParser(AbstractFilingParser):
                     close_to_toc = close_to_toc.parent
                 if "href" in close_to_toc.attrs:
                     name_or_id = close_to_toc["href"][-1]
-                    close_to_toc = doc.find(True, {"name": name_or_id})
-                    if close_to_toc is None:
-                        close_to_toc = doc.find(True, {"id": name_or_id})
+                    close_to_toc = document.index.get_anchor(
+                        name_or_id, attrs=("name", "id")
+                    )
                 toc_table = close_to_toc.find_next("table")
                 found_toc = False
                 while found_toc is False:
-                    dirty_toc = self.parse_htmltable_with_header(toc_table)
-                    if len(dirty_toc) < 10:
+                    # the parsed table has a row per <tr>, no need to parse it
+                    if len(toc_table.find_all("tr")) < 10:
                         toc_table = toc_table.find_next("table")
                         if not toc_table:
                             print("couldnt find a toc")
                             after_toc = start_ele
                     else:
-                        toc_start_end = self.get_span_of_element(str_doc, toc_table)
+                        toc_start_end = self.get_span_of_element(document, toc_table)
                         found_toc = True
 
-                after_toc = self.find_next_by_position(str_doc, toc_table, True)
+                after_toc = self.find_next_by_position(document, toc_table, True)
                 logger.debug(
-                    f"toc_table span: {self.get_span_of_element(str_doc, toc_table)}"
+                    f"toc_table span: {self.get_span_of_element(document, toc_table)}"
                 )
                 logger.debug(
-                    f"after_toc span: {self.get_span_of_element(str_doc, after_toc)}"
+                    f"after_toc span: {self.get_span_of_element(document, after_toc)}"
                 )
-                # ignore_before = re.search(re.escape(str(after_toc)), str_doc).span()[1]
+                # ignore_before = re.search(re.escape(str(after_toc)), document).span()[1]
 
             except Exception as e:
                 logger.debug(
@@ -1095,6 +1182,10 @@ class HTMFilingParser(AbstractFilingParser):
             ),
         }
 
+        # select the elements of all selectors in one walk over the tree
+        selected = HTMStyleScanner(
+            [s for selector in selectors.values() if isinstance(selector, list) for s in selector]
+        ).select(start_ele)
         matches = {}
         entry_to_ignore = set()
         multiline_matches = 0
@@ -1107,15 +1198,10 @@ class HTMFilingParser(AbstractFilingParser):
                     # group together elements that are within close range of each other (how many chars?)
                     # -> multiline headers
 
-                    # try this
-                    selected_elements = start_ele.select(selector=s)
+                    selected_elements = selected[s]
                     elements = []
-                    for idx, e in enumerate(selected_elements):
-                        if idx > 0:
-                            start_pos = elements[idx - 1][1][1]
-                        else:
-                            start_pos = 0
-                        span = self.get_span_of_element(str_doc, e, pos=start_pos)
+                    for e in selected_elements:
+                        span = self.get_span_of_element(document, e)
                         elements.append((e, span))
                     elements_sorted = sorted(elements, key=lambda x: x[1][1])
 
@@ -1126,8 +1212,9 @@ class HTMFilingParser(AbstractFilingParser):
                         else:
                             entry_to_ignore.add(entry)
                         if toc_start_end is not None:
-                            if self._ele_is_between(
-                                str_doc, ele, toc_start_end[0], toc_start_end[1]
+                            # span of the element encloses the toc table
+                            if (toc_start_end[0] > entry[1][0]) and (
+                                toc_start_end[1] < entry[1][1]
                             ):
                                 # if (0 <= entry[1][0] <= toc_start_end[1]):
                                 continue
@@ -1390,6 +1477,8 @@ class HTMFilingParser(AbstractFilingParser):
             re_terms: list of re.Patterns that should be split of from the front page into their own section_start_elements
             start_ele: the start element of the first cover page
         """
+        # copy so removing found terms doesnt alter the default between calls
+        re_terms = re_terms.copy()
         section_start_elements = []
         ele = start_ele
         while True:
@@ -1511,38 +1600,15 @@ class HTMFilingParser(AbstractFilingParser):
             min_distance: minimum number of elements between matches
             stop_ele: at what element to stop the search at the latest.
         """
-        title_matches = []
-        min_distance_count = 0
-        matched_ele = None
-        for ele in start_ele.next_elements:
-            if stop_ele is not None:
-                if ele == stop_ele:
-                    break
-            if matched_ele == ele.previous_element:
-                if min_distance_count >= min_distance:
-                    matched_ele = None
-                    min_distance_count = 0
-                else:
-                    matched_ele = ele
-                    min_distance_count += 1
-                    continue
-            if ele.string:
-                content = ele.string
-                for re_term, term_length in re_toc_titles:
-                    if re.search(re_term, content):
-                        content_length = (
-                            len(ele)
-                            if isinstance(ele, (NavigableString, str))
-                            else len(ele.string)
-                        )
-                        if isinstance(ele, str):
-                            ele = ele.parent
-                        if content_length < term_length:
-                            title_matches.append(ele)
-                            # print(re_term, ele)
-                            matched_ele = ele
-                            break
-        return title_matches
+        matcher = TOCTitleMatcher(re_toc_titles)
+        # the matcher budgets each search, not the whole walk
+        with budget_handler():
+            return [
+                ele
+                for ele, _, _ in matcher.iter_hits(
+                    start_ele, min_distance=min_distance, stop_ele=stop_ele
+                )
+            ]
 
     def _search_toc_match_in_list_of_tags(self, tags, re_toc_titles):
         """
@@ -1550,35 +1616,24 @@ class HTMFilingParser(AbstractFilingParser):
 
         Avoids matches that are descendants of the last match.
         """
+        matcher = TOCTitleMatcher(re_toc_titles)
         matches = []
-        for tag in tags:
-            matched = False
-            if tag.string:
-                content = tag.string
-                if content == "":
-                    pass
-                else:
-                    for re_term, _ in re_toc_titles:
-                        if re.search(re_term, content):
-                            matches.append(tag)
-                            matched = True
-                            break
-            if matched is False:
-                try:
+        with budget_handler():
+            for tag in tags:
+                matched = False
+                if tag.string:
+                    if matcher.match_title(tag.string) is not None:
+                        matches.append(tag)
+                        matched = True
+                if matched is False:
                     for child in tag.descendants:
                         if child.string:
-                            content = child.string
-                            if content is not (None or ""):
-                                for re_term, _ in re_toc_titles:
-                                    if re.search(re_term, content):
-                                        matches.append(child)
-                                        break
-                except AttributeError as e:
-                    raise e
+                            if matcher.match_title(child.string) is not None:
+                                matches.append(child)
         return matches
 
-    def _ele_is_between(self, doc: str, ele: element.Tag, x1, x2):
-        """check if ele is between x1 and x2 in the document (by regex span)"""
+    def _ele_is_between(self, doc: str | BeautifulSoup | HTMDocument, ele: element.Tag, x1, x2):
+        """check if ele is between x1 and x2 in the document (by span of the element)"""
         ele_span = self.get_span_of_element(doc, ele)
         if (x1 > ele_span[0]) and (x2 < ele_span[1]):
             return True
@@ -1602,110 +1657,59 @@ class HTMFilingParser(AbstractFilingParser):
         )
 
     def _split_into_sections_by_tags(
-        self, doc: BeautifulSoup, section_start_elements: list[dict]
+        self, doc: BeautifulSoup | HTMDocument, section_start_elements: list[dict]
     ):
         """
-        splits html doc into malformed html strings by section_start_elements.
+        splits html doc into sections starting at section_start_elements.
+
+        each section spans from its start element up to the start element of the
+        next section in document order, the last section up to the end of doc.
+        The content of a section is sliced from the serialized doc at the offsets
+        of these elements and its nodes are referenced as a HTMDocumentRange, doc
+        itself isnt modified.
+
         Args:
             section_start_elements: [{"section_title": section_title, "ele": element.Tag}]
         """
-        sections = []
-        # make sure that the section_start_elements are sorted in ascending order by sourceline
-        sorted_section_start_elements = sorted(
-            section_start_elements, key=lambda x: (x["ele"].sourceline, x["ele"].sourcepos)
-        )
-        # logger.debug(sorted_section_start_elements)
-        for idx, section_start_element in enumerate(sorted_section_start_elements):
-            sorted_section_start_elements[idx] = _add_unique_id_to_dict(
-                section_start_element
-            )
-        logger.debug([s["section_title"] for s in list(sorted_section_start_elements)])
-        for section_nr, start_element in enumerate(sorted_section_start_elements):
-
-            ele = start_element["ele"]
-            logger.debug(
-                f'{ele.sourceline, ele.sourcepos} inserted start ele {"-START_SECTION_TITLE_" + start_element["section_title"] + start_element["UUID"]}'
-            )
-            ele.insert_before(
-                "-START_SECTION_TITLE_"
-                + start_element["section_title"]
-                + start_element["UUID"]
-            )
-            if section_nr == len(sorted_section_start_elements) - 1:
-                while True:
-                    prev_ele = ele
-                    ele = ele.next_element
-                    if ele is None:
-                        prev_ele.insert_before(
-                            "-STOP_SECTION_TITLE_"
-                            + start_element["section_title"]
-                            + start_element["UUID"]
-                        )
-                        break
+        document = HTMDocument.of(doc, backend=self.backend)
+        index = document.index
+        start_elements = []
+        for start_element in section_start_elements:
+            if start_element["ele"] in index:
+                start_elements.append(start_element)
             else:
-                while ele != sorted_section_start_elements[section_nr + 1]["ele"]:
-                    next_ele = ele.next_element
-                    if not next_ele:
-                        logger.debug(
-                            f"element that should be reached before advancing with inserting stop marker: {section_start_elements[section_nr + 1]['ele']}"
-                        )
-                        # logger.debug(f"sourceline stop ele: {section_start_elements[section_nr + 1]['ele'].sourceline}")
-                        logger.debug(
-                            f"_split_into_sections_by_tag: next_element was none. start_element['ele']: {start_element['ele']} \t section_nr: {section_nr}"
-                        )
-                        logger.debug(
-                            f"sourceline start ele: {start_element['ele'].sourceline}"
-                        )
-                        # --> sort by sourceline at start to avoid fuckupy
-                        break
-                    ele = next_ele
                 logger.debug(
-                    f'{ele.sourceline if not isinstance(ele, NavigableString) else ele.parent.sourceline} inserted stop ele {"-STOP_SECTION_TITLE_" + start_element["section_title"] + start_element["UUID"]}'
-                )
-                ele.insert_before(
-                    "-STOP_SECTION_TITLE_"
-                    + start_element["section_title"]
-                    + start_element["UUID"]
+                    f"_split_into_sections_by_tags: start element of section isnt part of the document: {start_element['section_title']}"
                 )
-        text = str(doc)
-        for idx, sec in enumerate(sorted_section_start_elements):
-            logger.debug(
-                f'looking for: {"-START_SECTION_TITLE_" + re.escape(sec["section_title"] + sec["UUID"])}'
-            )
-            start = re.search(
-                re.compile(
-                    "-START_SECTION_TITLE_"
-                    + re.escape(sec["section_title"] + sec["UUID"]),
-                    re.MULTILINE,
-                ),
-                text,
-            )
-
-            end = re.search(
-                re.compile(
-                    "-STOP_SECTION_TITLE_"
-                    + re.escape(sec["section_title"] + sec["UUID"]),
-                    re.MULTILINE,
-                ),
-                text,
-            )
+        # make sure that the start elements are sorted in document order
+        start_elements.sort(key=lambda x: index.get_ordinal(x["ele"]))
+        logger.debug([s["section_title"] for s in start_elements])
+        sections = []
+        for idx, start_element in enumerate(start_elements):
+            start_ele = start_element["ele"]
+            if idx == len(start_elements) - 1:
+                stop_ele = None
+                end = len(index.html)
+            else:
+                stop_ele = start_elements[idx + 1]["ele"]
+                end = index.get_span(stop_ele)[0]
+            start = index.get_span(start_ele)[0]
             try:
-
                 sections.append(
                     HTMFilingSection(
-                        title=self._normalize_toc_title(sec["section_title"]),
-                        content=text[start.span()[1] : end.span()[0]],
+                        title=self._normalize_toc_title(start_element["section_title"]),
+                        content=index.html[start:end],
                         extension=self.extension,
                         form_type=self.form_type,
+                        backend=self.backend,
+                        document_range=document.get_range(start_ele, stop_ele),
                     )
                 )
             except Exception as e:
-                print("FAILURE TO SPLIT SECTION BECAUSE:")
-                print(
-                    f"start: {start}, end: {end}, section_title: {sec['section_title']}, section_idx/total: {idx}/{len(section_start_elements)-1}"
+                logger.debug(
+                    f"failure to split section: {start_element['section_title']}, section_idx/total: {idx}/{len(start_elements)-1}"
                 )
                 logger.debug(e, exc_info=True)
-                print("----------------")
         return sections if sections != [] else None
 
     def _split_by_table_of_content_based_on_headers(self, doc: BeautifulSoup):
@@ -1901,9 +1905,9 @@ class HTMFilingParser(AbstractFilingParser):
                 name_or_id = close_to_toc["href"][1:]
                 # logger.debug(f"close_to_toc href attr: {close_to_toc['href']}")
                 # logger.debug(f"name_or_id: {name_or_id}")
-                close_to_toc = doc.find(True, {"name": name_or_id})
-                if close_to_toc is None:
-                    close_to_toc = doc.find(True, {"id": name_or_id})
+                close_to_toc = self.get_document_index(doc).get_anchor(
+                    name_or_id, attrs=("name", "id")
+                )
                 # logger.debug(
                 #     f"close_to_toc after looking for the name and id: {close_to_toc}"
                 # )
@@ -1927,14 +1931,11 @@ class HTMFilingParser(AbstractFilingParser):
             logger.info(e, exc_info=True)
             return None
 
+        # the targets of the toc links are looked up in the anchor index
+        index = self.get_document_index(doc)
         # determine first section so we can check if toc is multiple pages
         id = first_ids[0]
-        id_match = doc.find(id=id[1:])
-        if id_match is None:
-            name_match = doc.find(attrs={"name": id[1:]})
-            first_toc_element = name_match
-        else:
-            first_toc_element = id_match
+        first_toc_element = index.get_anchor(id[1:])
         # check that we didnt miss other pages of toc
         if not first_toc_element:
             raise ValueError("couldnt find section of first element in TOC")
@@ -1953,20 +1954,20 @@ class HTMFilingParser(AbstractFilingParser):
                 toc_title = " ".join([s for s in a.strings]).lower()
                 ids.append((id, toc_title))
             section_start_ids.append(ids)
+        toc_titles = {}
         for entry in sum(section_start_ids, []):
             id = entry[0]
             if id not in track_ids_done:
-                id_match = doc.find(id=id[1:])
-                if id_match is None:
-                    id_match = doc.find(attrs={"name": id[1:]})
                 track_ids_done.append(id)
-                if id_match:
-                    # print(id_match, entry)
-                    section_start_elements.append(
-                        {"ele": id_match, "section_title": entry[1]}
-                    )
-                else:
-                    print("NO ID MATCH FOR", entry)
+                toc_titles[id[1:]] = entry[1]
+        # resolve all entries at once, sorted by position in the document
+        resolved = index.get_anchors(list(toc_titles.keys()))
+        for name_or_id in toc_titles.keys() - set(r[0] for r in resolved):
+            print("NO ID MATCH FOR", ("#" + name_or_id, toc_titles[name_or_id]))
+        for name_or_id, id_match in resolved:
+            section_start_elements.append(
+                {"ele": id_match, "section_title": toc_titles[name_or_id]}
+            )
 
         return self._split_into_sections_by_tags(
             doc, section_start_elements=section_start_elements
@@ -1976,11 +1977,15 @@ class HTMFilingParser(AbstractFilingParser):
 class ParserS3(HTMFilingParser):
     form_type = "S-3"
     extension = ".htm"
+    table_classifier = TableClassifier(
+        TableFeatureExtractor(REGISTRATION_TABLE_HEADERS_S3, REQUIRED_TOC_ITEMS_S3),
+        S3_TABLE_RULES,
+    )
     """process and parse s-3 filing."""
 
-    def split_into_sections(self, doc: BeautifulSoup | str):
-        if isinstance(doc, str):
-            doc_ = BeautifulSoup(doc, features="html5lib")
+    def split_into_sections(self, doc: HTMDocument | BeautifulSoup | str):
+        if isinstance(doc, (str, HTMDocument)):
+            doc_ = self.make_soup(doc)
         else:
             doc_ = doc
         sections = self.split_by_table_of_contents(doc_)
@@ -2185,74 +2190,58 @@ class ParserS3(HTMFilingParser):
         id = table[0]["href"]
         if id is None:
             return None
-        id_match = doc.find(attrs={"id": id[1:]})
-        if id_match is None:
-            name_match = doc.find(attrs={"name": id[1:]})
-            first_toc_element = name_match
-        else:
-            first_toc_element = id_match
+        # the targets of the toc links are looked up in the anchor index
+        index = self.get_document_index(doc)
+        first_toc_element = index.get_anchor(id[1:])
         if not first_toc_element:
             raise ValueError("couldnt find section of first element in TOC")
-        track_ids_done = []
-        section_start_elements = []
+        toc_entries = {}
         for entry in table:
-            logger.debug(f"looking for section start element of entry: {entry}")
             id = entry["href"]
-            # logger.debug(f"working on id: {id}")
-            if id not in track_ids_done:
-                id_match = doc.find(attrs={"id": id[1:]})
-                if id_match is None:
-                    id_match = doc.find(attrs={"name": id[1:]})
-                track_ids_done.append(id)
-                if id_match:
-                    # print(id_match.sourceline, id_match.sourcepos, entry)
-                    # logger.debug(f"id_match found: {type(id_match), id_match}")
-                    section_start_elements.append(
-                        {"ele": id_match, "section_title": entry["title"]}
-                    )
-                else:
-                    logger.debug(("NO ID MATCH FOR", entry))
+            if id[1:] not in toc_entries:
+                toc_entries[id[1:]] = entry
+        # resolve all entries at once, sorted by position in the document
+        resolved = index.get_anchors(list(toc_entries.keys()))
+        for name_or_id in toc_entries.keys() - set(r[0] for r in resolved):
+            logger.debug(("NO ID MATCH FOR", toc_entries[name_or_id]))
+        section_start_elements = []
+        for name_or_id, id_match in resolved:
+            section_start_elements.append(
+                {"ele": id_match, "section_title": toc_entries[name_or_id]["title"]}
+            )
         return section_start_elements
 
     def extract_tables(
-        self, soup: BeautifulSoup, reintegrate=["ul_bullet_points", "one_row_table"]
+        self,
+        soup: BeautifulSoup,
+        reintegrate=["ul_bullet_points", "one_row_table"],
+        context: ParseContext = None,
     ):
         """see HTMFilingParser"""
+        if context is None:
+            context = ParseContext(self.backend)
         unparsed_tables = self.get_unparsed_tables(soup)
         tables = {"reintegrated": [], "extracted": []}
         for t in unparsed_tables:
-            parsed_table = None
             if t is None:
                 continue
-            if self.table_has_header(t):
-                parsed_table = self.parse_htmltable_with_header(t)
-            else:
-                parsed_table = self.primitive_htmltable_parse(t)
-            try:
-                cleaned_table = self._clean_parsed_table_drop_empty_rows(
-                    self._clean_parsed_table_columnwise(
-                        self._preprocess_table(parsed_table)
-                    ),
-                    remove_=["", None],
-                )
-            except IndexError:
-                continue
+            table = self._clean_table(self.parse_htmltable(t)).drop_empty_rows()
+            cleaned_table = table.tolist()
             if cleaned_table == []:
                 continue
             classification = self.classify_table(cleaned_table)
-            if classification == "unclassified":
-                classification = super().classify_table(cleaned_table)
             if classification in reintegrate:
                 reintegrate_html = self._make_reintegrate_html_of_table(
-                    classification, cleaned_table
+                    classification, cleaned_table, context
                 )
-                t.replace_with(reintegrate_html)
+                _replace_table(soup, t, reintegrate_html)
                 tables["reintegrated"].append(
                     {
                         "classification": classification,
                         "reintegrated_as": reintegrate_html,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
             else:
@@ -2262,23 +2251,17 @@ class ParserS3(HTMFilingParser):
                         "classification": classification,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
         return tables
 
     def classify_table(self, table: list[list]):
-        try:
-            table_shape = (len(table), len(table[0]))
-        except IndexError:
-            return "empty"
-        if table_shape[0] > 1:
-            for row in table:
-                if _row_is_ignore(row=row) is False:
-                    if table_header_has_fields(row, REGISTRATION_TABLE_HEADERS_S3):
-                        return "registration_table"
-                    else:
-                        break
-        return "unclassified"
+        """
+        classify a table as registration_table, toc or one of the classifications
+        of HTMFilingParser.classify_table.
+        """
+        return self.table_classifier.classify(table)
 
 
 class Parser8K(HTMFilingParser):
@@ -2294,11 +2277,23 @@ class Parser8K(HTMFilingParser):
         2) call split_into_sections on the result from 1)
     """
 
-    def __init__(self):
-        self.soup = None
-        self.match_groups = self._create_match_group()
+    match_groups = None
+    anchored_match_groups = None
+
+    def __init__(self, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        super().__init__(backend=backend)
+        self.compile_patterns()
 
-    def split_into_sections(self, doc: str|BeautifulSoup) -> list[FilingSection]:
+    @classmethod
+    def compile_patterns(cls):
+        if cls.match_groups is None:
+            cls.match_groups = cls._create_match_group()
+            # every item pattern starts with "Item"
+            cls.anchored_match_groups = GuardedPattern(
+                AnchoredPattern(cls.match_groups, "item", anchor_at_start=True), "ITEMS_8K"
+            )
+
+    def split_into_sections(self, doc: str|BeautifulSoup|HTMDocument) -> list[FilingSection]:
         """
         split the filing into FilingSections.
 
@@ -2320,6 +2315,7 @@ class Parser8K(HTMFilingParser):
                             content=v,
                             extension=self.extension,
                             form_type=self.form_type,
+                            backend=self.backend,
                         )
                     )
             return sections
@@ -2393,7 +2389,7 @@ class Parser8K(HTMFilingParser):
         Args:
             filing: should be a cleaned 8-k filing (only text content, no html ect)"""
         matches = []
-        for match in re.finditer(self.match_groups, filing):
+        for match in self.anchored_match_groups.finditer(filing):
             matches.append([match.start(), match.end(), match.group(0)])
         return matches
 
@@ -2407,7 +2403,7 @@ class Parser8K(HTMFilingParser):
         return signature_matches
 
     def get_date_of_report_matches(self, filing: str):
-        date = re.search(COMPILED_DATE_OF_REPORT_PATTERN, filing)
+        date = ANCHORED_DATE_OF_REPORT_PATTERN.search(filing)
         if date is None:
             raise ValueError
         return date
@@ -2475,7 +2471,8 @@ class Parser8K(HTMFilingParser):
             raise e
         return date
 
-    def _create_match_group(self):
+    @staticmethod
+    def _create_match_group():
         reg_items = "("
         for key, val in ITEMS_8K.items():
             reg_items = reg_items + "(" + val + ")|"
@@ -2487,17 +2484,29 @@ class ParserSC13D(HTMFilingParser):
     form_type = "SC 13D"
     extension = ".htm"
 
-    def __init__(self):
-        self.match_groups = self._create_match_group(ITEMS_SC13D)
+    items = ITEMS_SC13D
+
+    def __init__(self, backend: str = DEFAULT_HTML_PARSE_BACKEND):
+        super().__init__(backend=backend)
+        self.compile_patterns()
 
-    def split_into_sections(self, doc: str):
+    @classmethod
+    def compile_patterns(cls):
+        # each subclass has its own items and patterns
+        if cls.__dict__.get("match_groups") is None:
+            cls.match_groups = cls._create_match_group(cls.items)
+            cls.guarded_match_groups = GuardedPattern(
+                cls.match_groups, "ITEMS_" + cls.form_type.replace(" ", "")
+            )
+
+    def split_into_sections(self, doc: str | HTMDocument):
         """
         split the filing into FilingSections.
 
         Returns:
             list[HTMFilingSection] or []
         """
-        items = self._parse_items(doc)
+        items = self._parse_items(str(doc))
         logger.debug(f"SC 13D items found: {len(items)}")
         if items == []:
             return []
@@ -2511,11 +2520,13 @@ class ParserSC13D(HTMFilingParser):
                             content=v,
                             extension=self.extension,
                             form_type=self.form_type,
+                            backend=self.backend,
                         )
                     )
             return sections
 
-    def _create_match_group(self, items_dict: dict):
+    @staticmethod
+    def _create_match_group(items_dict: dict):
         reg_items = "(?:"
         for key, val in items_dict.items():
             reg_items = reg_items + "(?:" + val + ")|"
@@ -2528,7 +2539,7 @@ class ParserSC13D(HTMFilingParser):
         Args:
             filing: should be a cleaned sc 13d filing (only text content, no html ect)"""
         matches = []
-        for match in re.finditer(self.match_groups, filing):
+        for match in self.guarded_match_groups.finditer(filing):
             matches.append([match.start(), match.end(), match.group(0)])
         return matches
 
@@ -2613,14 +2624,19 @@ class ParserSC13D(HTMFilingParser):
             return "one_row_table"
         return None
 
-    def _make_reintegrate_html_of_table(self, classification, table: list[list]):
+    def _make_reintegrate_html_of_table(
+        self, classification, table: list[list], context: ParseContext
+    ):
         return None
 
     def extract_tables(
-        self, soup: BeautifulSoup, reintegrate=["ul_bullet_points", "one_row_table"]
+        self,
+        soup: BeautifulSoup,
+        reintegrate=["ul_bullet_points", "one_row_table"],
+        context: ParseContext = None,
     ):
         return self._extract_tables(
-            soup, MAIN_TABLE_ITEMS_SC13D, reintegrate=reintegrate
+            soup, MAIN_TABLE_ITEMS_SC13D, reintegrate=reintegrate, context=context
         )
 
     def _extract_tables(
@@ -2628,6 +2644,7 @@ class ParserSC13D(HTMFilingParser):
         soup: BeautifulSoup,
         items_dict: dict,
         reintegrate=["ul_bullet_points", "one_row_table"],
+        context: ParseContext = None,
     ):
         """
         extract the tables, parse them and return them as a dict of nested lists.
@@ -2639,6 +2656,8 @@ class ParserSC13D(HTMFilingParser):
             reintegrate: which tables to reintegrate as text. if this is an empty list
                          all tables will be returned in the "extracted" section of the dict
                          and the "reintegrated" section will be an empty list
+            context: ParseContext the reintegrated elements are created with, one
+                     is created for the call if None.
         Returns:
             a dict of form: {
                 "reintegrated": [
@@ -2649,6 +2668,7 @@ class ParserSC13D(HTMFilingParser):
                                       a key of 'table_elements' which contains the original <table>
                                       elements as a list.
                         "parsed_table": parsed representation of the table before reintegration
+                        "table": the parsed table as HTMTable, parsed_table is its tolist() view
                         }
                     ],
                 "extracted": [
@@ -2658,24 +2678,22 @@ class ParserSC13D(HTMFilingParser):
                                       a key of 'table_elements' which contains the original <table>
                                       elements as a list.
                         "parsed_table": parsed representation of table,
+                        "table": the parsed table as HTMTable, parsed_table is its tolist() view
                         }
                     ]
                 }
         """
+        if context is None:
+            context = ParseContext(self.backend)
         unparsed_tables = self.get_unparsed_tables(soup)
         tables = {"reintegrated": [], "extracted": []}
         current_main_table_item = 0
         multi_element_table_items = []
         multi_element_table_meta = {"table_elements": [], "items": []}
         for t in unparsed_tables:
-            parsed_table = None
-            if self.table_has_header(t):
-                parsed_table = self.parse_htmltable_with_header(t)
-            else:
-                parsed_table = self.primitive_htmltable_parse(t)
-            cleaned_table = self._clean_parsed_table_columnwise(
-                self._preprocess_table(parsed_table)
-            )
+            table = self._clean_table(self.parse_htmltable(t))
+            cleaned_table = table.tolist()
+            parsed_table = cleaned_table
             if cleaned_table == []:
                 continue
             classification = self.classify_table(cleaned_table)
@@ -2683,12 +2701,12 @@ class ParserSC13D(HTMFilingParser):
                 classification = super().classify_table(cleaned_table)
             if classification in reintegrate:
                 reintegrate_html = self._make_reintegrate_html_of_table(
-                    classification, cleaned_table
+                    classification, cleaned_table, context
                 )
                 if reintegrate_html is None:
                     try:
                         reintegrate_html = super()._make_reintegrate_html_of_table(
-                            classification, cleaned_table
+                            classification, cleaned_table, context
                         )
                     except NotImplementedError:
                         tables["extracted"].append(
@@ -2696,19 +2714,21 @@ class ParserSC13D(HTMFilingParser):
                                 "classification": classification,
                                 "table_meta": {"table_elements": [t]},
                                 "parsed_table": cleaned_table,
+                                "table": table,
                             }
                         )
                         logger.info(
                             f"couldnt reintegrate table, because this class of table isnt handled in the base class or this class with _make_reintegrate_html_of_table function. Extracted table instead. classification not handled: {classification}"
                         )
                         continue
-                t.replace_with(reintegrate_html)
+                _replace_table(soup, t, reintegrate_html)
                 tables["reintegrated"].append(
                     {
                         "classification": classification,
                         "reintegrated_as": reintegrate_html,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
             else:
@@ -2762,6 +2782,7 @@ class ParserSC13D(HTMFilingParser):
                         "classification": classification,
                         "table_meta": {"table_elements": [t]},
                         "parsed_table": cleaned_table,
+                        "table": table,
                     }
                 )
         if current_main_table_item > 0:
@@ -2778,17 +2799,16 @@ class ParserSC13G(ParserSC13D):
     form_type = "SC 13G"
     extension = ".htm"
 
-    def __init__(self):
-        self.match_groups = self._create_match_group(ITEMS_SC13G)
+    items = ITEMS_SC13G
 
-    def split_into_sections(self, doc: str):
+    def split_into_sections(self, doc: str | HTMDocument):
         """
         split the filing into FilingSections.
 
         Returns:
             list[HTMFilingSection] or []
         """
-        items = self._parse_items(doc)
+        items = self._parse_items(str(doc))
         logger.debug(f"SC 13G items found: {len(items)}")
         if items == []:
             return []
@@ -2802,15 +2822,19 @@ class ParserSC13G(ParserSC13D):
                             content=v,
                             extension=self.extension,
                             form_type=self.form_type,
+                            backend=self.backend,
                         )
                     )
             return sections
 
     def extract_tables(
-        self, soup: BeautifulSoup, reintegrate=["ul_bullet_points", "one_row_table"]
+        self,
+        soup: BeautifulSoup,
+        reintegrate=["ul_bullet_points", "one_row_table"],
+        context: ParseContext = None,
     ):
         return self._extract_tables(
-            soup, MAIN_TABLE_ITEMS_SC13G, reintegrate=reintegrate
+            soup, MAIN_TABLE_ITEMS_SC13G, reintegrate=reintegrate, context=context
         )
 
 
@@ -2854,11 +2878,17 @@ class BaseFiling(Filing):
             extension=self.extension,
             form_type=self.form_type
         )
-        self.doc = self.parser.get_doc(self.path) if doc is None else doc
+        self._doc = doc
         self.sections = (
             self.parser.split_into_sections(self.doc) if sections is None else sections
         )
 
+    @property
+    def doc(self):
+        """the parsed file, read on first access if it wasnt passed."""
+        if self._doc is None:
+            self._doc = self.parser.get_doc(self.path)
+        return self._doc
     
 
 class ParserEFFECT(XMLFilingParser):
@@ -2904,23 +2934,16 @@ class ParserEFFECT(XMLFilingParser):
 
 def _re_is_main_table_start(table: list[list], items_dict: dict):
     # check if this is the start of the main table
-    for row in table:
-        for field in row:
-            if table_field_contains_content(
-                field, re.compile(items_dict[list(items_dict.keys())[0]], re.I)
-            ):
-                return True
+    with regex_budget(description="main table items"):
+        for row in table:
+            for field in row:
+                if table_field_contains_content(
+                    field, re.compile(items_dict[list(items_dict.keys())[0]], re.I)
+                ):
+                    return True
     return False
 
 
-def _row_is_ignore(row: list, ignore: set = set(["", None])):
-    row_set = set(row)
-    if len(row_set - ignore) == 0:
-        return True
-    else:
-        return False
-
-
 def _re_get_key_value_table(table: list[list], items_dict: dict, current_item: int):
     """extract the key value from items dict from table.
     Args:
@@ -3016,6 +3039,29 @@ def table_field_contains_content(field, re_term):
             return False
 
 
+def _detach_tables(tables: dict) -> dict:
+    """copy of the tables dict of extract_tables without references to the parsed document."""
+    detached = {}
+    for table_type, entries in tables.items():
+        detached[table_type] = []
+        for entry in entries:
+            entry = dict(entry)
+            if "table_meta" in entry:
+                entry["table_meta"] = {**entry["table_meta"], "table_elements": []}
+            if "reintegrated_as" in entry:
+                entry["reintegrated_as"] = None
+            detached[table_type].append(entry)
+    return detached
+
+
+def _replace_table(soup: BeautifulSoup | HTMDocumentRange, table: element.Tag, replacement: element.Tag):
+    """replace table with replacement, without modifying the shared tree if soup is a HTMDocumentRange."""
+    if isinstance(soup, HTMDocumentRange):
+        soup.replace_element(table, replacement)
+    else:
+        table.replace_with(replacement)
+
+
 def table_header_has_fields(table_header: list, re_terms: list[re.Pattern]) -> bool:
     """checks if all fields are present in the header"""
     header_matches = []
@@ -3038,18 +3084,74 @@ parser_factory = ParserFactory(defaults=parser_factory_default)
 
 
 class HTMFilingSection(FilingSection):
-    def __init__(self, title, content, extension: str = None, form_type: str = None):
+    """
+    Section of a html filing.
+
+    soup, tables and text_only are created on first access and cached
+    until release is called.
+
+    Args:
+        document_range: the nodes of the section in the parsed filing. if given
+                        the section works on the shared tree of the filing instead
+                        of parsing content again.
+        tables, text_only: already extracted tables and text of the section, eg
+                           from the ParsedFilingCache. skips the extraction.
+
+    roles are the SECTION_ROLES of the section, determined from the title once on creation.
+    """
+    def __init__(
+        self,
+        title,
+        content,
+        extension: str = None,
+        form_type: str = None,
+        backend: str = None,
+        document_range: HTMDocumentRange = None,
+        tables: dict = None,
+        text_only: str = None,
+    ):
         super().__init__(title=title, content=content)
         self.parser: HTMFilingParser = parser_factory.get_parser(
-            extension=extension, form_type=form_type
+            extension=extension, form_type=form_type, backend=backend
         )
-        self.soup: BeautifulSoup = self.parser.make_soup(self.content)
-        self.tables: dict = self.parser.extract_tables(self.soup)
-        self.text_only = self.parser.preprocess_section_text_content(
-            self.parser.get_text_content(
+        self.roles = get_section_roles(title)
+        self.document_range = document_range
+        self._soup = None
+        self._tables = tables
+        self._text_only = text_only
+
+    @property
+    def soup(self) -> BeautifulSoup | HTMDocumentRange:
+        if self._soup is None:
+            if self.document_range is not None:
+                self._soup = self.document_range
+            else:
+                self._soup = self.parser.make_soup(self.content)
+        return self._soup
+
+    @property
+    def tables(self) -> dict:
+        if self._tables is None:
+            self._tables = self.parser.extract_tables(self.soup)
+        return self._tables
+
+    @property
+    def text_only(self) -> str:
+        if self._text_only is None:
+            # reintegrated tables are part of the text
+            self.tables
+            self._text_only = self.parser.get_text_only(
                 self.soup, exclude=["table", "script", "title", "head"]
             )
-        )
+        return self._text_only
+
+    def release(self):
+        """drop the cached soup, tables and text_only, they are recreated on next access."""
+        if self.document_range is not None:
+            self.document_range.replaced = {}
+        self._soup = None
+        self._tables = None
+        self._text_only = None
 
     def quick_summary(self) -> dict:
         """returns a short summary of the section."""
@@ -3084,14 +3186,185 @@ class HTMFilingSection(FilingSection):
             return None
 
 
+class StreamedHTMFilingSection(HTMFilingSection):
+    """
+    Section of a html filing too large to parse as a whole, see htm_stream.
+
+    content is read from the file on each access instead of being kept. The
+    soup of the section is parsed on first access and kept until release is
+    called. tables and text_only are extracted from a soup that is dropped
+    afterwards, so the tables dont hold elements of it (table_elements is
+    empty and reintegrated_as is None).
+
+    Args:
+        path: path of the filing.
+        start, end: byte offsets of the section in the file.
+        max_memory: memory ceiling in bytes for parsing the section, None for no ceiling.
+        tables, text_only: already extracted tables and text of the section, eg
+                           from the ParsedFilingCache. skips the extraction.
+    """
+    def __init__(
+        self,
+        title,
+        path: str,
+        start: int,
+        end: int,
+        extension: str = None,
+        form_type: str = None,
+        backend: str = None,
+        max_memory: int = None,
+        tables: dict = None,
+        text_only: str = None,
+    ):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.max_memory = max_memory
+        super().__init__(
+            title=title,
+            content=None,
+            extension=extension,
+            form_type=form_type,
+            backend=backend,
+            tables=tables,
+            text_only=text_only,
+        )
+
+    @property
+    def content(self) -> str:
+        with HTMFileStream(self.path) as stream:
+            return stream.read(self.start, self.end)
+
+    @content.setter
+    def content(self, content):
+        # the content is read from the file
+        pass
+
+    @property
+    def soup(self) -> BeautifulSoup:
+        if self._soup is None:
+            self._soup = self._make_soup()
+        return self._soup
+
+    @property
+    def tables(self) -> dict:
+        if self._tables is None:
+            self._extract()
+        return self._tables
+
+    @property
+    def text_only(self) -> str:
+        if self._text_only is None:
+            self._extract()
+        return self._text_only
+
+    def _make_soup(self) -> BeautifulSoup:
+        if (self.max_memory is not None) and (
+            (self.end - self.start) * SOUP_MEMORY_FACTOR > self.max_memory
+        ):
+            raise ValueError(
+                f"section {self.title} of {self.path} exceeds the memory ceiling of {self.max_memory} bytes"
+            )
+        return self.parser.make_soup(self.content)
+
+    def _extract(self):
+        soup = self._make_soup()
+        self._tables = _detach_tables(self.parser.extract_tables(soup))
+        self._text_only = self.parser.get_text_only(
+            soup, exclude=["table", "script", "title", "head"]
+        )
+
+
 class BaseHTMFiling(BaseFiling):
-    def __init__(self, *args, **kwargs):
+    """
+    Filing of a html file.
+
+    The filings of the prospectuses of a multiprospectus filing share the
+    parsed document and the list of sections, each of them is a view over
+    the sections in its section_range. soup and the text content of such a
+    filing are derived from the part of the document its sections span.
+
+    Args:
+        section_range: (start, stop) indices of the sections of this filing
+                       in sections, None if all sections belong to it.
+    """
+    def __init__(self, *args, section_range: tuple[int, int] = None, **kwargs):
+        self.section_range = section_range
+        self._section_index = None
         super().__init__(*args, **kwargs)
-        self.soup: BeautifulSoup = self.parser.make_soup(self.doc)
+        self._soup = None
+
+    @property
+    def sections(self) -> list[FilingSection]:
+        if self.section_range is None:
+            return self._sections
+        return self._sections[self.section_range[0] : self.section_range[1]]
+
+    @sections.setter
+    def sections(self, sections: list[FilingSection]):
+        self._sections = sections
+        self._section_index = None
+
+    @property
+    def section_index(self) -> SectionIndex:
+        """index of the sections by title, role and pattern, built on first access."""
+        if self._section_index is None:
+            self._section_index = SectionIndex(self.sections)
+        return self._section_index
+
+    def has_section(self, role: str) -> bool:
+        """check if a section with role (see SECTION_ROLES) is present."""
+        return self.section_index.has_role(role)
+
+    def get_section_by_role(self, role: str):
+        """
+        gets the first section with role (see SECTION_ROLES).
+
+        Returns:
+            FilingSection or [], if no section has that role."""
+        section = self.section_index.get_by_role(role)
+        return section if section is not None else []
+
+    @property
+    def soup(self) -> BeautifulSoup | HTMDocumentRange:
+        # shared with the sections and the other filings of a multi-prospectus filing
+        if self._soup is None:
+            document_range = self._get_document_range()
+            if document_range is not None:
+                self._soup = document_range
+            else:
+                self._soup = self.parser.make_soup(self.doc)
+        return self._soup
 
     def get_preprocessed_text_content(self) -> str:
         """get all the text content of the Filing"""
-        return self.parser.preprocess_text(self.doc)
+        document_range = self._get_document_range()
+        if document_range is None:
+            return self.parser.preprocess_text(str(self.doc))
+        index = document_range.document.index
+        start = index.get_span(document_range.start)[0]
+        end = (
+            len(index.html)
+            if document_range.stop is None
+            else index.get_span(document_range.stop)[0]
+        )
+        return self.parser.preprocess_text(index.html[start:end])
+
+    def _get_document_range(self) -> HTMDocumentRange | None:
+        """
+        get the range of the document the sections of this filing span, None if
+        the filing spans all sections or they arent ranges of one HTMDocument.
+        """
+        if (self.section_range is None) or not isinstance(self._doc, HTMDocument):
+            return None
+        sections = self.sections
+        if (sections == []) or any(
+            getattr(s, "document_range", None) is None for s in sections
+        ):
+            return None
+        return self._doc.get_range(
+            sections[0].document_range.start, sections[-1].document_range.stop
+        )
 
     def get_text_only(self):
         text = " ".join([sec.text_only for sec in self.sections])
@@ -3116,29 +3389,25 @@ class BaseHTMFiling(BaseFiling):
             return []
         if isinstance(identifier, int):
             try:
-                self.sections[identifier]
+                return self.sections[identifier]
             except IndexError:
                 logger.info("no section with that identifier found")
                 return []
         elif isinstance(identifier, str):
-            for sec in self.sections:
-                if sec.title == identifier:
-                    return sec
+            section = self.section_index.get_by_title(identifier)
+            if section is not None:
+                return section
         elif isinstance(identifier, re.Pattern):
-            for sec in self.sections:
-                if re.search(identifier, sec.title):
-                    return sec
+            sections = self.section_index.search(identifier)
+            if sections != []:
+                return sections[0]
         return []
 
     def get_sections(self, identifier: str | re.Pattern):
         """gets sections based on a re.search of identifier.
         Returns:
             list[FilingSection] or [], if no matching sections were found."""
-        sec_matches = []
-        for sec in self.sections:
-            if re.search(identifier, sec.title):
-                sec_matches.append(sec)
-        return sec_matches
+        return list(self.section_index.search(identifier))
 
     def preprocess_section(self, section: HTMFilingSection):
         text_content = self.parser.make_soup(section.content).getText(
@@ -3185,7 +3454,8 @@ class HTMFilingBuilder:
                                 form_type=form_type,
                                 extension=extension,
                                 doc=doc,
-                                sections=sections[start_idx:sidx],
+                                sections=sections,
+                                section_range=(start_idx, sidx),
                             )
                         )
                         start_idx = sidx
@@ -3200,7 +3470,8 @@ class HTMFilingBuilder:
                     form_type=form_type,
                     extension=extension,
                     doc=doc,
-                    sections=sections[start_idx:],
+                    sections=sections,
+                    section_range=(start_idx, len(sections)),
                 )
             )
             return filings
@@ -3251,6 +3522,63 @@ def create_htm_filing(
     )
 
 
+def create_streamed_htm_filing(
+    form_type: str,
+    extension: str,
+    path: str,
+    filing_date: str,
+    accession_number: str,
+    cik: str,
+    file_number: str,
+    max_memory: int = None,
+) -> Filing:
+    """
+    create the filing of a .htm file too large to be parsed as a whole.
+
+    the sections are found by the links of the table of contents in the
+    memory-mapped file, everything before the first of them is the "front page"
+    section. The sections are parsed one at a time when they are accessed, see
+    StreamedHTMFilingSection. the doc and soup of the filing are still parsed
+    from the whole file if they are accessed.
+
+    Only the first table of contents is used, a multiprospectus filing isnt
+    split into one filing per prospectus.
+
+    Returns:
+        the filing or None if the file has no table of contents with links to split it by.
+    """
+    parser: HTMFilingParser = parser_factory.get_parser(
+        extension=extension, form_type=form_type
+    )
+    with HTMFileStream(path) as stream:
+        toc_sections = stream.find_toc_sections()
+    if toc_sections == []:
+        return None
+    sections = [
+        StreamedHTMFilingSection(
+            title=parser._normalize_toc_title(title),
+            path=path,
+            start=start,
+            end=end,
+            extension=extension,
+            form_type=form_type,
+            backend=parser.backend,
+            max_memory=max_memory,
+        )
+        for title, start, end in [("front page", 0, toc_sections[0][1])] + toc_sections
+    ]
+    return BaseHTMFiling(
+        path=path,
+        filing_date=filing_date,
+        accession_number=accession_number,
+        cik=cik,
+        file_number=file_number,
+        form_type=form_type,
+        extension=extension,
+        sections=sections,
+    )
+
+
 filing_factory_default = [
     ("S-1", ".htm", BaseHTMFiling),
     ("DEF 14A", ".htm", BaseHTMFiling),
@@ -0,0 +1,157 @@
+import logging
+import re
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+'''
+Execution budgets for the regex patterns of the parsers.
+
+Some patterns (the toc titles, the date of report, the item patterns) backtrack
+for a very long time on malformed filings, eg a toc title pattern on a string
+of a few ten thousand newlines. re has no step limit, but it checks for signals
+while matching, so a budget is enforced with a SIGALRM interval timer which
+raises RegexBudgetExceeded in the middle of the match.
+
+Installing the signal handler costs more than most matches, so code running
+many short guarded matches (eg a pattern per element of a document) installs it
+once with budget_handler, each budget within only arms the timer.
+
+The timer is only available in the main thread on platforms with SIGALRM
+(this includes the worker processes of DilutionDBUtil.parse_filings). Elsewhere
+the patterns run without a budget.
+'''
+
+DEFAULT_REGEX_BUDGET = 10.0
+
+_default_budget = DEFAULT_REGEX_BUDGET
+# (description, budget) of the budget currently running, nested budgets run within it
+_active_budget = None
+# True while budget_handler keeps _on_alarm installed
+_handler_installed = False
+
+
+class RegexBudgetExceeded(Exception):
+    """
+    A pattern ran longer than its budget.
+
+    Args:
+        description: what was matched, eg the name of the pattern.
+        budget: the budget in seconds.
+    """
+
+    def __init__(self, description: str, budget: float):
+        super().__init__(description, budget)
+        self.description = description
+        self.budget = budget
+
+    def __str__(self):
+        return f"matching {self.description} exceeded its budget of {self.budget}s"
+
+
+def set_default_budget(budget: float | None):
+    """set the budget in seconds used if none is given, None disables the budgets."""
+    global _default_budget
+    _default_budget = budget
+
+
+def get_default_budget() -> float | None:
+    return _default_budget
+
+
+def _can_use_timer() -> bool:
+    return hasattr(signal, "setitimer") and (
+        threading.current_thread() is threading.main_thread()
+    )
+
+
+def _on_alarm(signum, frame):
+    # only raise if the timer expired while a budget was still running
+    if _active_budget is not None:
+        raise RegexBudgetExceeded(*_active_budget)
+
+
+@contextmanager
+def budget_handler():
+    """keep the signal handler of the budgets installed for the block, budgets within it only arm the timer."""
+    global _handler_installed
+    if _handler_installed or not _can_use_timer() or (signal.getitimer(signal.ITIMER_REAL)[0] > 0):
+        yield
+        return
+    previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+    _handler_installed = True
+    try:
+        yield
+    finally:
+        _handler_installed = False
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+@contextmanager
+def regex_budget(budget: float | None = None, description: str = "regex"):
+    """
+    raise RegexBudgetExceeded if the block runs longer than budget seconds.
+
+    Args:
+        budget: budget in seconds, None uses the default budget (see set_default_budget).
+        description: what is matched in the block, used in the exception.
+    """
+    global _active_budget
+    if budget is None:
+        budget = _default_budget
+    if (budget is None) or (_active_budget is not None) or not _can_use_timer():
+        yield
+        return
+    if signal.getitimer(signal.ITIMER_REAL)[0] > 0:
+        logger.debug(f"interval timer already in use, running {description} without a budget")
+        yield
+        return
+
+    installed = _handler_installed
+    if not installed:
+        previous_handler = signal.signal(signal.SIGALRM, _on_alarm)
+    _active_budget = (description, budget)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        yield
+    finally:
+        _active_budget = None
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        if not installed:
+            signal.signal(signal.SIGALRM, previous_handler)
+
+
+class GuardedPattern:
+    """
+    Pattern whose calls each run within a budget.
+
+    Usage::
+
+            items = GuardedPattern(match_groups, "ITEMS_8K")
+            for match in items.finditer(filing):  # raises RegexBudgetExceeded after the budget
+                ...
+
+    Args:
+        pattern: compiled pattern or an object with the same search/finditer
+                 methods (eg AnchoredPattern).
+        description: name of the pattern, used in the exception.
+        budget: budget per call in seconds, None uses the default budget.
+    """
+
+    def __init__(self, pattern: re.Pattern, description: str, budget: float | None = None):
+        self.pattern = pattern
+        self.description = description
+        self.budget = budget
+
+    def search(self, string: str, *args) -> re.Match | None:
+        with regex_budget(self.budget, self.description):
+            return self.pattern.search(string, *args)
+
+    def finditer(self, string: str) -> Iterator[re.Match]:
+        """all matches of pattern.finditer(string), found within one budget."""
+        with regex_budget(self.budget, self.description):
+            matches = list(self.pattern.finditer(string))
+        return iter(matches)
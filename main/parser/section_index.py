@@ -0,0 +1,91 @@
+import logging
+import re
+
+from main.parser.filings_base import FilingSection
+
+logger = logging.getLogger(__name__)
+
+'''
+Lookup of the sections of a filing by title, role and pattern.
+
+The extractors look up the same few sections (cover page, front page,
+distribution ..) of a filing over and over. SectionIndex maps the titles and
+roles of the sections once and remembers the result of every pattern it was
+asked for. The roles of a section are determined from its title when the
+section is created.
+'''
+
+# canonical roles of sections and the pattern their title matches
+SECTION_ROLES = {
+    "cover_page": re.compile("cover page"),
+    "front_page": re.compile("front page"),
+    "distribution": re.compile("distribution", re.I),
+    "summary": re.compile("summary", re.I),
+    "about": re.compile(r"about\s*this", re.I),
+    "risk_factors": re.compile(r"risk\s*factors", re.I),
+}
+
+
+def get_section_roles(title: str) -> frozenset[str]:
+    """get the roles of SECTION_ROLES a section with title has."""
+    if not isinstance(title, str):
+        return frozenset()
+    return frozenset(role for role, pattern in SECTION_ROLES.items() if pattern.search(title))
+
+
+class SectionIndex:
+    """
+    Index of the sections of a filing.
+
+    Usage::
+
+            index = SectionIndex(filing.sections)
+            index.get_by_role("cover_page")
+            index.search(re.compile("description of", re.I))
+
+    Args:
+        sections: the sections in document order, the index assumes they dont change.
+    """
+
+    def __init__(self, sections: list[FilingSection]):
+        self.sections = sections
+        self._by_title = {}
+        self._by_role = {}
+        for section in sections:
+            self._by_title.setdefault(section.title, section)
+            for role in _get_roles(section):
+                self._by_role.setdefault(role, []).append(section)
+        self._searched = {}
+
+    def get_by_title(self, title: str) -> FilingSection | None:
+        """get the first section with exactly title."""
+        return self._by_title.get(title)
+
+    def get_by_role(self, role: str) -> FilingSection | None:
+        """get the first section with role."""
+        sections = self.get_all_by_role(role)
+        return sections[0] if sections != [] else None
+
+    def get_all_by_role(self, role: str) -> list[FilingSection]:
+        """get the sections with role in document order."""
+        if role not in SECTION_ROLES:
+            raise ValueError(f"unknown section role: {role}. choose one of: {list(SECTION_ROLES.keys())}")
+        return self._by_role.get(role, [])
+
+    def has_role(self, role: str) -> bool:
+        return self.get_all_by_role(role) != []
+
+    def search(self, pattern: str | re.Pattern) -> list[FilingSection]:
+        """get the sections whose title re.search matches pattern, in document order."""
+        sections = self._searched.get(pattern)
+        if sections is None:
+            sections = [s for s in self.sections if re.search(pattern, s.title)]
+            self._searched[pattern] = sections
+        return sections
+
+
+def _get_roles(section: FilingSection) -> frozenset[str]:
+    roles = getattr(section, "roles", None)
+    if roles is None:
+        roles = get_section_roles(section.title)
+    return roles
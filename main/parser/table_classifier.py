@@ -0,0 +1,243 @@
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+'''
+Classification of parsed tables from features computed in one pass.
+
+The classify_table methods of the parsers walked a table once per check (the
+shape, the bullet point column, the header fields of a registration table).
+TableFeatureExtractor reads the shape, the text features of the columns and
+the hits of the keyword patterns of a table in a single walk over its
+fields. A TableClassifier then applies its rules, in order, to the features
+alone, so the cost of classifying is linear in the number of fields.
+
+measure_throughput benchmarks a classifier on a list of tables.
+'''
+
+# fields of a bullet point column
+BULLET_FIELDS = frozenset(["\u25cf", "\u25cf \u25cf", "\u25cf\u25cf", ""])
+# fields which dont count as content of a row
+IGNORE_FIELDS = frozenset(["", None])
+# page numbers of a table of contents (12, iv, F-1, SA-3) and the header of their column
+RE_PAGE_NUMBER = re.compile(r"(?:[a-z]{0,2}-?\d{1,4}|[ivxlc]{1,6}|pages?(?:\s*no\.?)?)", re.I)
+
+
+@dataclass(slots=True)
+class TableFeatures:
+    """
+    features of a table of shape (n_rows, n_cols).
+
+    Args:
+        header_row: index of the first row with content, None if there is none.
+        header_hits: number of (field, header pattern) matches in the header row,
+                     only counted for tables of more than one row.
+        keyword_hits: indices of the keyword patterns matching in any row, only
+                      searched while the last column holds page numbers.
+        first_column_is_bullets: all fields of the first column are bullet points.
+        column_max_lengths: the length of the longest string field of each column,
+                            rows longer than the first row add columns.
+        last_column_is_page_numbers: every field of the last column is empty or a page number.
+    """
+    n_rows: int
+    n_cols: int
+    header_row: int | None = None
+    header_hits: int = 0
+    keyword_hits: set[int] = field(default_factory=set)
+    first_column_is_bullets: bool = True
+    column_max_lengths: list[int] = field(default_factory=list)
+    last_column_is_page_numbers: bool = True
+
+
+class TableFeatureExtractor:
+    """
+    Computes the TableFeatures of a table in one pass over its fields.
+
+    Args:
+        header_patterns: patterns searched in each field of the header row.
+        keyword_patterns: patterns searched in the text of each row, except for
+                          its last field, of tables of at least 3 rows and 2 columns
+                          (eg the entries of a table of contents).
+    """
+
+    def __init__(
+        self,
+        header_patterns: list[re.Pattern] = [],
+        keyword_patterns: list[re.Pattern] = [],
+    ):
+        self.header_patterns = header_patterns
+        self.keyword_patterns = keyword_patterns
+
+    def extract(self, table: list[list]) -> TableFeatures | None:
+        """get the features of table, None if the table is empty."""
+        if table == []:
+            return None
+        n_rows = len(table)
+        n_cols = len(table[0])
+        max_lengths = [0] * n_cols
+        first_column_is_bullets = True
+        last_column_is_page_numbers = True
+        header_row = None
+        header_hits = 0
+        keyword_hits = set()
+        search_keywords = (len(self.keyword_patterns) > 0) and (n_rows > 2) and (n_cols >= 2)
+        for ridx, row in enumerate(table):
+            if row == []:
+                first_column_is_bullets = False
+                continue
+            if first_column_is_bullets and (row[0] not in BULLET_FIELDS):
+                first_column_is_bullets = False
+            if len(row) > len(max_lengths):
+                max_lengths.extend([0] * (len(row) - len(max_lengths)))
+            for cidx, value in enumerate(row):
+                if (value.__class__ is str) and (len(value) > max_lengths[cidx]):
+                    max_lengths[cidx] = len(value)
+            last = row[-1]
+            if last_column_is_page_numbers and (last not in IGNORE_FIELDS) and not (
+                isinstance(last, str) and RE_PAGE_NUMBER.fullmatch(last)
+            ):
+                last_column_is_page_numbers = False
+            if (header_row is None) and not set(row) <= IGNORE_FIELDS:
+                header_row = ridx
+                # a header needs a row below it
+                if n_rows > 1:
+                    header_hits = _count_hits(row, self.header_patterns)
+            if (
+                search_keywords
+                and last_column_is_page_numbers
+                and (len(keyword_hits) < len(self.keyword_patterns))
+            ):
+                text = " ".join(value for value in row[:-1] if isinstance(value, str))
+                for pidx, pattern in enumerate(self.keyword_patterns):
+                    if (pidx not in keyword_hits) and pattern.search(text):
+                        keyword_hits.add(pidx)
+        return TableFeatures(
+            n_rows=n_rows,
+            n_cols=n_cols,
+            header_row=header_row,
+            header_hits=header_hits,
+            keyword_hits=keyword_hits,
+            first_column_is_bullets=first_column_is_bullets,
+            column_max_lengths=max_lengths,
+            last_column_is_page_numbers=last_column_is_page_numbers,
+        )
+
+
+@dataclass(slots=True)
+class TableRule:
+    """classification of the tables whose features the predicate is True for."""
+    classification: str
+    predicate: Callable[[TableFeatures], bool]
+
+
+class TableClassifier:
+    """
+    Classifies tables by the first of its rules their features match.
+
+    Usage::
+
+            classifier = TableClassifier(
+                TableFeatureExtractor(REGISTRATION_TABLE_HEADERS_S3, REQUIRED_TOC_ITEMS_S3),
+                S3_TABLE_RULES,
+            )
+            classifier.classify(table)  # "registration_table"
+
+    Args:
+        extractor: computes the features the rules are applied to.
+        rules: TableRules in order of precedence.
+        default: classification of tables no rule matches.
+    """
+
+    def __init__(
+        self,
+        extractor: TableFeatureExtractor,
+        rules: list[TableRule],
+        default: str = "unclassified",
+    ):
+        self.extractor = extractor
+        self.rules = rules
+        self.default = default
+
+    def classify(self, table: list[list]) -> str:
+        """classify table, "empty" if it has no rows."""
+        features = self.extractor.extract(table)
+        if features is None:
+            return "empty"
+        return self.classify_features(features)
+
+    def classify_features(self, features: TableFeatures) -> str:
+        for rule in self.rules:
+            if rule.predicate(features):
+                return rule.classification
+        return self.default
+
+
+def measure_throughput(classifier: TableClassifier, tables: list[list[list]], repeat: int = 3) -> dict:
+    """
+    classify tables repeat times with classifier and take the fastest run.
+
+    Returns:
+        {"tables_per_second": .., "fields_per_second": ..}
+    """
+    n_fields = sum(len(row) for table in tables for row in table)
+    best = None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        for table in tables:
+            classifier.classify(table)
+        elapsed = time.perf_counter() - start
+        best = elapsed if (best is None) or (elapsed < best) else best
+    # a run too fast for the clock counts as one tick
+    best = max(best, 1e-9)
+    return {"tables_per_second": len(tables) / best, "fields_per_second": n_fields / best}
+
+
+def _count_hits(row: list, patterns: list[re.Pattern]) -> int:
+    hits = 0
+    for value in row:
+        if not isinstance(value, str):
+            continue
+        for pattern in patterns:
+            if pattern.search(value):
+                hits += 1
+    return hits
+
+
+def is_one_row_table(features: TableFeatures) -> bool:
+    return features.n_rows == 1
+
+
+def is_bullet_point_table(features: TableFeatures) -> bool:
+    return (features.n_cols == 2) and features.first_column_is_bullets
+
+
+def is_registration_table(features: TableFeatures, n_header_patterns: int) -> bool:
+    """the header row has at least as many field matches as there are header patterns."""
+    return (
+        (features.n_rows > 1)
+        and (features.header_row is not None)
+        and (features.header_hits >= n_header_patterns)
+        and (features.header_hits > 0)
+    )
+
+
+def is_toc_table(features: TableFeatures, n_keyword_patterns: int) -> bool:
+    """all keyword patterns (the required toc items) are present and the last column holds the pages."""
+    return (
+        (features.n_rows > 2)
+        and (features.n_cols >= 2)
+        and features.last_column_is_page_numbers
+        and (n_keyword_patterns > 0)
+        and (len(features.keyword_hits) == n_keyword_patterns)
+    )
+
+
+# rules of HTMFilingParser.classify_table
+BASE_TABLE_RULES = [
+    TableRule("one_row_table", is_one_row_table),
+    TableRule("ul_bullet_points", is_bullet_point_table),
+]
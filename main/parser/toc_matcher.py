@@ -0,0 +1,149 @@
+import logging
+import re
+from functools import lru_cache
+from typing import Iterator
+from bs4 import NavigableString, element
+
+from main.parser.regex_guard import GuardedPattern
+
+logger = logging.getLogger(__name__)
+
+'''
+Matching of table of content titles against the strings of a document.
+
+Instead of running every title regex against every element, the titles are
+combined into one alternation with a named group per title, which is
+searched once per element string. The group of a match tells which title
+matched, so the single titles are only searched if the string is too long
+for the matched title.
+
+Every search runs within its own regex budget (see regex_guard), so only a
+single search backtracking for too long raises RegexBudgetExceeded, not a long
+walk over a big document.
+'''
+
+
+class TOCTitleMatcher:
+    """
+    Finds the elements whose string matches one of the toc titles.
+
+    Usage::
+
+            matcher = TOCTitleMatcher(re_toc_titles)
+            for ele, title_idx, position in matcher.iter_hits(ele_after_toc):
+                ...
+
+    Args:
+        re_toc_titles: list of tuples of (the regex pattern of the title, the max
+                       length of a string matching it), eg created with
+                       HTMFilingParser._create_toc_re
+    """
+
+    def __init__(self, re_toc_titles: list[tuple[re.Pattern, int]]):
+        self.re_toc_titles = list(re_toc_titles)
+        self.guarded_titles = [GuardedPattern(p, "toc titles") for p, _ in self.re_toc_titles]
+        re_combined = _combine_toc_res(tuple(p for p, _ in self.re_toc_titles))
+        self.re_combined = (
+            GuardedPattern(re_combined, "toc titles") if re_combined is not None else None
+        )
+
+    def match_title(self, content: str) -> int | None:
+        """get the index of the title in re_toc_titles matching content or None."""
+        return next(self._iter_matching_titles(content), None)
+
+    def _iter_matching_titles(self, content: str) -> Iterator[int]:
+        """
+        yield the indexes of the titles matching content, the title of the
+        combined match first and the following titles only if asked for.
+        """
+        first_idx = 0
+        if self.re_combined is not None:
+            match = self.re_combined.search(content)
+            if match is None:
+                return
+            first_idx = _get_title_idx(match)
+            yield first_idx
+            first_idx += 1
+        for idx in range(first_idx, len(self.guarded_titles)):
+            if self.guarded_titles[idx].search(content):
+                yield idx
+
+    def iter_hits(
+        self,
+        start_ele: element.PageElement,
+        min_distance: int = 5,
+        stop_ele: element.PageElement = None,
+    ) -> Iterator[tuple[element.PageElement, int, int]]:
+        """
+        walk the elements after start_ele once and yield the matches of the titles.
+
+        a string matches a title if the regex of the title matches and it is
+        shorter than the max length of the title. for a matching NavigableString
+        its parent is yielded. the min_distance elements following a match are
+        skipped.
+
+        Args:
+            stop_ele: at what element to stop the walk at the latest.
+
+        Yields:
+            (element, index of the title in re_toc_titles, position of the element in the walk)
+        """
+        min_distance_count = 0
+        matched_ele = None
+        for position, ele in enumerate(start_ele.next_elements):
+            if (stop_ele is not None) and (ele is stop_ele):
+                break
+            if (matched_ele is not None) and (matched_ele is ele.previous_element):
+                if min_distance_count >= min_distance:
+                    matched_ele = None
+                    min_distance_count = 0
+                else:
+                    matched_ele = ele
+                    min_distance_count += 1
+                    continue
+            content = ele.string
+            if not content:
+                continue
+            for title_idx in self._iter_matching_titles(content):
+                content_length = (
+                    len(ele)
+                    if isinstance(ele, (NavigableString, str))
+                    else len(ele.string)
+                )
+                if isinstance(ele, str):
+                    ele = ele.parent
+                if content_length < self.re_toc_titles[title_idx][1]:
+                    matched_ele = ele
+                    yield ele, title_idx, position
+                    break
+
+
+@lru_cache(maxsize=128)
+def _combine_toc_res(patterns: tuple[re.Pattern]) -> re.Pattern | None:
+    """
+    combine the patterns into one alternation with a named group toc{index} per
+    pattern, see _get_title_idx.
+
+    Returns:
+        the combined pattern or None if the patterns cant be combined (different flags
+        or group references that break in the alternation).
+    """
+    if len(patterns) < 2:
+        return None
+    flags = patterns[0].flags
+    if any(p.flags != flags for p in patterns):
+        return None
+    try:
+        return re.compile(
+            "|".join(f"(?P<toc{idx}>{p.pattern})" for idx, p in enumerate(patterns)),
+            flags,
+        )
+    except re.error as e:
+        logger.debug(f"couldnt combine toc title patterns: {e}")
+        return None
+
+
+def _get_title_idx(match: re.Match) -> int:
+    """get the index of the pattern a match of a combined pattern matched."""
+    # the group of the pattern encloses any group of its own and closes last
+    return int(match.lastgroup[len("toc"):])
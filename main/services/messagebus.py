@@ -58,4 +58,20 @@ class MessageBus:
     def collect_command_history(self):
         command_history = self.command_history
         self.command_history = []
-        return command_history
\ No newline at end of file
+        return command_history
+
+class RecordingMessageBus(MessageBus):
+    """
+    MessageBus which only records the commands it is given.
+
+    Used where the commands cant be handled directly, eg when extracting in a
+    worker process. The recorded commands are handled later by passing them to
+    the handle method of a MessageBus with a unit of work.
+    """
+    def __init__(self):
+        super().__init__(uow=None, command_handlers={})
+
+    def handle(self, message: Message):
+        if not isinstance(message, commands.Command):
+            raise Exception(f"{message} was not an Event or Command")
+        self.command_history.append(message)
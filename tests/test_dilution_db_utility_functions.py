@@ -22,3 +22,17 @@ def test_get_folder_mtime(tmp_path):
 def test_is_outdated(comparison_time, max_age, now, expected):
     assert is_outdated(comparison_time, max_age, now) == expected
     
+
+def test_create_and_extract_filings_records_commands():
+    from dilution_db import _create_and_extract_filings
+    from main.domain import model, commands
+    path = Path(__file__).parent / "test_resources" / "filings" / "0001309082" / "EFFECT" / "999999999522002596" / "primary_doc.xml"
+    company = model.Company(cik="0001309082", sic="9000", symbol="RAND", name="Rand Inc.", description_="test company")
+    results = _create_and_extract_filings(
+        ("EFFECT", "999999999522002596", str(path), None, "0001309082", None, company)
+    )
+    assert len(results) == 1
+    recorded_commands, error = results[0]
+    assert error is None
+    assert [type(c) for c in recorded_commands] == [commands.AddEffectRegistration]
+    assert recorded_commands[0].effect_registration.file_number == "333-265715"
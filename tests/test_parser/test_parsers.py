@@ -1,8 +1,28 @@
 from pathlib import Path
 import os
+import re
+import signal
+import time
 import pytest
 from main.parser.filings_base import Filing
-from main.parser.parsers import BaseFiling, filing_factory, HTMFilingParser, XMLFilingParser, ParserEFFECT
+from main.parser.parsers import BaseFiling, filing_factory, parser_factory, HTMFilingParser, ParserS3, XMLFilingParser, ParserEFFECT, make_soup_with_backend, HTMDocument, Parser8K, COMPILED_DATE_OF_REPORT_PATTERN, StreamedHTMFilingSection, ParseContext
+from main.parser.htm_table import HTMTable
+from main.parser.filing_cache import ParsedFilingCache
+from main.parser.toc_matcher import TOCTitleMatcher
+from main.parser.htm_style import HTMStyleScanner
+from main.parser.table_classifier import measure_throughput
+from main.parser.anchored_regex import AnchoredPattern
+from main.parser import htm_stream
+from main.parser.htm_stream import HTMFileStream, RE_ANCHOR_ATTRIBUTE, estimate_parse_memory
+from main.parser.regex_guard import GuardedPattern, RegexBudgetExceeded, get_default_budget, set_default_budget
+from main.parser.section_index import SECTION_ROLES
+from main.parser.effect_reader import iter_effect_records, read_effect_record
+from main.parser.filing_nlp_doc import FilingDoc, get_doc_slice
+from main.parser.filing_nlp_batch import NLPBatch
+from main.parser.filing_nlp_cache import DocCache
+from main.parser.filing_nlp import set_SECUMatcher_extensions, select_pipeline_profile, retokenize_SECU, get_secu_key
+from main.parser.filing_nlp_prefilter import SentencePrefilter, get_prefilter_recall
+import spacy
 import datetime
 
 from xml.etree import ElementTree
@@ -19,6 +39,55 @@ needs test for:
 def _get_absolute_path(rel_path):
     return str(Path(__file__).parent.parent / rel_path)
 
+def _get_s3_corpus_paths():
+    return sorted((Path(__file__).parent.parent / "test_resources" / "filings").glob("*/S-3/*/*.htm"))
+
+def _get_section_titles_with_backend(path: Path, backend: str):
+    default_backend = parser_factory.backend
+    parser_factory.set_backend(backend)
+    try:
+        filings = filing_factory.create_filing(
+            path=str(path),
+            filing_date=None,
+            accession_number=path.parents[0].name,
+            cik=path.parents[2].name,
+            file_number=None,
+            form_type="S-3",
+            extension=".htm"
+        )
+    finally:
+        parser_factory.set_backend(default_backend)
+    if not isinstance(filings, list):
+        filings = [filings]
+    return [[s.title for s in filing.sections] for filing in filings]
+
+@pytest.mark.parametrize("backend", ["lxml", "html5-parser"])
+def test_make_soup_with_backend_sets_source_positions(backend):
+    try:
+        soup = make_soup_with_backend("<html><body><p>a<b>b</b></p>\n<div>c</div></body></html>", backend)
+    except ValueError:
+        pytest.skip(f"parse backend {backend} isnt usable")
+    tags = soup.find_all(True)
+    positions = [(t.sourceline, t.sourcepos) for t in tags]
+    assert None not in sum(positions, ())
+    assert positions == sorted(positions)
+    assert soup.find("div").sourceline == 2
+    assert soup.next_element is not None
+
+def test_unknown_parse_backend():
+    with pytest.raises(ValueError):
+        HTMFilingParser(backend="not a backend")
+
+@pytest.mark.parametrize("backend", ["lxml", "html5-parser"])
+@pytest.mark.parametrize("path", _get_s3_corpus_paths(), ids=lambda p: p.name)
+def test_s3_section_splits_are_equal_across_backends(path, backend):
+    try:
+        make_soup_with_backend("", backend)
+    except ValueError:
+        pytest.skip(f"parse backend {backend} isnt usable")
+    expected = _get_section_titles_with_backend(path, "html5lib")
+    assert _get_section_titles_with_backend(path, backend) == expected
+
 def test_XMLFilingParser_get_doc():
     file_path = _get_absolute_path(effect_xml)
     parser = XMLFilingParser()
@@ -118,6 +187,701 @@ def test_s3_filing_creation():
         assert len(filing.get_section(rsec).content) > 10
 
 
+def test_s3_sections_share_parsed_document():
+    s3_path = _get_absolute_path(s3_shelf)
+    parser = parser_factory.get_parser(extension=".htm", form_type="S-3")
+    doc = parser.get_doc(s3_path)
+    assert isinstance(doc, HTMDocument) is True
+    sections = parser.split_into_sections(doc)
+    assert len(sections) > 1
+    for section in sections:
+        assert section.document_range.document is doc
+    # splitting mustnt leave section markers in the shared tree
+    assert "-START_SECTION_TITLE_" not in str(doc.soup)
+
+
+def test_document_range_text_excludes_and_replaces_without_mutating():
+    parser = HTMFilingParser()
+    doc = HTMDocument.from_html(
+        "<html><body><p id='a'>first</p><table><tr><td>cell</td></tr></table>"
+        "<p id='b'>second <span>part</span></p><p id='c'>third</p></body></html>"
+    )
+    start = doc.soup.find("p", id="a")
+    stop = doc.soup.find("p", id="c")
+    section = doc.get_range(start, stop)
+    assert parser.get_text_content(section) == "first second part"
+    replacement = parser._make_reintegrate_html_of_table("one_row_table", [["cell"]], ParseContext(parser.backend))
+    section.replace_element(doc.soup.find("table"), replacement)
+    assert section.get_text(separator=" ", strip=True, exclude=[]) == "first cell second part"
+    assert doc.soup.find("table") is not None
+
+def test_document_index_spans_match_serialized_html():
+    doc = HTMFilingParser().get_doc(_get_absolute_path(s3_shelf))
+    index = doc.index
+    html = str(doc.soup)
+    assert index.html == html
+    for table in doc.soup.find_all("table")[:20]:
+        start, end = index.get_span(table)
+        assert html[start:end] == str(table)
+
+
+def test_find_next_by_position_with_index():
+    parser = HTMFilingParser()
+    doc = HTMDocument.from_html("<html><body><p id='a'>first</p><p id='b'>second</p><div>third</div></body></html>")
+    first = doc.soup.find("p", id="a")
+    assert parser.find_next_by_position(doc, first, lambda x: x.name == "div") is doc.soup.find("div")
+    start, end = parser.get_span_of_element(doc, doc.soup.find("p", id="b"))
+    assert doc.index.is_between(doc.soup.find("p", id="b").string, start, end) is True
+    with pytest.raises(ValueError):
+        parser.get_span_of_element(doc, HTMDocument.from_html("<p>other</p>").soup.find("p"))
+
+def test_split_into_sections_by_tags_covers_document_without_modifying_it():
+    parser = HTMFilingParser()
+    doc = HTMDocument.from_html(
+        "<html><body><h1>one</h1><p>first</p><h1>two</h1><p>second</p><h1>one</h1><p>third</p></body></html>"
+    )
+    html_before = str(doc.soup)
+    headers = doc.soup.find_all("h1")
+    # unordered and with a header that is structurally equal to the first one
+    sections = parser._split_into_sections_by_tags(
+        doc, [{"section_title": h.string + str(idx), "ele": h} for idx, h in reversed(list(enumerate(headers)))]
+    )
+    assert [s.title for s in sections] == ["one0", "two1", "one2"]
+    assert [s.text_only for s in sections] == ["one first", "two second", "one third"]
+    assert "".join(s.content for s in sections) == html_before[html_before.index("<h1>"):]
+    assert str(doc.soup) == html_before
+
+def test_section_is_lazy_and_releasable():
+    parser = HTMFilingParser()
+    doc = HTMDocument.from_html(
+        "<html><body><h1>one</h1><table><tr><td>a</td><td>b</td></tr></table><p>first</p></body></html>"
+    )
+    section = parser._split_into_sections_by_tags(
+        doc, [{"section_title": "one", "ele": doc.soup.find("h1")}]
+    )[0]
+    assert section._tables is None and section._text_only is None
+    text_only = section.text_only
+    assert section._tables is not None
+    tables = section.tables
+    assert section.tables is tables
+    section.release()
+    assert section._tables is None and section._text_only is None
+    assert section.text_only == text_only
+
+def test_get_text_only_folds_whitespace_without_modifying_soup():
+    parser = HTMFilingParser()
+    soup = make_soup_with_backend(
+        "<html><head><title>title</title></head><body><p>first\xa0\xa0line\n\n second\u200bpart</p>"
+        "<table><tr><td>cell</td></tr></table><script>var x;</script><p> last </p></body></html>"
+    )
+    html_before = str(soup)
+    assert parser.get_text_only(soup) == "first line second part last"
+    assert str(soup) == html_before
+
+def test_htm_table_from_element_and_cleanup():
+    parser = HTMFilingParser()
+    soup = make_soup_with_backend(
+        "<table><tr><td colspan='3'>Title</td><td>Fee</td></tr>"
+        "<tr><td>common  stock</td><td></td><td>$1,000</td><td>$10</td></tr>"
+        "<tr><td></td><td></td><td></td><td></td></tr></table>"
+    )
+    table = parser.parse_htmltable(soup.find("table"))
+    assert table.shape == (3, 4)
+    assert table.tolist()[0] == ["Title", "Title", None, "Fee"]
+    cleaned = parser._clean_table(table).drop_empty_rows()
+    assert cleaned.tolist() == [["Title", "Title", None, "Fee"], ["common stock", "", "$1,000", "$10"]]
+    assert HTMTable([["", None], ["a", ""]]).drop_empty_columns().tolist() == [[""], ["a"]]
+
+
+def test_extract_tables_returns_htm_table():
+    parser = HTMFilingParser()
+    soup = make_soup_with_backend(
+        "<table><tr><td>Name</td><td>Value</td><td>Other</td></tr><tr><td>a</td><td>1</td><td>2</td></tr></table>"
+    )
+    tables = parser.extract_tables(soup)
+    extracted = tables["extracted"][0]
+    assert isinstance(extracted["table"], HTMTable)
+    assert extracted["parsed_table"] == extracted["table"].tolist()
+
+def _create_s3_filing_with_cache(path: Path, cache: ParsedFilingCache):
+    filing_factory.set_cache(cache)
+    try:
+        filings = filing_factory.create_filing(
+            path=str(path),
+            filing_date=None,
+            accession_number=path.parents[0].name,
+            cik=path.parents[2].name,
+            file_number=None,
+            form_type="S-3",
+            extension=".htm"
+        )
+    finally:
+        filing_factory.set_cache(None)
+    return filings if isinstance(filings, list) else [filings]
+
+def test_parsed_filing_cache_restores_sections_without_parsing(tmp_path):
+    path = _get_s3_corpus_paths()[0]
+    cache = ParsedFilingCache(tmp_path / "cache")
+    created = _create_s3_filing_with_cache(path, cache)
+    assert cache.get_entry_path("S-3", ".htm", str(path)).is_file()
+    # sections arent extracted to store them, restored sections extract on access
+    assert any(s._text_only is None for f in created for s in f.sections)
+    unextracted = _create_s3_filing_with_cache(path, cache)
+    assert [s._text_only for f in unextracted for s in f.sections] == [s._text_only for f in created for s in f.sections]
+    for filing in created:
+        for section in filing.sections:
+            section.text_only
+    filing_factory.set_cache(cache)
+    try:
+        filing_factory.update_cache(created, "S-3", ".htm", str(path))
+    finally:
+        filing_factory.set_cache(None)
+    restored = _create_s3_filing_with_cache(path, cache)
+    assert len(restored) == len(created)
+    for new, old in zip(restored, created):
+        assert new._doc is None
+        assert [s.title for s in new.sections] == [s.title for s in old.sections]
+        for new_section, old_section in zip(new.sections, old.sections):
+            assert new_section._text_only == old_section.text_only
+            assert new_section.content == old_section.content
+            new_tables = [t["parsed_table"] for t in new_section.tables["extracted"]]
+            old_tables = [t["parsed_table"] for t in old_section.tables["extracted"]]
+            assert new_tables == old_tables
+        assert new._doc is None
+
+def test_parsed_filing_cache_invalidates_on_content_and_version_change(tmp_path):
+    source = _get_s3_corpus_paths()[0]
+    path = tmp_path / source.relative_to(source.parents[3])
+    path.parent.mkdir(parents=True)
+    path.write_bytes(source.read_bytes())
+    cache = ParsedFilingCache(tmp_path / "cache")
+    _create_s3_filing_with_cache(path, cache)
+    filing_kwargs = {"filing_date": None, "accession_number": "0", "cik": "0", "file_number": None}
+    assert cache.get("S-3", ".htm", str(path), **filing_kwargs) is not None
+    other_version = ParsedFilingCache(tmp_path / "cache", parser_version=cache.parser_version + 1)
+    assert other_version.get("S-3", ".htm", str(path), **filing_kwargs) is None
+    path.write_bytes(source.read_bytes() + b"<!-- changed -->")
+    assert cache.get("S-3", ".htm", str(path), **filing_kwargs) is None
+
+def test_toc_title_matcher_scans_strings_once():
+    parser = HTMFilingParser()
+    re_toc_titles = [parser._create_toc_re(t) for t in ["risk factors", "use of proceeds", "plan of distribution"]]
+    soup = make_soup_with_backend(
+        "<html><body><div id='toc'>toc</div><p>Use of  Proceeds</p><p>we will use the proceeds for</p>"
+        "<p>RISK FACTORS</p><p>a very long paragraph mentioning risk factors somewhere in it</p>"
+        "<p><b>Plan of Distribution</b></p></body></html>"
+    )
+    matcher = TOCTitleMatcher(re_toc_titles)
+    assert matcher.re_combined is not None
+    hits = list(matcher.iter_hits(soup.find("div"), min_distance=2))
+    assert [(ele.get_text(), title_idx) for ele, title_idx, _ in hits] == [
+        ("Use of  Proceeds", 1), ("RISK FACTORS", 0), ("Plan of Distribution", 2)
+    ]
+    assert [ele for ele, _, _ in hits] == parser._look_for_toc_matches_after(soup.find("div"), re_toc_titles, min_distance=2)
+    assert matcher.match_title("plan of  distribution") == 2
+    assert matcher.match_title("not a title") is None
+    # the group of the combined match tells the title, the single titles arent searched again
+    matcher.guarded_titles = [None] * len(re_toc_titles)
+    assert matcher.match_title("plan of  distribution") == 2
+    assert [(ele, title_idx) for ele, title_idx, _ in matcher.iter_hits(soup.find("div"), min_distance=2)] == [
+        (ele, title_idx) for ele, title_idx, _ in hits
+    ]
+
+def test_htm_style_scanner_selects_like_css_select():
+    soup = make_soup_with_backend(
+        "<html><body><p align='CENTER'><b>MAIN</b></p><div style='TEXT-ALIGN: center'><strong>sub</strong>"
+        "<span><strong>nested</strong></span></div><table><tr><td style='text-align:center'><font><b>cell</b></font>"
+        "</td></tr></table><b><u>underlined</u></b><p style='font-weight:700'>bold</p></body></html>"
+    )
+    selectors = [
+        "[align='center' i] b",
+        "[style*='text-align: center' i] > strong",
+        "td[style*='text-align:center' i] > font > b",
+        "b > u",
+        "[style*='font-weight:700']",
+    ]
+    selected = HTMStyleScanner(selectors).select(soup)
+    for selector in selectors:
+        assert selected[selector] == soup.select(selector)
+        assert len(selected[selector]) == 1
+    with pytest.raises(ValueError):
+        HTMStyleScanner(["b + u"])
+
+def test_document_index_resolves_anchors_like_find():
+    doc = HTMDocument.from_html(
+        "<html><body><a href='#second'>second</a><a href='#first'>first</a><p id='first'>one</p>"
+        "<a name='second'></a><p id='second'>two</p><p id='first'>duplicate</p></body></html>"
+    )
+    index = doc.index
+    assert index.get_anchor("first") is doc.soup.find(attrs={"id": "first"})
+    assert index.get_anchor("second") is doc.soup.find(attrs={"id": "second"})
+    assert index.get_anchor("second", attrs=("name", "id")) is doc.soup.find(True, {"name": "second"})
+    assert index.get_anchor("missing") is None
+    resolved = index.get_anchors(["second", "missing", "first"], attrs=("name", "id"))
+    assert [(n, t.name) for n, t in resolved] == [("first", "p"), ("second", "a")]
+
+def test_anchored_pattern_matches_like_pattern():
+    pattern = re.compile(r"(?:\d{1,2}(?:.){0,3})?ab(?:.){0,2}c", re.I | re.DOTALL)
+    anchored = AnchoredPattern(pattern, "ab")
+    text = "xx 12 AB-c aab..c 9ab ab ab"
+    assert anchored.max_width == 10
+    assert anchored.search(text).span() == pattern.search(text).span()
+    assert [m.span() for m in anchored.finditer(text)] == [m.span() for m in pattern.finditer(text)]
+    assert AnchoredPattern(re.compile("ab.*c"), "ab").max_width is None
+
+def test_8k_items_and_date_of_report_use_anchored_patterns():
+    parser = Parser8K()
+    filing = (
+        "FORM 8-K CURRENT REPORT Date of Report (Date of earliest event reported): March 3, 2021 "
+        + "filler text without items. " * 200
+        + "Item 1.01 Entry into a Material Definitive Agreement. we entered into an agreement. "
+        + "ITEM 9.01. Financial Statements and Exhibits. exhibit list. SIGNATURES the signature"
+    )
+    date = parser.get_date_of_report_matches(filing)
+    assert date.span() == COMPILED_DATE_OF_REPORT_PATTERN.search(filing).span()
+    assert [g for g in date.groups() if g is not None] == ["March 3, 2021"]
+    assert [m[2] for m in parser.get_item_matches(filing)] == [
+        m.group(0) for m in parser.match_groups.finditer(filing)
+    ]
+    items = parser._parse_items(filing)
+    assert [list(i.keys())[0] for i in items] == ["item101entryintoamaterialdefinitiveagreement", "item901financialstatementsandexhibits"]
+    with pytest.raises(ValueError):
+        parser.get_date_of_report_matches("no date in here")
+
+# inputs the parser patterns backtrack on for seconds without a budget
+ADVERSARIAL_REGEX_INPUTS = [
+    ("toc titles", "\n" * 30000),
+    ("toc titles", " \n" * 20000),
+    ("date of report", "date of report " * 30000),
+]
+
+def _match_adversarial_input(kind: str, text: str):
+    parser = Parser8K()
+    if kind == "toc titles":
+        soup = make_soup_with_backend("<html><body><p></p></body></html>", "lxml")
+        soup.find("p").string = text
+        parser._search_toc_match_in_list_of_tags(
+            soup.find_all("p"), [parser._create_toc_re("risk factors")]
+        )
+    else:
+        parser.get_date_of_report_matches(text)
+
+@pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="budgets need SIGALRM")
+@pytest.mark.parametrize(
+    "kind, text", ADVERSARIAL_REGEX_INPUTS, ids=[f"{kind}-{len(text)}" for kind, text in ADVERSARIAL_REGEX_INPUTS]
+)
+def test_regex_budget_bounds_adversarial_inputs(kind, text):
+    default_budget = get_default_budget()
+    set_default_budget(0.1)
+    try:
+        start = time.perf_counter()
+        with pytest.raises(RegexBudgetExceeded):
+            _match_adversarial_input(kind, text)
+        assert time.perf_counter() - start < 1
+    finally:
+        set_default_budget(default_budget)
+    # the timer is reset, later matches arent interrupted
+    assert signal.getitimer(signal.ITIMER_REAL)[0] == 0
+
+@pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="budgets need SIGALRM")
+def test_toc_title_budget_applies_per_search_not_per_walk():
+    parser = HTMFilingParser()
+    soup = make_soup_with_backend(
+        "<html><body><div id='toc'>toc</div>" + "<p>some paragraph</p>" * 5000 + "<p>Risk Factors</p></body></html>"
+    )
+    re_toc_titles = [parser._create_toc_re(t) for t in ["risk factors", "use of proceeds"]]
+    default_budget = get_default_budget()
+    set_default_budget(0.01)
+    try:
+        start = time.perf_counter()
+        matches = parser._look_for_toc_matches_after(soup.find("div"), re_toc_titles)
+        # the walk takes longer than the budget but none of its searches does
+        assert time.perf_counter() - start > 0.01
+        assert [m.get_text() for m in matches] == ["Risk Factors"]
+        assert parser._search_toc_match_in_list_of_tags(soup.find_all("p")[-1:], re_toc_titles) != []
+    finally:
+        set_default_budget(default_budget)
+    assert signal.getitimer(signal.ITIMER_REAL)[0] == 0
+
+@pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="budgets need SIGALRM")
+def test_guarded_pattern_matches_like_pattern_within_budget():
+    pattern = re.compile(r"(a+)+b")
+    guarded = GuardedPattern(pattern, "nested quantifier", budget=0.1)
+    assert guarded.search("xaab").span() == pattern.search("xaab").span()
+    assert [m.span() for m in guarded.finditer("ab aab b")] == [(0, 2), (3, 6)]
+    with pytest.raises(RegexBudgetExceeded) as e:
+        guarded.search("a" * 40)
+    assert e.value.description == "nested quantifier"
+
+def _create_filing_with_memory_ceiling(path: Path, form_type: str, max_filing_memory: int):
+    filing_factory.set_max_filing_memory(max_filing_memory)
+    try:
+        return filing_factory.create_filing(
+            path=str(path),
+            filing_date=None,
+            accession_number=path.parents[0].name,
+            cik=path.parents[2].name,
+            file_number=None,
+            form_type=form_type,
+            extension=".htm"
+        )
+    finally:
+        filing_factory.set_max_filing_memory(None)
+
+def test_filing_over_memory_ceiling_is_streamed_by_toc_links():
+    path = Path(_get_absolute_path(s3_rel_path))
+    # S-1 filings are split by the toc of the base parser and can be streamed
+    parsed = _create_filing_with_memory_ceiling(path, "S-1", None)
+    streamed = _create_filing_with_memory_ceiling(path, "S-1", estimate_parse_memory(path) // 2)
+    assert parsed._doc is not None
+    assert streamed._doc is None
+    assert all(isinstance(s, StreamedHTMFilingSection) for s in streamed.sections)
+    parsed_titles = [s.title for s in parsed.sections]
+    streamed_titles = [s.title for s in streamed.sections]
+    # the front, cover page and toc of the tree based split are the front page section
+    assert streamed_titles[0] == "front page"
+    assert streamed_titles[1:] == parsed_titles[parsed_titles.index(streamed_titles[1]):]
+    parsed_risk_factors = parsed.get_section("risk factors")
+    streamed_risk_factors = streamed.get_section("risk factors")
+    assert streamed_risk_factors.text_only[:500] == parsed_risk_factors.text_only[:500]
+    assert streamed_risk_factors._soup is None
+    with HTMFileStream(path) as stream:
+        assert "RISK FACTORS" in stream.read(streamed_risk_factors.start, streamed_risk_factors.end)
+
+def test_toc_sections_of_stream_resolve_toc_links_in_one_scan(monkeypatch):
+    path = Path(_get_absolute_path(s3_rel_path))
+    scans = []
+
+    class CountingPattern:
+        def finditer(self, buffer):
+            scans.append(buffer)
+            return RE_ANCHOR_ATTRIBUTE.finditer(buffer)
+
+    monkeypatch.setattr(htm_stream, "RE_ANCHOR_ATTRIBUTE", CountingPattern())
+    with HTMFileStream(path) as stream:
+        sections = stream.find_toc_sections()
+    assert len(sections) > 5
+    # one scan for the target of a toc header link and one for all the toc links
+    assert len(scans) <= 2
+
+def test_filing_over_memory_ceiling_is_parsed_whole_if_it_cant_be_streamed(tmp_path):
+    path = Path(_get_absolute_path(s3_rel_path))
+    # the S-3 builder splits multiprospectus filings and needs the cover pages
+    filings = _create_filing_with_memory_ceiling(path, "S-3", 1)
+    filings = filings if isinstance(filings, list) else [filings]
+    assert all(not isinstance(s, StreamedHTMFilingSection) for f in filings for s in f.sections)
+    assert any(s.title == "cover page 0" for s in filings[0].sections)
+    no_toc_path = tmp_path / "0000000000" / "S-1" / "0000000000-00-000000" / "filing.htm"
+    no_toc_path.parent.mkdir(parents=True)
+    no_toc_path.write_text(
+        "<html><body><p align='center'><b>PROSPECTUS SUMMARY</b></p><p>We are a company.</p>"
+        "<p align='center'><b>RISK FACTORS</b></p><p>Investing is risky.</p></body></html>"
+    )
+    filing = _create_filing_with_memory_ceiling(no_toc_path, "S-1", 1)
+    assert filing.sections != []
+    assert all(not isinstance(s, StreamedHTMFilingSection) for s in filing.sections)
+
+def test_parsed_filing_cache_keeps_streamed_sections_streamed(tmp_path):
+    path = Path(_get_absolute_path(s3_rel_path))
+    cache = ParsedFilingCache(tmp_path / "cache")
+    max_filing_memory = estimate_parse_memory(path) // 2
+    filing_factory.set_cache(cache)
+    try:
+        streamed = _create_filing_with_memory_ceiling(path, "S-1", max_filing_memory)
+        risk_factors = streamed.get_section("risk factors").text_only
+        filing_factory.update_cache(streamed, "S-1", ".htm", str(path))
+        restored = _create_filing_with_memory_ceiling(path, "S-1", max_filing_memory)
+    finally:
+        filing_factory.set_cache(None)
+    # the entry holds the offsets of the sections, not their content
+    assert cache.get_entry_path("S-1", ".htm", str(path)).stat().st_size < path.stat().st_size // 4
+    assert all(isinstance(s, StreamedHTMFilingSection) for s in restored.sections)
+    assert [(s.title, s.start, s.end, s.max_memory) for s in restored.sections] == [
+        (s.title, s.start, s.end, s.max_memory) for s in streamed.sections
+    ]
+    restored_risk_factors = restored.get_section("risk factors")
+    assert restored_risk_factors._text_only == risk_factors
+    assert restored_risk_factors._soup is None
+    assert restored.get_section("front page")._text_only is None
+
+def test_streamed_section_over_memory_ceiling_raises():
+    path = Path(_get_absolute_path(s3_rel_path))
+    with HTMFileStream(path) as stream:
+        title, start, end = stream.find_toc_sections()[0]
+    section = StreamedHTMFilingSection(
+        title=title, path=str(path), start=start, end=end, extension=".htm", form_type="S-3", max_memory=end - start
+    )
+    assert section.content.startswith("<")
+    with pytest.raises(ValueError):
+        section.text_only
+
+def test_multiprospectus_filings_are_views_over_shared_sections():
+    path = Path(_get_absolute_path(r"test_resources\filings\0000831547\S-3\000083154720000018\cleans-3.htm"))
+    filings = _create_s3_filing_with_cache(path, None)
+    assert len(filings) == 2
+    base, other = filings
+    assert base.doc is other.doc
+    assert base._sections is other._sections
+    assert base.section_range == (0, other.section_range[0])
+    assert other.section_range[1] == len(other._sections)
+    assert other.sections[0].title == "cover page 1"
+    assert other.get_section("cover page 1") is other._sections[other.section_range[0]]
+    assert base.get_section("cover page 1") == []
+    # the soups are the parts of the shared tree the sections of each filing span
+    assert base.soup.start is base.sections[0].document_range.start
+    assert base.soup.stop is other.soup.start
+    assert other.soup.stop is None
+    assert base.get_text_only() == " ".join(s.text_only for s in base.sections)
+    base_text = base.get_preprocessed_text_content()
+    other_text = other.get_preprocessed_text_content()
+    # only the head of the document before the front page isnt part of the filings
+    assert base.parser.preprocess_text(str(base.doc)).endswith(base_text + other_text)
+
+def test_section_index_matches_linear_lookup():
+    path = Path(_get_absolute_path(s3_rel_path))
+    filing = _create_s3_filing_with_cache(path, None)[0]
+    titles = [s.title for s in filing.sections]
+    for role, pattern in SECTION_ROLES.items():
+        expected = [s for s in filing.sections if pattern.search(s.title)]
+        assert filing.has_section(role) == (expected != [])
+        assert filing.get_section_by_role(role) == (expected[0] if expected else [])
+        assert all(role in s.roles for s in expected)
+    assert filing.has_section("cover_page")
+    for title in titles:
+        assert filing.get_section(title) is filing.sections[titles.index(title)]
+    pattern = re.compile(r"description\s*of", re.I)
+    assert filing.get_sections(pattern) == [s for s in filing.sections if pattern.search(s.title)]
+    assert filing.section_index.search(pattern) is filing.section_index.search(pattern)
+    assert filing.get_section(0) is filing.sections[0]
+    with pytest.raises(ValueError):
+        filing.has_section("not a role")
+
+def test_effect_records_match_ParserEFFECT(tmp_path):
+    path = _get_absolute_path(effect_xml)
+    doc = ParserEFFECT().get_doc(path)
+    expected = ParserEFFECT().split_into_sections(doc)[0].content_dict
+    record = read_effect_record(path)
+    assert record.accession_number == "999999999522002596"
+    assert {k: getattr(record, k) for k in expected.keys()} == expected
+    # without a form the submissionType of effectiveData is the form, not the one of the submission
+    no_form = tmp_path / "000000000000000001" / "primary_doc.xml"
+    no_form.parent.mkdir()
+    no_form.write_text(
+        Path(path).read_text().replace("<form>S-1</form>", "<submissionType>S-3</submissionType>")
+    )
+    no_cik = tmp_path / "000000000000000002" / "primary_doc.xml"
+    no_cik.parent.mkdir()
+    no_cik.write_text(Path(path).read_text().replace("<cik>0001309082</cik>", ""))
+    records = list(iter_effect_records([path, str(no_form), str(no_cik)]))
+    assert [r.for_form for r in records] == ["S-1", "S-3"]
+    assert ParserEFFECT().split_into_sections(ParserEFFECT().get_doc(str(no_cik))) == []
+
+def test_parser_factory_shares_stateless_parsers():
+    parser = parser_factory.get_parser(extension=".htm", form_type="8-K")
+    assert parser is parser_factory.get_parser(extension=".htm", form_type="8-K")
+    assert parser is not parser_factory.get_parser(extension=".htm", form_type="8-K", backend="html5-parser")
+    # the patterns are compiled once per class, not per instance
+    assert Parser8K().match_groups is parser.match_groups
+    sc13d = parser_factory.get_parser(extension=".htm", form_type="SC 13D")
+    sc13g = parser_factory.get_parser(extension=".htm", form_type="SC 13G")
+    assert sc13d.match_groups is not sc13g.match_groups
+    assert sc13g.guarded_match_groups.description == "ITEMS_SC13G"
+    # elements created while parsing a document belong to its ParseContext
+    html = parser_factory.get_parser(extension=".htm")
+    first = html._make_reintegrate_html_of_table("one_row_table", [["a"]], ParseContext("lxml"))
+    second = html._make_reintegrate_html_of_table("one_row_table", [["a"]], ParseContext("lxml"))
+    assert str(first) == str(second) == "<p><span>a\t</span></p>"
+    assert first is not second
+
+def test_extract_tables_parses_one_empty_soup_per_call(monkeypatch):
+    import main.parser.parsers as parsers_module
+    empty_soup_parses = []
+    make_soup = parsers_module.make_soup_with_backend
+    def counting_make_soup(content, *args, **kwargs):
+        if content == "":
+            empty_soup_parses.append(content)
+        return make_soup(content, *args, **kwargs)
+    monkeypatch.setattr(parsers_module, "make_soup_with_backend", counting_make_soup)
+    html = (
+        "<html><body><table><tr><td>one</td><td>row</td></tr></table><p>text</p>"
+        "<table><tr><td>\u25cf</td><td>first</td></tr><tr><td>\u25cf</td><td>second</td></tr></table>"
+        "<table><tr><td>another</td><td>row</td></tr></table></body></html>"
+    )
+    for form_type in [None, "8-K", "SC 13D", "SC 13G"]:
+        parser = parser_factory.get_parser(extension=".htm", form_type=form_type)
+        soup = make_soup(html)
+        empty_soup_parses.clear()
+        tables = parser.extract_tables(soup)
+        assert len(tables["reintegrated"]) >= 2, form_type
+        assert len(empty_soup_parses) == 1, form_type
+
+def test_table_classifier_rules():
+    parser = parser_factory.get_parser(extension=".htm", form_type="S-3")
+    base = parser_factory.get_parser(extension=".htm")
+    registration_table = [
+        ["", None, ""],
+        ["Title of Each Class of Securities to be Registered", "Amount to be Registered", "Amount of Registration Fee"],
+        ["Common Stock", "$100,000,000", "$12,120"],
+    ]
+    toc = [
+        ["", "Page"],
+        ["About this Prospectus", "1"],
+        ["Use of Proceeds", "5"],
+        ["Plan of Distribution", "SA-12"],
+    ]
+    bullets = [["\u25cf", "first point"], ["", "second point"]]
+    assert parser.classify_table(registration_table) == "registration_table"
+    assert parser.classify_table(toc) == "toc"
+    assert parser.classify_table(toc[:3]) == "unclassified"
+    assert parser.classify_table([toc[1] + ["Summary"], toc[2] + ["6"], toc[3] + ["7"]]) == "unclassified"
+    assert parser.classify_table([["a", "b", "c"]]) == "one_row_table"
+    assert parser.classify_table(bullets) == base.classify_table(bullets) == "ul_bullet_points"
+    assert base.classify_table(registration_table) == base.classify_table(toc) == "unclassified"
+    assert base.classify_table([]) == "empty"
+    features = parser.table_classifier.extractor.extract(registration_table)
+    assert (features.n_rows, features.n_cols, features.header_row, features.header_hits) == (3, 3, 1, 3)
+    assert features.column_max_lengths == [50, 23, 26]
+
+def test_filing_doc_slices_section_docs():
+    path = Path(_get_absolute_path(s3_rel_path))
+    filing = _create_s3_filing_with_cache(path, None)[0]
+    nlp = spacy.blank("en")
+    filing_doc = FilingDoc(nlp, filing)
+    assert filing_doc.text == filing.get_text_only()
+    for section in filing.sections:
+        section_doc = filing_doc.get_section_doc(section)
+        assert section_doc.text.rstrip() == section.text_only.rstrip()
+        assert [t.text for t in section_doc] == [t.text for t in nlp(section.text_only)]
+    cover_page = filing.get_section_by_role("cover_page")
+    assert filing_doc.get_section_doc(cover_page) is filing_doc.get_section_doc(cover_page)
+    with pytest.raises(ValueError):
+        filing_doc.get_section_doc(_create_s3_filing_with_cache(path, None)[0].sections[0])
+    # span groups are restricted to the slice and shifted to its tokens
+    doc = nlp('Common Stock (the "Shares") and Warrants')
+    doc.spans["SECU"] = [doc[0:2], doc[9:10]]
+    sliced = get_doc_slice(doc, 29, 40)
+    assert [s.text for s in sliced.spans["SECU"]] == ["Warrants"]
+    assert get_doc_slice(doc, 5, 5).text == ""
+
+def test_nlp_batch_hands_docs_to_callbacks():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    texts = ["This prospectus relates to shares. Second sentence.", "Other text.", "This prospectus relates to shares. Second sentence."]
+    for n_process in [1, 2]:
+        batch = NLPBatch(nlp, batch_size=2, n_process=n_process, main_process_from="sentencizer")
+        docs = []
+        for idx, text in enumerate(texts):
+            assert batch.add(text, lambda doc, idx: docs.append(doc) or (idx, len(list(doc.sents))), idx) == idx
+        assert batch.run() == [(0, 2), (1, 1), (2, 2)]
+        assert [doc.text for doc in docs] == texts
+        # the same text is processed once
+        assert docs[0] is docs[2]
+        assert len(batch) == 0
+    with pytest.raises(ValueError):
+        NLPBatch(nlp, n_process=0)
+
+def test_doc_cache_restores_spans_and_extensions(tmp_path):
+    set_SECUMatcher_extensions()
+    nlp = spacy.blank("en")
+    cache = DocCache(tmp_path)
+    text = 'Common Stock (the "Shares") and Warrants'
+    assert cache.get(text, nlp) is None
+    doc = nlp(text)
+    doc.ents = [doc.char_span(0, 12, label="SECU")]
+    doc.spans["SECU"] = [doc[0:2], doc[9:10]]
+    doc.spans["alias"] = [doc[5:6]]
+    doc._.alias_list = ["Shares"]
+    doc._.tokens_to_alias_map = {5: doc[5:6]}
+    doc[0]._.source_span_unmerged = (doc[0], doc[1])
+    doc[0]._.was_merged = True
+    assert cache.put(text, doc, nlp)
+    cached = cache.get(text, nlp)
+    assert cached.text == text
+    assert [(e.text, e.label_) for e in cached.ents] == [("Common Stock", "SECU")]
+    assert {k: [s.text for s in v] for k, v in cached.spans.items()} == {"SECU": ["Common Stock", "Warrants"], "alias": ["Shares"]}
+    assert cached._.alias_list == ["Shares"]
+    assert cached._.tokens_to_alias_map[5].text == "Shares"
+    assert [t.text for t in cached[0]._.source_span_unmerged] == ["Common", "Stock"]
+    assert cached[0]._.was_merged is True
+    # entries of another pipeline version arent read
+    assert DocCache(tmp_path, pipeline_version=-1).get(text, nlp) is None
+    assert cache.get_or_process(text + ".", nlp).text == text + "."
+    assert cache.get(text + ".", nlp) is not None
+
+def test_doc_cache_restores_tokens_of_merged_secus(tmp_path):
+    set_SECUMatcher_extensions()
+    nlp = spacy.blank("en")
+    cache = DocCache(tmp_path)
+    text = "We are offering Series A Preferred Stock and Series B Preferred Stock."
+    doc = nlp(text)
+    for token in doc:
+        token.lemma_ = token.text
+    doc.ents = [doc.char_span(16, 40, label="SECU"), doc.char_span(45, 69, label="SECU")]
+    # the source tokens of the merged SECUs are tokens of ent.as_doc slices
+    doc = retokenize_SECU(doc)
+    merged = [t for t in doc if t._.was_merged]
+    assert [t.text for t in merged] == ["Series A Preferred Stock", "Series B Preferred Stock"]
+    assert cache.put(text, doc, nlp)
+    cached = cache.get(text, nlp)
+    for token, cached_token in zip(merged, [t for t in cached if t._.was_merged]):
+        assert [t.text for t in cached_token._.source_span_unmerged] == [t.text for t in token._.source_span_unmerged]
+        assert get_secu_key(cached_token) == get_secu_key(token)
+    assert get_secu_key(cached[3]) == "series a preferred stock"
+
+def test_pipeline_profiles_select_components():
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer", name="senter")
+    nlp.disable_pipe("senter")
+    ruler = nlp.add_pipe("entity_ruler", name="ner")
+    ruler.add_patterns([{"label": "SECU", "pattern": "Warrants"}])
+    text = "We offer Warrants. They expire."
+    with select_pipeline_profile(nlp, "classify") as classify_nlp:
+        assert classify_nlp.pipe_names == ["senter"]
+        doc = classify_nlp(text)
+    assert len(list(doc.sents)) == 2
+    assert doc.ents == ()
+    # the components are restored after the call
+    assert nlp.pipe_names == ["ner"] and nlp.disabled == ["senter"]
+    with select_pipeline_profile(nlp, "full") as full_nlp:
+        assert [e.text for e in full_nlp(text).ents] == ["Warrants"]
+    with pytest.raises(ValueError):
+        with select_pipeline_profile(nlp, "not a profile"):
+            pass
+
+def test_sentence_prefilter_maps_offsets_back():
+    text = "Risk is high. We sold 100 shares of Common Stock. The weather was nice.\nOur warrants expire."
+    prefiltered = SentencePrefilter(context=0).filter(text)
+    assert prefiltered.text == "We sold 100 shares of Common Stock.\n\nOur warrants expire."
+    start = prefiltered.text.index("warrants")
+    original_start, original_end = prefiltered.to_original_span(start, start + len("warrants"))
+    assert text[original_start:original_end] == "warrants"
+    # with context the sentences between the hits are kept as one segment
+    assert SentencePrefilter(context=1).filter(text).text == text
+
+def test_sentence_prefilter_recall_on_training_set():
+    # the annotated securities of the 8-K item 8.01 training set are all kept
+    result = get_prefilter_recall(SentencePrefilter())
+    assert result["recall"] == {"Security": 1.0, "securityAmount": 1.0}
+    assert result["kept"] < 0.8
+
+def _get_benchmark_tables(n_rows: int) -> list[list[list]]:
+    registration = [["Title of Each Class of Securities to be Registered", "Amount to be Registered", "Proposed Maximum Offering Price Per Unit", "Amount of Registration Fee"]]
+    registration += [["Common Stock", "1,000,000", "$1.00", "$100"]] * (n_rows - 1)
+    toc = [["Risk Factors", "5"], ["Use of Proceeds", "9"], ["Plan of Distribution", "12"]]
+    toc += [["Description of Capital Stock", str(page)] for page in range(n_rows - 3)]
+    bullets = [["\u25cf", "a bullet point of the prospectus"]] * n_rows
+    unclassified = [[f"field {row} {col}" for col in range(4)] for row in range(n_rows)]
+    return [registration, toc, bullets, unclassified] * 50
+
+def test_table_classifier_throughput_is_linear_in_fields():
+    classifier = ParserS3.table_classifier
+    assert [classifier.classify(t) for t in _get_benchmark_tables(10)[:4]] == ["registration_table", "toc", "ul_bullet_points", "unclassified"]
+    small = measure_throughput(classifier, _get_benchmark_tables(10))
+    large = measure_throughput(classifier, _get_benchmark_tables(160))
+    assert small["tables_per_second"] > large["tables_per_second"] > 0
+    # 16 times the fields per table, a quadratic cost would drop to 1/16 of the field throughput
+    assert large["fields_per_second"] > small["fields_per_second"] / 4
+
 # def test_get_for_form_xml():
 #     parser = ParserEFFECT()
     